@@ -0,0 +1,99 @@
+"""
+Analytics benchmark.
+
+Compares computing the streaks and the streak length distribution of all habits with the vectorized
+analytics module against a pure-Python loop over the check-offs of every habit, both reading the same history.
+
+Run from the repository root:
+    python -m benchmarks.bench_analytics --habits 20000 --days 500
+"""
+import argparse
+import collections
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from src import analytics
+from src.tracker import HabitTracker
+
+HISTORY_QUERY = """SELECT check_off_table.habit_id, day_key, periodicity = 'weekly'
+                   FROM check_off_table JOIN habits_table ON habits_table.habit_id = check_off_table.habit_id
+                   ORDER BY check_off_table.habit_id, day_key"""
+
+
+def python_streaks(conn):
+    """
+    The per-habit loop analytics replaces.
+    :return: A tuple ({habit_id: (current_streak, longest_streak)}, Counter of streak lengths).
+    """
+    streaks = {}
+    distribution = collections.Counter()
+    habit_id = previous = None
+    current = longest = 0
+    for row_habit_id, day, weekly in conn.execute(HISTORY_QUERY):
+        period = (day + analytics.EPOCH_WEEKDAY) // 7 if weekly else day
+        if row_habit_id != habit_id:
+            if habit_id is not None:
+                distribution[current] += 1
+                streaks[habit_id] = (current, longest)
+            habit_id, previous, current, longest = row_habit_id, period, 1, 1
+            continue
+        if period == previous:
+            continue
+        if period == previous + 1:
+            current += 1
+        else:
+            distribution[current] += 1
+            current = 1
+        previous = period
+        longest = max(longest, current)
+    if habit_id is not None:
+        distribution[current] += 1
+        streaks[habit_id] = (current, longest)
+    return streaks, distribution
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics benchmark")
+    parser.add_argument("--habits", type=int, default=20000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=500, help="Days of check-off history of every habit")
+    parser.add_argument("--completion", type=float, default=0.9, help="Probability of a check-off on a day")
+    arguments = parser.parse_args()
+
+    rng = random.Random(0)
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=day)).isoformat() for day in range(arguments.days)]
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), 'weekly' if number % 5 == 0 else 'daily')
+                                  for number in range(arguments.habits)))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1)
+                                  for date in dates if rng.random() < arguments.completion))
+        tracker.conn.commit()
+        rows = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+
+        started = time.perf_counter()
+        history = analytics.CheckOffHistory.load(tracker.conn)
+        loaded = time.perf_counter()
+        habit_ids, current, longest = analytics.streaks(history)
+        distribution = analytics.streak_length_distribution(history)
+        vectorized = time.perf_counter()
+
+        expected_streaks, expected_distribution = python_streaks(tracker.conn)
+        python = time.perf_counter() - vectorized
+        tracker.conn.close()
+
+    assert expected_streaks == dict(zip(habit_ids.tolist(), zip(current.tolist(), longest.tolist())))
+    assert expected_distribution == {length: count for length, count in enumerate(distribution.tolist()) if count}
+    print("habits: {}, check-offs: {}".format(arguments.habits, rows))
+    print("vectorized: {:.2f} s ({:.2f} s loading, {:.2f} s computing)".format(
+        vectorized - started, loaded - started, vectorized - loaded))
+    print("python loop: {:.2f} s, {:.1f}x slower".format(python, python / (vectorized - started)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Check-off archive benchmark.
+
+Fills a database with daily habits checked-off on most days for a year or more, then archives the check-offs
+older than the retention period into one bitmask per habit and month. Prints the bytes the check-offs take in the
+check-off table and its index before and after, the bytes of the archive, and the time of recompute_streaks over
+the whole history in both layouts.
+
+Run from the repository root:
+    python -m benchmarks.bench_archive --habits 10000 --days 730 --retention-days 90
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+TABLES = ('check_off_table', 'check_off_habit_period_idx', 'check_off_archive')
+
+
+def table_bytes(conn):
+    """
+    :return: A dictionary with the bytes of the pages of the check-off table, its index and the archive.
+    """
+    sizes = dict(conn.execute('SELECT name, SUM(pgsize) FROM dbstat WHERE name IN ({}) GROUP BY name'.format(
+        ','.join('?' * len(TABLES))), TABLES))
+    return {name: sizes.get(name, 0) for name in TABLES}
+
+
+def timed(function, *args):
+    started = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check-off archive benchmark")
+    parser.add_argument("--habits", type=int, default=10000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=730, help="Amount of days of history")
+    parser.add_argument("--completion", type=float, default=0.8, help="Share of the days a habit is checked-off")
+    parser.add_argument("--retention-days", type=int, default=90, help="Days of check-offs kept unarchived")
+    arguments = parser.parse_args()
+
+    today = datetime.date(2024, 1, 1)
+    start = today - datetime.timedelta(days=arguments.days)
+    dates = [(start + datetime.timedelta(days=day)).isoformat() for day in range(arguments.days)]
+    generator = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        tracker = HabitTracker(path, clock=SimulatedClock(today))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), 'daily') for number in range(arguments.habits)))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates
+                                  if generator.random() < arguments.completion))
+        tracker.conn.commit()
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        _, recompute_before = timed(tracker.recompute_streaks)
+        before = table_bytes(tracker.conn)
+
+        archived, archive_seconds = timed(tracker.archive, arguments.retention_days)
+        compacted, compact_seconds = timed(tracker.compact)
+        after = table_bytes(tracker.conn)
+        _, recompute_after = timed(tracker.recompute_streaks)
+        tracker.conn.close()
+
+    history_before = before['check_off_table'] + before['check_off_habit_period_idx']
+    hot_after = after['check_off_table'] + after['check_off_habit_period_idx']
+    archived_share = archived['check_offs'] / check_offs
+    print("habits: {}, check-offs: {}, archived: {} ({:.0%}) into {} masks".format(
+        arguments.habits, check_offs, archived['check_offs'], archived_share, archived['masks']))
+    print("archive: {:.2f} s, compact: {:.2f} s, freed {} pages".format(
+        archive_seconds, compact_seconds, compacted['freed_pages']))
+    print("check-off table and index: {:.1f} MB -> {:.1f} MB, archive: {:.2f} MB".format(
+        history_before / 1e6, hot_after / 1e6, after['check_off_archive'] / 1e6))
+    print("bytes per archived check-off: {:.1f} -> {:.2f}, {:.0f}x smaller".format(
+        history_before / check_offs, after['check_off_archive'] / archived['check_offs'],
+        history_before / check_offs / (after['check_off_archive'] / archived['check_offs'])))
+    print("recompute_streaks: {:.2f} s -> {:.2f} s".format(recompute_before, recompute_after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+asyncio benchmark of AsyncHabitTracker against the blocking HabitTracker.
+
+Every simulated day, one coroutine per habit checks its habit off concurrently. With HabitTracker the
+coroutines call the blocking check_off on the event loop, one commit each; with AsyncHabitTracker the work
+runs on its worker thread and concurrent check-offs share commits. A ticker coroutine measures how long
+the event loop is stalled, which is the latency every other request of the service would see.
+
+Run from the repository root:
+    python -m benchmarks.bench_async --coroutines 1000 --days 10
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import tempfile
+import time
+
+from src.async_tracker import AsyncHabitTracker
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+
+async def measure_lag(stop, lags):
+    """
+    Sleeps 1 ms at a time until stopped and records how late the event loop woke it up.
+    :param stop: asyncio.Event ending the measurement.
+    :param lags: A list the lags in seconds are appended to.
+    :return: None
+    """
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.001)
+        lags.append(time.perf_counter() - started - 0.001)
+
+
+async def run(check_off, clock, names, days):
+    """
+    Checks-off every habit once a day, with one coroutine per habit.
+    :param check_off: Coroutine function checking-off a habit by name.
+    :param clock: The SimulatedClock of the tracker.
+    :param names: The names of the habits.
+    :param days: The amount of days to simulate.
+    :return: A tuple with the elapsed seconds and the lags of the event loop.
+    """
+    stop = asyncio.Event()
+    lags = []
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    started = time.perf_counter()
+    for _ in range(days):
+        await asyncio.gather(*(check_off(name) for name in names))
+        clock.advance()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return elapsed, lags
+
+
+def report(label, check_offs, elapsed, lags):
+    lags = sorted(lags) or [0.0]
+    print("{:<18} check-offs/sec: {:>8.0f}, loop lag p50: {:>7.2f} ms, max: {:>8.2f} ms".format(
+        label, check_offs / elapsed, lags[len(lags) // 2] * 1000, lags[-1] * 1000))
+
+
+def add_habits(conn, names):
+    conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                     ((name, 'daily') for name in names))
+    conn.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="AsyncHabitTracker benchmark")
+    parser.add_argument("--coroutines", type=int, default=1000, help="Concurrent coroutines, one habit each")
+    parser.add_argument("--days", type=int, default=10, help="Amount of days to check-off")
+    arguments = parser.parse_args()
+
+    names = ['habit-{}'.format(number) for number in range(arguments.coroutines)]
+    check_offs = arguments.coroutines * arguments.days
+    start = datetime.date.today() - datetime.timedelta(days=arguments.days)
+    with tempfile.TemporaryDirectory() as directory:
+        clock = SimulatedClock(start)
+        tracker = HabitTracker(os.path.join(directory, 'sync.db'), clock=clock)
+        add_habits(tracker.conn, names)
+
+        async def blocking_check_off(name):
+            tracker.check_off(name)
+
+        sync_result = await run(blocking_check_off, clock, names, arguments.days)
+        tracker.conn.close()
+
+        clock = SimulatedClock(start)
+        async_tracker = AsyncHabitTracker(os.path.join(directory, 'async.db'), clock=clock)
+        # the connection belongs to the worker thread of the tracker
+        await asyncio.get_running_loop().run_in_executor(async_tracker.executor, add_habits,
+                                                         async_tracker.tracker.conn, names)
+        async_result = await run(async_tracker.check_off, clock, names, arguments.days)
+        group_commits = async_tracker.group_commits
+        await async_tracker.close()
+
+    print("coroutines: {}, check-offs: {}".format(arguments.coroutines, check_offs))
+    report("HabitTracker", check_offs, *sync_result)
+    report("AsyncHabitTracker", check_offs, *async_result)
+    print("group commits: {}, check-offs per commit: {:.0f}".format(group_commits, check_offs / group_commits))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
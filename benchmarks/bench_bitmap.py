@@ -0,0 +1,82 @@
+"""
+Bitmap history engine benchmark.
+
+Times the completion queries, count_check_offs over the last 90 days, get_streak_at and get_completed_habits over a
+month, and check_off itself with the table history engine, which reads the check-off rows, and with the bitmap
+engine, which reads the words of the bitsets of the habits. Every check-off keeps the bitsets with either engine,
+so both check_off timings include their upsert. Also prints the time rebuild_bitmaps takes over the whole history.
+
+Run from the repository root:
+    python -m benchmarks.bench_bitmap --habits 10000 --days 730
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+
+def median_us(function, arguments):
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(*argument)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bitmap history engine benchmark")
+    parser.add_argument("--habits", type=int, default=10000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=730, help="Amount of days of history")
+    parser.add_argument("--completion", type=float, default=0.9, help="Share of the days a habit is checked-off")
+    parser.add_argument("--samples", type=int, default=1000, help="Amount of timed calls per query")
+    arguments = parser.parse_args()
+
+    today = datetime.date(2024, 1, 1)
+    start = today - datetime.timedelta(days=arguments.days)
+    dates = [(start + datetime.timedelta(days=day)).isoformat() for day in range(arguments.days)]
+    names = ['habit-{}'.format(number) for number in range(arguments.habits)]
+    generator = random.Random(0)
+    samples = [(generator.choice(names),) for _ in range(arguments.samples)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        tracker = HabitTracker(path)
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 ((name, 'weekly' if number % 4 == 0 else 'daily')
+                                  for number, name in enumerate(names)))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates
+                                  if generator.random() < arguments.completion))
+        tracker.conn.commit()
+        tracker.rebuild_stats()
+        started = time.perf_counter()
+        tracker.rebuild_bitmaps()
+        print("bitsets built from the history in {:.2f} s".format(time.perf_counter() - started))
+        tracker.conn.close()
+
+        print("{:>8} {:>12} {:>12} {:>16} {:>14}".format(
+            'engine', 'count us', 'streak us', 'completed ms', 'check-off us'))
+
+        for number, engine in enumerate(('table', 'bitmap')):
+            clock = SimulatedClock(today + datetime.timedelta(days=number))
+            tracker = HabitTracker(path, clock=clock, history_engine=engine)
+            since = clock() - datetime.timedelta(days=89)
+            count = median_us(lambda name: tracker.count_check_offs(name, since), samples)
+            streak = median_us(tracker.get_streak_at, samples)
+            started = time.perf_counter()
+            tracker.get_completed_habits(datetime.date(2023, 12, 1), datetime.date(2023, 12, 31))
+            completed = (time.perf_counter() - started) * 1e3
+            check_off = median_us(tracker.check_off, [(name,) for name in names[:arguments.samples]])
+            print("{:>8} {:>12.1f} {:>12.1f} {:>16.1f} {:>14.1f}".format(
+                engine, count, streak, completed, check_off))
+            tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
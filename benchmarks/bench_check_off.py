@@ -0,0 +1,77 @@
+"""
+Check-off latency benchmark.
+
+Fills a temporary database with check-off history of growing size and measures how long a single
+check-off takes on every scale. With the (habit_id, date) index the latency should stay flat.
+The statement and commit (fsync) counts of a check-off are reported next to the latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_check_off --sizes 10000 100000 1000000 10000000
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from src.tracker import HabitTracker
+
+HABITS = 1000
+
+
+def fill_history(tracker, rows):
+    """
+    Adds HABITS daily habits and spreads the requested amount of check-offs between them.
+    Every habit is checked-off on consecutive days that end yesterday, so the next check-off extends the streak.
+    :param tracker: HabitTracker to fill.
+    :param rows: Total amount of check-off rows to insert.
+    :return: A list with the names of the created habits.
+    """
+    names = ['habit-{}'.format(number) for number in range(HABITS)]
+    tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                             ((name, 'daily') for name in names))
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    per_habit = max(rows // HABITS, 1)
+    dates = [(yesterday - datetime.timedelta(days=day)).isoformat() for day in range(per_habit)]
+    tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                             ((habit_id, date) for habit_id in range(1, HABITS + 1) for date in dates))
+    tracker.conn.commit()
+    return names
+
+
+def measure(rows):
+    """
+    Measures check-off latency on a fresh database with the given amount of history rows.
+    :param rows: Total amount of check-off rows.
+    :return: A tuple with the median and the 99th percentile latency in microseconds
+             and the statement and commit counts of the last check-off.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'), count_statements=True)
+        names = fill_history(tracker, rows)
+        timings = []
+        for name in names:
+            started = time.perf_counter()
+            tracker.check_off(name)
+            timings.append((time.perf_counter() - started) * 1e6)
+        tracker.conn.close()
+    timings.sort()
+    stats = tracker.last_check_off_stats
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1], stats['statements'], stats['commits']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check-off latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000],
+                        help="Amounts of check-off rows to benchmark")
+    arguments = parser.parse_args()
+
+    print("{:>12} {:>12} {:>12} {:>12} {:>12}".format("rows", "p50, us", "p99, us", "statements", "commits"))
+    for rows in arguments.sizes:
+        p50, p99, statements, commits = measure(rows)
+        print("{:>12} {:>12.1f} {:>12.1f} {:>12} {:>12}".format(rows, p50, p99, statements, commits))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Bulk check-off throughput benchmark.
+
+Replays a year of synthetic daily events for a set of habits through HabitTracker.check_off_many
+and reports the ingestion rate. The target is at least 50k events per second.
+
+Run from the repository root:
+    python -m benchmarks.bench_check_off_many --habits 1000 --days 365
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from src.tracker import HabitTracker
+
+
+def generate_events(habits, days, seed=0):
+    """
+    Generates check-off events in date order. Every habit is done on about 80% of the days.
+    :param habits: The amount of habits.
+    :param days: The amount of days to generate, ending today.
+    :param seed: Seed of the random generator.
+    :return: A list of (name, date) pairs.
+    """
+    generator = random.Random(seed)
+    start = datetime.date.today() - datetime.timedelta(days=days)
+    events = []
+    for day in range(days):
+        date = (start + datetime.timedelta(days=day)).isoformat()
+        events.extend(('habit-{}'.format(number), date) for number in range(habits) if generator.random() < 0.8)
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk check-off throughput benchmark")
+    parser.add_argument("--habits", type=int, default=1000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=365, help="Amount of days of events")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Events per transaction")
+    arguments = parser.parse_args()
+
+    events = generate_events(arguments.habits, arguments.days)
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), 'daily') for number in range(arguments.habits)))
+        tracker.conn.commit()
+        started = time.perf_counter()
+        totals = tracker.check_off_many(events, arguments.chunk_size)
+        elapsed = time.perf_counter() - started
+        tracker.conn.close()
+
+    print("events: {}, checked: {}, seconds: {:.2f}, events/sec: {:.0f}".format(
+        len(events), totals['checked'], elapsed, len(events) / elapsed))
+
+
+if __name__ == '__main__':
+    main()
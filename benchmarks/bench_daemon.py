@@ -0,0 +1,92 @@
+"""
+Daemon latency benchmark.
+
+Compares the latency of a command executed by a fresh HabitTracker, as every CLI invocation without the daemon
+does, with the round trip of the same command to a warm daemon, and the end-to-end time of `python main.py`
+with and without the daemon.
+
+Run from the repository root:
+    python -m benchmarks.bench_daemon --calls 2000
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.suite import percentile
+from src.client import connect
+from src.server import TrackerServer
+from src.tracker import HabitTracker
+
+
+def percentiles(timings):
+    """
+    :param timings: Latencies in seconds.
+    :return: A tuple with the nearest-rank median and 99th percentile in milliseconds.
+    """
+    timings = sorted(timings)
+    return percentile(timings, 0.5) * 1e3, percentile(timings, 0.99) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daemon latency benchmark")
+    parser.add_argument("--calls", type=int, default=2000, help="Amount of commands per measurement")
+    parser.add_argument("--processes", type=int, default=20, help="Amount of CLI processes per measurement")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'db', 'habits_table.db')
+        socket_path = os.path.join(directory, 'tracker.sock')
+        os.mkdir(os.path.dirname(db_path))
+        tracker = HabitTracker(db_path)
+        for number in range(100):
+            tracker.add_habit('habit-{}'.format(number), 'daily')
+        tracker.conn.close()
+
+        cold = []
+        for number in range(arguments.calls):
+            started = time.perf_counter()
+            fresh_tracker = HabitTracker(db_path)
+            fresh_tracker.get_longest_streak_by_name('habit-{}'.format(number % 100))
+            fresh_tracker.conn.close()
+            cold.append(time.perf_counter() - started)
+
+        server = TrackerServer(socket_path, lambda: HabitTracker(db_path, cache_size=1024))
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = connect(socket_path)
+        warm = []
+        for number in range(arguments.calls):
+            started = time.perf_counter()
+            client.call('get_longest_streak_by_name', 'habit-{}'.format(number % 100))
+            warm.append(time.perf_counter() - started)
+
+        # end-to-end CLI invocations, run from the temporary directory to use its database
+        main_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+        command = [sys.executable, main_path, '--socket', socket_path]
+        environment = dict(os.environ, PYTHONPATH=os.path.dirname(main_path))
+        cli = {}
+        for label, extra in (('cli without daemon', ['--no-daemon']), ('cli with daemon', [])):
+            timings = []
+            for _ in range(arguments.processes):
+                started = time.perf_counter()
+                subprocess.run(command + extra + ['longest-streak-by-name', '--name', 'habit-1'], cwd=directory,
+                               env=environment, check=True, stdout=subprocess.DEVNULL)
+                timings.append(time.perf_counter() - started)
+            cli[label] = timings
+
+        client.close()
+        server.shutdown()
+        thread.join()
+        server.server_close()
+
+    print("{:>22} {:>10} {:>10}".format("", "p50, ms", "p99, ms"))
+    for label, timings in [('fresh tracker', cold), ('daemon round trip', warm)] + list(cli.items()):
+        print("{:>22} {:>10.3f} {:>10.3f}".format(label, *percentiles(timings)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Habit deletion benchmark.
+
+Deletes habits with a long check-off history one by one with delete_habit and in bulk with delete_habits. The
+foreign keys delete the check-offs and statistics of every habit with a seek on the check-off index. compact then
+returns the freed pages to the file system.
+
+Run from the repository root:
+    python -m benchmarks.bench_delete --habits 10000 --days 365 --deleted 1000
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from src.tracker import HabitTracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Habit deletion benchmark")
+    parser.add_argument("--habits", type=int, default=10000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=365, help="Amount of check-offs per habit")
+    parser.add_argument("--deleted", type=int, default=1000, help="Amount of habits deleted by each method")
+    arguments = parser.parse_args()
+
+    start = datetime.date(2020, 1, 1)
+    dates = [(start + datetime.timedelta(days=day)).isoformat() for day in range(arguments.days)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        tracker = HabitTracker(path)
+        names = ['habit-{}'.format(number) for number in range(arguments.habits)]
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 ((name, 'daily') for name in names))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates))
+        tracker.conn.commit()
+        tracker.rebuild_stats()
+        print("habits: {}, check-offs: {}, database: {:.1f} MB".format(
+            arguments.habits, arguments.habits * arguments.days, os.path.getsize(path) / 1e6))
+
+        timings = []
+        for name in names[:arguments.deleted]:
+            started = time.perf_counter()
+            tracker.delete_habit(name)
+            timings.append(time.perf_counter() - started)
+        print("delete_habit: median {:.2f} ms, total {:.2f} s for {} habits".format(
+            statistics.median(timings) * 1e3, sum(timings), arguments.deleted))
+
+        started = time.perf_counter()
+        tracker.delete_habits(names[arguments.deleted:2 * arguments.deleted])
+        elapsed = time.perf_counter() - started
+        print("delete_habits: {:.2f} s for {} habits, {:.3f} ms per habit".format(
+            elapsed, arguments.deleted, elapsed * 1e3 / arguments.deleted))
+
+        orphans = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table WHERE habit_id NOT IN '
+                                       '(SELECT habit_id FROM habits_table)').fetchone()[0]
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        compacted = tracker.compact()
+        print("compact: {:.2f} s, freed {} pages, database {:.1f} MB -> {:.1f} MB, orphaned check-offs: {}".format(
+            time.perf_counter() - started, compacted['freed_pages'], size / 1e6, os.path.getsize(path) / 1e6,
+            orphans))
+        tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
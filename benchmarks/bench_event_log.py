@@ -0,0 +1,77 @@
+"""
+Event log benchmark.
+
+Checks-off distinct habits from many threads and reports the check-offs per second of LoggedHabitTracker, which
+acknowledges a check-off once its group is fsynced to the event log, and of PooledHabitTracker, which commits
+every check-off in its own transaction, with synchronous=FULL (durable like the log) and with its default
+synchronous=NORMAL (a crash can lose the last commits).
+
+Run from the repository root:
+    python -m benchmarks.bench_event_log --threads 32 --check-offs 200
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from src.event_log import LoggedHabitTracker
+from src.pool import PooledHabitTracker
+
+
+class DurablePooledHabitTracker(PooledHabitTracker):
+    """PooledHabitTracker that fsyncs every commit"""
+
+    def connect(self):
+        conn = super().connect()
+        conn.execute('PRAGMA synchronous = FULL')
+        return conn
+
+
+def run_threads(tracker, thread_count, check_offs):
+    """
+    Checks-off check_offs distinct habits on every thread.
+    :return: The elapsed seconds.
+    """
+    def worker(first):
+        for number in range(first, first + check_offs):
+            tracker.check_off('habit-{}'.format(number))
+
+    threads = [threading.Thread(target=worker, args=(thread * check_offs,)) for thread in range(thread_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Event log benchmark")
+    parser.add_argument("--threads", type=int, default=32, help="Amount of threads checking-off")
+    parser.add_argument("--check-offs", type=int, default=200, help="Check-offs per thread")
+    arguments = parser.parse_args()
+    total = arguments.threads * arguments.check_offs
+
+    print("threads: {}, check-offs: {}".format(arguments.threads, total))
+    for label, tracker_class in (('event log', LoggedHabitTracker),
+                                 ('commit per check-off, synchronous=FULL', DurablePooledHabitTracker),
+                                 ('commit per check-off, synchronous=NORMAL', PooledHabitTracker)):
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = tracker_class(os.path.join(directory, 'bench.db'))
+            tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                     (('habit-{}'.format(number), 'daily') for number in range(total)))
+            tracker.conn.commit()
+            seconds = run_threads(tracker, arguments.threads, arguments.check_offs)
+            line = "{}: {:.0f} check-offs/s".format(label, total / seconds)
+            if isinstance(tracker, LoggedHabitTracker):
+                started = time.perf_counter()
+                tracker.apply_logged()
+                line += ", {} fsynced groups, applying the rest took {:.2f} s".format(
+                    tracker.log.groups, time.perf_counter() - started)
+            tracker.close()
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""
+Instrumentation overhead benchmark.
+
+Times a lookup by name and a check-off without the instrumented wrapper, through it with the instrumentation
+disabled, and with an Instrumentation tracing every statement. The disabled wrapper costs one Python call and an
+attribute check; check_off is dominated by the fsync of its commit.
+
+Run from the repository root:
+    python -m benchmarks.bench_instrumentation --habits 10000
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from src.instrumentation import Instrumentation
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+
+def median_us(function, arguments):
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(*argument)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Instrumentation overhead benchmark")
+    parser.add_argument("--habits", type=int, default=10000, help="Amount of habits")
+    parser.add_argument("--samples", type=int, default=2000, help="Amount of timed calls per method")
+    arguments = parser.parse_args()
+
+    names = ['habit-{}'.format(number) for number in range(arguments.habits)]
+    lookups = [(names[number % arguments.habits],) for number in range(arguments.samples * 10)]
+    print("{:>10} {:>16} {:>16}".format('mode', 'lookup us', 'check-off us'))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        tracker = HabitTracker(path)
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 ((name, 'daily') for name in names))
+        tracker.conn.commit()
+        tracker.conn.close()
+
+        day = datetime.date(2023, 1, 2)
+        for mode in ('unwrapped', 'disabled', 'enabled'):
+            instrumentation = Instrumentation() if mode == 'enabled' else None
+            tracker = HabitTracker(path, clock=SimulatedClock(day), instrumentation=instrumentation)
+            lookup, check_off = tracker.get_longest_streak_by_name, tracker.check_off
+            if mode == 'unwrapped':
+                lookup = HabitTracker.get_longest_streak_by_name.__wrapped__.__get__(tracker)
+                check_off = HabitTracker.check_off.__wrapped__.__get__(tracker)
+            check_offs = [(names[number],) for number in range(min(arguments.samples, arguments.habits))]
+            print("{:>10} {:>16.2f} {:>16.1f}".format(mode, median_us(lookup, lookups),
+                                                      median_us(check_off, check_offs)))
+            tracker.conn.close()
+            # every mode checks-off on its own day
+            day += datetime.timedelta(days=1)
+
+
+if __name__ == '__main__':
+    main()
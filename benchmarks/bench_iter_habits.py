@@ -0,0 +1,63 @@
+"""
+Habit listing benchmark.
+
+Compares get_all_habits, which fetches the whole habit table into a list, with the paginated iter_habits
+on a large habit table: time to the first habit, total time and peak memory allocated while listing.
+
+Run from the repository root:
+    python -m benchmarks.bench_iter_habits --habits 500000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from src.tracker import HabitTracker
+
+
+def measure(list_habits):
+    """
+    Consumes the habits returned by the function.
+    :param list_habits: Function returning an iterable of habits.
+    :return: A tuple with the seconds to the first habit, the total seconds and the peak of allocated bytes.
+    """
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = None
+    for _ in list_habits():
+        if first is None:
+            first = time.perf_counter() - started
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Habit listing benchmark")
+    parser.add_argument("--habits", type=int, default=500000, help="Amount of habits")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Habits per page of iter_habits")
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), ('daily', 'weekly')[number % 2])
+                                  for number in range(arguments.habits)))
+        tracker.conn.commit()
+
+        print("{:>24} {:>14} {:>10} {:>12}".format("", "first row, ms", "total, s", "peak, MiB"))
+        for label, list_habits in [
+            ("get_all_habits", tracker.get_all_habits),
+            ("iter_habits", lambda: tracker.iter_habits(batch_size=arguments.batch_size)),
+            ("get_all_by_periodicity", lambda: tracker.get_all_by_periodicity('weekly')),
+            ("iter_habits(weekly)", lambda: tracker.iter_habits('weekly', arguments.batch_size)),
+        ]:
+            first, elapsed, peak = measure(list_habits)
+            print("{:>24} {:>14.2f} {:>10.2f} {:>12.1f}".format(label, first * 1000, elapsed, peak / 2 ** 20))
+        tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Leaderboard latency benchmark.
+
+Fills a habit table with random streaks and measures top_streaks for growing K, next to the same top-K query
+forced to ignore the streak index (a full scan and sort) and to the previous MAX() join of get_longest_streak.
+
+Run from the repository root:
+    python -m benchmarks.bench_leaderboard --habits 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.tracker import HabitTracker
+
+# get_longest_streak before the streak indexes
+MAX_JOIN_QUERY = """SELECT longest_streak, name FROM habits_table NOT INDEXED
+                    JOIN (SELECT MAX(longest_streak) AS max_value FROM habits_table NOT INDEXED) AS subquery
+                    ON habits_table.longest_streak = subquery.max_value"""
+
+UNINDEXED_TOP_QUERY = """SELECT habit_id, name, periodicity, longest_streak FROM habits_table NOT INDEXED
+                         ORDER BY longest_streak DESC, habit_id LIMIT ?"""
+
+
+def median_ms(function, repeat):
+    """
+    :param function: The function to time.
+    :param repeat: How many times to call it.
+    :return: The median duration of a call in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leaderboard latency benchmark")
+    parser.add_argument("--habits", type=int, default=1000000, help="Amount of habits")
+    parser.add_argument("--top", type=int, nargs="+", default=[1, 10, 100, 1000], help="Values of K")
+    parser.add_argument("--repeat", type=int, default=20, help="Calls per measurement")
+    arguments = parser.parse_args()
+
+    generator = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'))
+        streaks = ((number, generator.randrange(400)) for number in range(arguments.habits))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity, current_streak, longest_streak) '
+                                 'VALUES (?, ?, ?, ?)',
+                                 (('habit-{}'.format(number), ('daily', 'weekly')[number % 2], streak // 2, streak)
+                                  for number, streak in streaks))
+        tracker.conn.commit()
+
+        print("habits: {}".format(arguments.habits))
+        print("{:>6} {:>16} {:>20} {:>22}".format("K", "top_streaks, ms", "weekly top-K, ms", "without index, ms"))
+        for k in arguments.top:
+            indexed = median_ms(lambda: tracker.top_streaks(k, 'longest'), arguments.repeat)
+            weekly = median_ms(lambda: tracker.top_streaks(k, 'longest', 'weekly'), arguments.repeat)
+            unindexed = median_ms(lambda: tracker.conn.execute(UNINDEXED_TOP_QUERY, (k,)).fetchall(), 3)
+            print("{:>6} {:>16.3f} {:>20.3f} {:>22.1f}".format(k, indexed, weekly, unindexed))
+
+        print("get_longest_streak: {:.3f} ms, previous MAX() join: {:.1f} ms".format(
+            median_ms(tracker.get_longest_streak, arguments.repeat),
+            median_ms(lambda: tracker.conn.execute(MAX_JOIN_QUERY).fetchall(), 3)))
+        tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Multi-threaded stress benchmark of PooledHabitTracker.
+
+Fills a database with habits and a history of check-offs, then runs a workload on 1 to 16 threads sharing one
+PooledHabitTracker and reports the throughput of every thread count. Every thread count starts from a fresh copy
+of the database, so the check-offs of one measurement do not change the streaks the next one reads.
+
+Workloads:
+- mixed: streak lookups by name, the current longest streak and check-offs, see --write-ratio.
+- reports: get_completed_habits over the last week of the history, a scan of the check-offs of all habits
+  returning few rows. SQLite releases the GIL while it runs a statement, so on a multi-core machine these
+  reports run in parallel on the threads that call them, while the Python work of building result rows does not.
+
+Run from the repository root:
+    python -m benchmarks.bench_pool --habits 20000 --seconds 2 --write-ratio 0.1
+    python -m benchmarks.bench_pool --habits 20000 --seconds 2 --workload reports
+"""
+import argparse
+import datetime
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+from src.pool import PooledHabitTracker
+from src.tracker import HabitTracker
+
+
+def worker(tracker, arguments, deadline, seed, counts):
+    """
+    Runs random operations on the tracker until the deadline.
+    :param tracker: The shared PooledHabitTracker.
+    :param arguments: The parsed command line arguments.
+    :param deadline: time.perf_counter() value to stop at.
+    :param seed: Seed of the random generator of the thread.
+    :param counts: A list the amount of executed operations is appended to.
+    :return: None
+    """
+    generator = random.Random(seed)
+    report_start = datetime.date.today() - datetime.timedelta(days=7)
+    operations = 0
+    while time.perf_counter() < deadline:
+        if arguments.workload == 'reports':
+            tracker.get_completed_habits(report_start)
+            operations += 1
+            continue
+        name = 'habit-{}'.format(generator.randrange(arguments.habits))
+        draw = generator.random()
+        if draw < arguments.write_ratio:
+            tracker.check_off(name)
+        elif draw < (1 + arguments.write_ratio) / 2:
+            tracker.get_current_longest_streak()
+        else:
+            tracker.get_longest_streak_by_name(name)
+        operations += 1
+    counts.append(operations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PooledHabitTracker stress benchmark")
+    parser.add_argument("--habits", type=int, default=20000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=60, help="Amount of days of check-off history")
+    parser.add_argument("--completion", type=float, default=0.9, help="Share of the days a habit is checked-off")
+    parser.add_argument("--seconds", type=float, default=2, help="Duration of every measurement")
+    parser.add_argument("--workload", choices=('mixed', 'reports'), default='mixed', help="Operations to run")
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="Share of check-offs in the mixed workload")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="Thread counts")
+    arguments = parser.parse_args()
+
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=day)).isoformat() for day in range(arguments.days, 0, -1)]
+    generator = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'bench.db')
+        tracker = HabitTracker(path)
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), 'daily') for number in range(arguments.habits)))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates
+                                  if generator.random() < arguments.completion))
+        tracker.conn.commit()
+        tracker.recompute_streaks()
+        tracker.rebuild_stats()
+        tracker.rebuild_bitmaps()
+        tracker.conn.close()
+
+        print("{} workload, {} CPUs".format(arguments.workload, os.cpu_count()))
+        print("{:>8} {:>12} {:>12}".format("threads", "ops/sec", "speed-up"))
+        single = None
+        for thread_count in arguments.threads:
+            run_path = os.path.join(directory, 'run.db')
+            shutil.copyfile(path, run_path)
+            tracker = PooledHabitTracker(run_path)
+            counts = []
+            started = time.perf_counter()
+            deadline = started + arguments.seconds
+            threads = [threading.Thread(target=worker, args=(tracker, arguments, deadline, seed, counts))
+                       for seed in range(thread_count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # the operations running at the deadline are finished and counted
+            elapsed = time.perf_counter() - started
+            tracker.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(run_path + suffix):
+                    os.remove(run_path + suffix)
+            throughput = sum(counts) / elapsed
+            single = single or throughput
+            print("{:>8} {:>12.1f} {:>12.2f}".format(thread_count, throughput, throughput / single))
+
+
+if __name__ == '__main__':
+    main()
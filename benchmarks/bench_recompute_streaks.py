@@ -0,0 +1,52 @@
+"""
+Streak recomputation benchmark.
+
+Fills a temporary database with the requested amount of check-offs and measures how long
+HabitTracker.recompute_streaks takes to recompute the streaks of all habits.
+
+Run from the repository root:
+    python -m benchmarks.bench_recompute_streaks --rows 10000000
+"""
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+from src.tracker import HabitTracker
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streak recomputation benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Amount of check-off rows")
+    parser.add_argument("--habits", type=int, default=10_000, help="Amount of habits")
+    arguments = parser.parse_args()
+
+    generator = random.Random(0)
+    per_habit = max(arguments.rows // arguments.habits, 1)
+    start = datetime.date.today() - datetime.timedelta(days=2 * per_habit)
+    # every habit is checked-off on about half of the days, which gives plenty of broken streaks
+    dates = sorted(generator.sample(range(2 * per_habit), per_habit))
+    dates = [(start + datetime.timedelta(days=day)).isoformat() for day in dates]
+
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), ('daily', 'weekly')[number % 2])
+                                  for number in range(arguments.habits)))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates))
+        tracker.conn.commit()
+        started = time.perf_counter()
+        tracker.recompute_streaks()
+        elapsed = time.perf_counter() - started
+        tracker.conn.close()
+
+    rows = per_habit * arguments.habits
+    print("rows: {}, habits: {}, seconds: {:.2f}, rows/sec: {:.0f}".format(
+        rows, arguments.habits, elapsed, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
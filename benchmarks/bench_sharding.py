@@ -0,0 +1,92 @@
+"""
+Sharding benchmark.
+
+Fills the shards with the habits of many users, times the cross-shard reads with the shards read in parallel
+and one after the other, then adds a shard and times the rebalancing. The share of moved users is compared with
+the share hashing modulo the amount of shards would move.
+
+Run from the repository root:
+    python -m benchmarks.bench_sharding --users 100000 --shards 4
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.sharding import ShardedHabitTracker, rebalance, ring_hash, shard_name
+from src.tracker import HabitTracker
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharding benchmark")
+    parser.add_argument("--users", type=int, default=100000, help="Amount of users")
+    parser.add_argument("--habits", type=int, default=3, help="Amount of habits per user")
+    parser.add_argument("--shards", type=int, default=4, help="Amount of shards before rebalancing")
+    arguments = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [os.path.join(directory, 'shard-{}.db'.format(number)) for number in range(arguments.shards + 1)]
+        tracker = ShardedHabitTracker(paths[:-1])
+        users = {}
+        for number in range(arguments.users):
+            user_id = 'user-{}'.format(number)
+            users.setdefault(tracker.ring.shard_for(user_id), []).append(user_id)
+        started = time.perf_counter()
+        for name, shard_users in users.items():
+            conn = tracker.shards[name].conn
+            conn.executemany('INSERT INTO habits_table (user_id, name, periodicity, current_streak, longest_streak) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             ((user_id, '{}-habit-{}'.format(user_id, habit), ('daily', 'weekly')[habit % 2],
+                               rng.randrange(100), rng.randrange(100, 1000))
+                              for user_id in shard_users for habit in range(arguments.habits)))
+            conn.commit()
+        print("users: {}, habits: {}, shards: {}, users per shard: {}, fill: {:.2f} s".format(
+            arguments.users, arguments.users * arguments.habits, arguments.shards,
+            sorted(len(shard_users) for shard_users in users.values()), time.perf_counter() - started))
+
+        single = HabitTracker(paths[0])
+        for kind in ('current', 'longest'):
+            def sequential():
+                for shard in tracker.shards.values():
+                    shard.top_streaks(10, kind)
+            print("top_streaks({}): parallel {:.2f} ms, sequential {:.2f} ms, one shard {:.2f} ms".format(
+                kind, median_ms(lambda: tracker.top_streaks(10, kind), 50), median_ms(sequential, 50),
+                median_ms(lambda: single.top_streaks(10, kind), 50)))
+
+        def sequential_all():
+            for shard in tracker.shards.values():
+                shard.get_all_habits()
+        print("get_all_habits: parallel {:.0f} ms, sequential {:.0f} ms, one shard {:.0f} ms".format(
+            median_ms(tracker.get_all_habits, 3), median_ms(sequential_all, 3), median_ms(single.get_all_habits, 3)))
+        user_id = 'user-{}'.format(arguments.users // 2)
+        print("for_user(...).get_all_habits: {:.3f} ms".format(
+            median_ms(lambda: tracker.for_user(user_id).get_all_habits(), 200)))
+        single.conn.close()
+        tracker.close()
+
+        modulo_moved = sum(ring_hash(user_id) % arguments.shards != ring_hash(user_id) % (arguments.shards + 1)
+                           for shard_users in users.values() for user_id in shard_users)
+        started = time.perf_counter()
+        moved = rebalance(paths[:-1], paths)
+        print("rebalance to {} shards: {:.2f} s, moved {} users ({:.1%}, modulo hashing would move {:.1%}), "
+              "{} habits".format(arguments.shards + 1, time.perf_counter() - started, moved['users'],
+                                 moved['users'] / arguments.users, modulo_moved / arguments.users, moved['habits']))
+        print("added shard {} holds {} habits".format(
+            shard_name(paths[-1]), HabitTracker(paths[-1]).conn.execute('SELECT COUNT(*) FROM habits_table')
+            .fetchone()[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Snapshot benchmark.
+
+Compares answering read-only queries from a memory-mapped snapshot with answering them from SQLite,
+including the cost of opening a reader and a tracker.
+
+Run from the repository root:
+    python -m benchmarks.bench_snapshot --habits 100000 --lookups 20000
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.snapshot import SnapshotReader, write_snapshot
+from src.tracker import HabitTracker
+
+
+def median_us(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot benchmark")
+    parser.add_argument("--habits", type=int, default=100000, help="Amount of habits")
+    parser.add_argument("--lookups", type=int, default=20000, help="Amount of habit lookups by name")
+    arguments = parser.parse_args()
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'bench.db')
+        snapshot_path = os.path.join(directory, 'bench.snapshot')
+        tracker = HabitTracker(db_path)
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity, current_streak, longest_streak) '
+                                 'VALUES (?, ?, ?, ?)',
+                                 (('habit-{}'.format(number), ('daily', 'weekly')[number % 2],
+                                   rng.randrange(100), rng.randrange(100, 1000)) for number in range(arguments.habits)))
+        tracker.conn.commit()
+        started = time.perf_counter()
+        write_snapshot(tracker, snapshot_path)
+        print("habits: {}, snapshot: {:.2f} s, {:.1f} MiB".format(
+            arguments.habits, time.perf_counter() - started, os.path.getsize(snapshot_path) / 2 ** 20))
+
+        def open_tracker():
+            HabitTracker(db_path).conn.close()
+
+        def open_reader():
+            SnapshotReader(snapshot_path).close()
+
+        print("open: tracker {:.0f} us, snapshot reader {:.0f} us".format(
+            median_us(open_tracker, 200), median_us(open_reader, 200)))
+
+        reader = SnapshotReader(snapshot_path)
+        names = ['habit-{}'.format(rng.randrange(arguments.habits)) for _ in range(arguments.lookups)]
+        for label, source in (('tracker', tracker), ('snapshot', reader)):
+            started = time.perf_counter()
+            for name in names:
+                source.get_longest_streak_by_name(name)
+            lookup = (time.perf_counter() - started) / arguments.lookups * 1e6
+            print("{}: get_longest_streak_by_name {:.1f} us, top_streaks(10) {:.0f} us, "
+                  "get_habits_page {:.0f} us".format(
+                      label, lookup, median_us(lambda: source.top_streaks(10, 'longest'), 200),
+                      median_us(lambda: source.get_habits_page(None, 100, arguments.habits // 2), 200)))
+        reader.close()
+        tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
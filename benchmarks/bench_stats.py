@@ -0,0 +1,70 @@
+"""
+Habit statistics benchmark.
+
+Compares reading the materialized habit_stats with aggregating the check-off history on every request,
+for one habit (get_stats) and for the dashboard of all habits (get_stats_all).
+
+Run from the repository root:
+    python -m benchmarks.bench_stats --habits 10000 --days 365
+"""
+import argparse
+import datetime
+import os
+import statistics
+import tempfile
+import time
+
+from src.tracker import HabitTracker, day_key
+
+# what get_stats replaces: aggregating the history of the habit on every request
+AD_HOC_QUERY = """SELECT COUNT(*), MIN(date), MAX(date),
+                         SUM(day_key > :today - 7), SUM(day_key > :today - 30)
+                  FROM check_off_table WHERE habit_id = (SELECT habit_id FROM habits_table WHERE name = :name)"""
+
+AD_HOC_ALL_QUERY = """SELECT habit_id, COUNT(*), MIN(date), MAX(date),
+                             SUM(day_key > :today - 7), SUM(day_key > :today - 30)
+                      FROM check_off_table GROUP BY habit_id"""
+
+
+def median_ms(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Habit statistics benchmark")
+    parser.add_argument("--habits", type=int, default=10000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=365, help="Days of check-off history of every habit")
+    arguments = parser.parse_args()
+
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=day)).isoformat() for day in range(arguments.days)]
+    with tempfile.TemporaryDirectory() as directory:
+        tracker = HabitTracker(os.path.join(directory, 'bench.db'))
+        tracker.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                 (('habit-{}'.format(number), 'daily') for number in range(arguments.habits)))
+        tracker.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates))
+        tracker.conn.commit()
+        started = time.perf_counter()
+        tracker.rebuild_stats()
+        rebuild = time.perf_counter() - started
+
+        parameters = {'today': day_key(today), 'name': 'habit-{}'.format(arguments.habits // 2)}
+        print("habits: {}, check-offs: {}, rebuild-stats: {:.2f} s".format(
+            arguments.habits, arguments.habits * arguments.days, rebuild))
+        print("one habit: get_stats {:.3f} ms, aggregating the history {:.3f} ms".format(
+            median_ms(lambda: tracker.get_stats(parameters['name']), 200),
+            median_ms(lambda: tracker.conn.execute(AD_HOC_QUERY, parameters).fetchall(), 200)))
+        print("all habits: get_stats_all {:.1f} ms, aggregating the history {:.1f} ms".format(
+            median_ms(tracker.get_stats_all, 5),
+            median_ms(lambda: tracker.conn.execute(AD_HOC_ALL_QUERY, parameters).fetchall(), 5)))
+        tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
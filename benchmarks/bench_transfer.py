@@ -0,0 +1,77 @@
+"""
+Export/import benchmark.
+
+Exports a check-off history in the binary and the CSV format and imports it into empty databases, with the
+indexes dropped and rebuilt and with the indexes kept, compared with replaying the history with check_off_many.
+
+Run from the repository root:
+    python -m benchmarks.bench_transfer --habits 1000 --days 1000
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+from src import transfer
+from src.tracker import HabitTracker
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export/import benchmark")
+    parser.add_argument("--habits", type=int, default=1000, help="Amount of habits")
+    parser.add_argument("--days", type=int, default=1000, help="Days of check-off history of every habit")
+    arguments = parser.parse_args()
+
+    today = datetime.date.today()
+    dates = [(today - datetime.timedelta(days=day)).isoformat() for day in range(arguments.days)]
+    with tempfile.TemporaryDirectory() as directory:
+        source = HabitTracker(os.path.join(directory, 'source.db'))
+        source.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                (('habit-{}'.format(number), 'daily') for number in range(arguments.habits)))
+        source.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                ((habit_id, date) for habit_id in range(1, arguments.habits + 1) for date in dates))
+        source.conn.commit()
+        rows = arguments.habits * arguments.days
+        print("habits: {}, check-offs: {}".format(arguments.habits, rows))
+
+        for file_format, name in (('binary', 'export.bin'), ('csv', 'export')):
+            path = os.path.join(directory, name)
+            _, seconds = timed(transfer.export_history, source, path, file_format)
+            print("{} export: {:.2f} s, {:.0f} rows/s, {:.1f} MiB".format(
+                file_format, seconds, rows / seconds, size(path) / 2 ** 20))
+            for rebuild_indexes in (True, False):
+                target = HabitTracker(os.path.join(directory, 'target.db'))
+                blocks = transfer.read_binary(path) if file_format == 'binary' else transfer.read_csv(path)
+                _, seconds = timed(transfer.import_blocks, target, blocks, rebuild_indexes=rebuild_indexes)
+                print("{} import, {}: {:.2f} s, {:.0f} rows/s".format(
+                    file_format, 'indexes rebuilt' if rebuild_indexes else 'indexes kept', seconds, rows / seconds))
+                target.conn.close()
+                os.remove(os.path.join(directory, 'target.db'))
+
+        target = HabitTracker(os.path.join(directory, 'target.db'))
+        target.conn.executemany('INSERT INTO habits_table (name, periodicity) VALUES (?, ?)',
+                                source.conn.execute('SELECT name, periodicity FROM habits_table'))
+        target.conn.commit()
+        events = source.conn.execute('SELECT name, date FROM check_off_table JOIN habits_table '
+                                     'ON habits_table.habit_id = check_off_table.habit_id ORDER BY date')
+        _, seconds = timed(target.check_off_many, events)
+        print("replay with check_off_many: {:.2f} s, {:.0f} rows/s".format(seconds, rows / seconds))
+        target.conn.close()
+        source.conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Multi-user benchmark.
+
+Times the queries of one user on databases with a growing amount of users. Every query of a user is a seek on a
+(user_id, ...) index, so its latency stays flat as users are added. A lookup by name across all users, which
+has no index to use, is timed for comparison. add and check are dominated by the fsync of their commit.
+
+Run from the repository root:
+    python -m benchmarks.bench_users --users 1000 10000 100000 --habits 5
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+
+def median_us(function, arguments):
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(*argument)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-user benchmark")
+    parser.add_argument("--users", type=int, nargs='+', default=[1000, 10000, 100000], help="Amounts of users")
+    parser.add_argument("--habits", type=int, default=5, help="Amount of habits per user")
+    parser.add_argument("--samples", type=int, default=2000, help="Amount of timed calls per query")
+    arguments = parser.parse_args()
+
+    rng = random.Random(0)
+    print("{:>8} {:>9} {:>11} {:>10} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        'users', 'habits', 'by name us', 'page us', 'top us', 'max us', 'add us', 'check us', 'no user us'))
+    for users in arguments.users:
+        with tempfile.TemporaryDirectory() as directory:
+            clock = SimulatedClock(datetime.date(2023, 1, 2))
+            tracker = HabitTracker(os.path.join(directory, 'bench.db'), clock=clock, user_id=None)
+            tracker.conn.executemany('INSERT INTO habits_table (user_id, name, periodicity, current_streak, '
+                                     'longest_streak) VALUES (?, ?, ?, ?, ?)',
+                                     (('user-{}'.format(user), 'habit-{}'.format(habit), ('daily', 'weekly')[habit % 2],
+                                       rng.randrange(100), rng.randrange(100, 1000))
+                                      for user in range(users) for habit in range(arguments.habits)))
+            tracker.conn.commit()
+
+            samples = [('user-{}'.format(rng.randrange(users)), 'habit-{}'.format(rng.randrange(arguments.habits)))
+                       for _ in range(arguments.samples)]
+            views = [(tracker.for_user(user_id), name) for user_id, name in samples]
+            added = iter(range(arguments.samples))
+            row = [
+                median_us(lambda view, name: view.get_longest_streak_by_name(name), views),
+                median_us(lambda view, _: view.get_habits_page('daily', 10), views),
+                median_us(lambda view, _: view.top_streaks(3, 'longest'), views),
+                median_us(lambda view, _: view.get_current_longest_streak(), views),
+                median_us(lambda view, _: view.add_habit('new-{}'.format(next(added)), 'daily'), views),
+                median_us(lambda view, name: view.check_off(name), views),
+                # the habit name alone, without the user, can not use the (user_id, name) index; a missing name
+                # is timed, as the scan for an existing one stops at the first user having it
+                median_us(tracker.get_longest_streak_by_name, [('missing',)] * 20),
+            ]
+            print("{:>8} {:>9} {:>11.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12.0f}".format(
+                users, users * arguments.habits, *row))
+            tracker.conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+"""
+Benchmark suite of the HabitTracker operations with a regression check.
+
+Generates a synthetic database for every scale, times the operations on a copy of it and reports the p50 and
+p99 latency and the throughput of every operation as JSON. Given a baseline report, it fails with exit code 1
+when an operation got slower than the baseline by more than the tolerance.
+
+Scales (see SCALES): 1k habits with a year of check-offs, 100k habits with a month, 1m habits with about
+10M check-offs. The generated databases can be kept in --data-dir to skip generating them on the next run.
+
+Run from the repository root:
+    python -m benchmarks.suite --scales 1k 100k --baseline benchmarks/baseline.json
+    python -m benchmarks.suite --scales 1k --save-baseline benchmarks/baseline.json
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker, period_key
+from src.transfer import import_blocks
+
+# scale name -> amount of habits and days of check-off history
+SCALES = {
+    '1k': {'habits': 1000, 'days': 365},
+    '100k': {'habits': 100000, 'days': 30},
+    '1m': {'habits': 1000000, 'days': 21},
+}
+# share of the periods a generated habit is checked-off in
+COMPLETION = 0.8
+# the last day of the generated history, the operations run on the day after
+LAST_DAY = datetime.date(2023, 6, 30)
+BLOCK_SIZE = 65536
+
+
+def generate_habits(habits, days, seed=0):
+    """
+    Generates habits with their check-off history and the streaks the history gives them.
+    :param habits: The amount of habits, every second one weekly.
+    :param days: The amount of days of history before LAST_DAY, inclusive.
+    :param seed: The seed of the random generator.
+    :return: A generator of (habit row, list of check-off dates) pairs, the habit row ready for import_blocks.
+    """
+    rng = random.Random(seed)
+    first_day = LAST_DAY - datetime.timedelta(days=days - 1)
+    dates = [first_day + datetime.timedelta(days=offset) for offset in range(days)]
+    weeks = [list(week) for _, week in itertools.groupby(dates, key=lambda date: period_key(date, 'weekly'))]
+    for habit_id in range(1, habits + 1):
+        periodicity = ('daily', 'weekly')[habit_id % 2]
+        if periodicity == 'daily':
+            check_offs = [date for date in dates if rng.random() < COMPLETION]
+        else:
+            check_offs = [rng.choice(week) for week in weeks if rng.random() < COMPLETION]
+        current_streak = longest_streak = 0
+        last_key = None
+        for date in check_offs:
+            key = period_key(date, periodicity)
+            current_streak = current_streak + 1 if last_key is not None and key - last_key == 1 else 1
+            longest_streak = max(longest_streak, current_streak)
+            last_key = key
+        row = (habit_id, 'habit-{}'.format(habit_id), periodicity, first_day.isoformat(), current_streak,
+               longest_streak, '')
+        yield row, check_offs
+
+
+def generate_database(db_path, habits, days, seed=0):
+    """
+    Writes a synthetic database through the bulk import path.
+    :return: A dictionary with the amount of 'habits' and 'check_offs'.
+    """
+    tracker = HabitTracker(db_path)
+
+    def chunked(kind, rows):
+        while True:
+            block = list(itertools.islice(rows, BLOCK_SIZE))
+            if not block:
+                return
+            yield kind, block
+
+    def blocks():
+        # the history is generated twice from the same seed, the habits first and then their check-offs, instead
+        # of keeping millions of dates in memory
+        yield from chunked('habits', (row for row, _ in generate_habits(habits, days, seed)))
+        check_offs = generate_habits(habits, days, seed)
+        yield from chunked('check_offs', ((row[0], date.isoformat()) for row, dates in check_offs for date in dates))
+
+    counts = import_blocks(tracker, blocks())
+    tracker.conn.close()
+    return counts
+
+
+def percentile(timings, share):
+    """
+    :param timings: Sorted durations.
+    :param share: The share of the durations at or below the percentile, e.g. 0.99.
+    :return: The nearest-rank percentile.
+    """
+    return timings[min(len(timings) - 1, max(0, round(share * len(timings)) - 1))]
+
+
+def measure(function, arguments, warm_up=False):
+    """
+    Calls a function once per argument tuple and summarizes the durations of the calls.
+    :param warm_up: Call the function with the first arguments once before timing, so the first timed call does
+                    not read the pages of the database from disk; only for functions that do not write.
+    :return: A dictionary with the 'samples', the 'p50_us' and 'p99_us' latency and the throughput 'ops_per_s'.
+    """
+    if warm_up:
+        function(*arguments[0])
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        function(*argument)
+        timings.append(time.perf_counter() - started)
+    total = sum(timings)
+    timings.sort()
+    return {'samples': len(timings), 'p50_us': round(percentile(timings, 0.5) * 1e6, 2),
+            'p99_us': round(percentile(timings, 0.99) * 1e6, 2), 'ops_per_s': round(len(timings) / total, 1)}
+
+
+def run_scale(db_path, habits, samples=1000, listing_samples=5, seed=0):
+    """
+    Times the operations on a generated database. Reads run first, then the writes, each on its own habits.
+    :param db_path: The database to run on, it is changed by the writes.
+    :param habits: The amount of habits of the database.
+    :param samples: The amount of calls of the operations on single habits.
+    :param listing_samples: The amount of calls of the operations listing all habits.
+    :return: A dictionary of operation name -> measure() summary.
+    """
+    rng = random.Random(seed)
+    clock = SimulatedClock(LAST_DAY + datetime.timedelta(days=1))
+    tracker = HabitTracker(db_path, clock=clock)
+    names = ['habit-{}'.format(habit_id) for habit_id in rng.sample(range(1, habits + 1), min(samples, habits))]
+    single = [() for _ in range(samples)]
+    listing = [() for _ in range(listing_samples)]
+    results = {
+        'get_all_habits': measure(tracker.get_all_habits, listing, True),
+        'get_all_by_periodicity': measure(tracker.get_all_by_periodicity, [('weekly',)] * listing_samples, True),
+        'get_habits_page': measure(tracker.get_habits_page,
+                                   [(None, 100, rng.randrange(habits)) for _ in range(samples)], True),
+        'get_current_longest_streak': measure(tracker.get_current_longest_streak, single, True),
+        'get_longest_streak': measure(tracker.get_longest_streak, single, True),
+        'get_longest_streak_by_name': measure(tracker.get_longest_streak_by_name, [(name,) for name in names],
+                                              True),
+        'add_habit': measure(tracker.add_habit, [('new-{}'.format(number), 'daily') for number in range(samples)]),
+        'check_off': measure(tracker.check_off, [(name,) for name in names]),
+        'delete_habit': measure(tracker.delete_habit, [(name,) for name in names]),
+    }
+    tracker.conn.close()
+    return results
+
+
+def compare(report, baseline, tolerance=1.5, min_delta_us=5.0):
+    """
+    Finds the operations whose p50 latency regressed against a baseline report. Operations or scales missing
+    from either report are not compared.
+    :param report: The report of this run, scale -> operation -> measure() summary.
+    :param baseline: The baseline report.
+    :param tolerance: The factor the p50 may grow by.
+    :param min_delta_us: The growth of the p50 in microseconds that is always tolerated, so the timer noise of
+                         the fastest operations does not fail the run.
+    :return: A list of (scale, operation, p50_us, baseline p50_us) tuples of the regressions.
+    """
+    regressions = []
+    for scale, operations in report.items():
+        for operation, summary in operations.items():
+            expected = baseline.get(scale, {}).get(operation)
+            if expected is None:
+                continue
+            if summary['p50_us'] > expected['p50_us'] * tolerance and \
+                    summary['p50_us'] - expected['p50_us'] > min_delta_us:
+                regressions.append((scale, operation, summary['p50_us'], expected['p50_us']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HabitTracker benchmark suite")
+    parser.add_argument("--scales", nargs='+', default=['1k'], choices=list(SCALES), help="Scales to run")
+    parser.add_argument("--samples", type=int, default=1000, help="Calls of the operations on single habits")
+    parser.add_argument("--listing-samples", type=int, default=5, help="Calls of the listings of all habits")
+    parser.add_argument("--data-dir", help="Directory keeping the generated databases between runs")
+    parser.add_argument("--output", help="File to write the JSON report to, stdout by default")
+    parser.add_argument("--baseline", help="Baseline report to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Factor the p50 latency may grow by")
+    parser.add_argument("--min-delta-us", type=float, default=5.0,
+                        help="Growth of the p50 latency in microseconds that is always tolerated")
+    parser.add_argument("--save-baseline", help="File to write the report to as the new baseline")
+    arguments = parser.parse_args()
+
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        data_dir = arguments.data_dir or directory
+        os.makedirs(data_dir, exist_ok=True)
+        for scale in arguments.scales:
+            generated_path = os.path.join(data_dir, 'suite-{}.db'.format(scale))
+            if not os.path.exists(generated_path):
+                started = time.perf_counter()
+                counts = generate_database(generated_path + '.tmp', **SCALES[scale])
+                os.replace(generated_path + '.tmp', generated_path)
+                print("generated {}: {habits} habits, {check_offs} check-offs in {seconds:.1f} s".format(
+                    scale, seconds=time.perf_counter() - started, **counts), file=sys.stderr)
+            db_path = os.path.join(directory, 'run-{}.db'.format(scale))
+            shutil.copyfile(generated_path, db_path)
+            report[scale] = run_scale(db_path, SCALES[scale]['habits'], arguments.samples, arguments.listing_samples)
+            os.remove(db_path)
+
+    text = json.dumps(report, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w') as stream:
+            stream.write(text + '\n')
+    else:
+        print(text)
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, 'w') as stream:
+            stream.write(text + '\n')
+
+    if arguments.baseline:
+        with open(arguments.baseline) as stream:
+            baseline = json.load(stream)
+        regressions = compare(report, baseline, arguments.tolerance, arguments.min_delta_us)
+        for scale, operation, p50, expected in regressions:
+            print("REGRESSION {} {}: p50 {:.1f} us, baseline {:.1f} us".format(scale, operation, p50, expected),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit("{} operations regressed by more than {}x".format(len(regressions), arguments.tolerance))
+        print("No regressions against {}".format(arguments.baseline), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,156 @@
 import argparse
+import csv
+import datetime
+import functools
+import itertools
+import json
+import sys
 
-from src.tracker import HabitTracker
+from src.client import DEFAULT_SOCKET_PATH, connect
+from src.results import Status
 
-if __name__ == '__main__':
-    habit_tracker = HabitTracker()
+CONGRATS = "Habit '{name}' is checked off. Congrats, you are doing great!"
+
+# Text output of habit changes and check-offs by their status
+MESSAGES = {
+    Status.ADDED: ["Habit '{name}' with periodicity '{periodicity}'is added to the table"],
+    Status.DUPLICATE: ['Habit with name "{name}" already exists'],
+    Status.DELETED: ["Habit '{name}' is deleted"],
+    Status.RENAMED: ["Habit name changed from '{previous}' to '{name}'."],
+    Status.PERIODICITY_CHANGED: ["Habit periodicity changed from '{previous}' to '{periodicity}'."],
+    Status.ON_STREAK: ["Habit '{name}' is on streak", CONGRATS],
+    Status.STREAK_BROKEN: ["BROKEN STREAK of the '{name}' habit it is equal to 1 ", CONGRATS],
+    Status.ALREADY_CHECKED: ["You have check the habit today already"],
+    Status.LOGGED: ["Check-off of the '{name}' habit is logged"],
+}
+
+STATS_MESSAGE = ("Name - {name}; periodicity - {periodicity}; check-offs - {total_check_offs}; "
+                 "last 7 days - {last_7_days}; last 30 days - {last_30_days}; "
+                 "completion rate - {completion_rate:.0%}; current streak - {current_streak}; "
+                 "longest streak - {longest_streak}; last check-off - {last_check_off}")
+
+# Read-only commands that can be answered from a snapshot
+SNAPSHOT_COMMANDS = frozenset(['get-all', 'get-all-by-periodicity', 'current-longest-streak',
+                               'longest-streak-for-all-time', 'leaderboard', 'longest-streak-by-name'])
+
+# Text output of a missing habit, which depends on the command
+NOT_FOUND_MESSAGES = {
+    'habit-delete': "You don't have a habit with the name '{name}'",
+    'habit-edit': "No habit found with the name '{name}'.",
+    'habit-check-off': 'Habit with name {name} does not exist',
+}
+
+
+def read_events(stream, input_format):
+    """
+    Streams check-off events from NDJSON or CSV input.
+    NDJSON lines look like {"name": "running", "date": "2023-07-02"}, CSV rows like running,2023-07-02
+    and may start with a name,date header. A missing date means today.
+    :param stream: A text stream to read the events from.
+    :param input_format: Either 'ndjson' or 'csv'.
+    :return: A generator of (name, date) pairs.
+    """
+    today = datetime.date.today().isoformat()
+    if input_format == 'ndjson':
+        for line in stream:
+            if line.strip():
+                event = json.loads(line)
+                yield event['name'], event.get('date') or today
+    else:
+        for row in csv.reader(stream):
+            if not row or row == ['name', 'date']:
+                continue
+            yield row[0], row[1] if len(row) > 1 and row[1] else today
+
+
+def result_lines(command, result):
+    """
+    Formats a HabitResult or a CheckOffResult for the text output.
+    :param command: The CLI command that produced the result.
+    :param result: The result returned by the tracker.
+    :return: A list of text lines.
+    """
+    if result.status is Status.NOT_FOUND:
+        templates = [NOT_FOUND_MESSAGES[command]]
+    else:
+        templates = MESSAGES[result.status]
+    fields = result.as_dict()
+    return [template.format(**fields) for template in templates]
+
+
+def present(result, output, lines):
+    """
+    Writes the result of a command to stdout in the chosen output mode.
+    :param result: The value returned by the tracker.
+    :param output: 'text', 'json' or 'quiet'.
+    :param lines: Iterable of the lines of the text output, only consumed in the text mode.
+    :return: None
+    """
+    if output == 'json':
+        print(json.dumps(result, default=lambda value: value.as_dict()))
+    elif output == 'text':
+        for line in lines:
+            print(line)
+
+
+def stats_lines(info, statements=10):
+    """
+    Formats the report of the instrumentation for the text output.
+    :param info: The dictionary returned by Instrumentation.report.
+    :param statements: The amount of statements to list, those with the most time spent in them.
+    :return: A generator of text lines.
+    """
+    if not info['methods']:
+        yield "No method was called yet"
+    for name, method in info['methods'].items():
+        yield ("{} - calls {calls}; total {total_ms:.1f} ms; mean {mean_ms:.3f} ms; p50 {p50_ms:.3f} ms; "
+               "p99 {p99_ms:.3f} ms; max {max_ms:.3f} ms".format(name, **method))
+    for statement in info['statements'][:statements]:
+        yield ("{method}: {statement} - calls {calls}; total {total_ms:.1f} ms; mean {mean_ms:.3f} ms; "
+               "vm steps {vm_steps}".format(**statement))
+    for query in info['slow_queries']:
+        yield "Slow query of {method}, {ms:.1f} ms: {statement}".format(**query)
+        for detail in query['plan'] or []:
+            yield "    " + detail
 
+
+def stream_habits(habits, output, line_format, limit=None):
+    """
+    Writes habits to stdout as they are read, without holding them in memory.
+    In the json mode every habit is a JSON line. When the limit is reached, the last line tells the cursor
+    of the next page.
+    :param habits: An iterable of (habit_id, name, periodicity, creation_date) tuples.
+    :param output: 'text', 'json' or 'quiet'.
+    :param line_format: Format of a habit in the text output, receives name, periodicity and creation date.
+    :param limit: The maximum amount of habits to write, all habits by default.
+    :return: The amount of written habits.
+    """
+    count = 0
+    habit_id = None
+    for habit_id, *habit in itertools.islice(habits, limit):
+        count += 1
+        if output == 'json':
+            print(json.dumps({'habit_id': habit_id, 'name': habit[0], 'periodicity': habit[1],
+                              'creation_date': habit[2]}))
+        elif output == 'text':
+            print(line_format.format(*habit))
+    if limit is not None and count == limit:
+        present({'next_cursor': habit_id}, output, ["Next page: --cursor {}".format(habit_id)])
+    return count
+
+
+if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Habit Tracker")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH, help="Type the socket path of the tracker daemon")
+    parser.add_argument("--no-daemon", action="store_true", help="Do not use the tracker daemon even if it runs")
+    parser.add_argument("--snapshot", help="Type the path of a snapshot to answer read-only commands from")
+    parser.add_argument("--user", default="",
+                        help="Type the user whose habits the command works on, the default user by default")
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument("--quiet", action="store_const", dest="output", const="quiet", default="text",
+                              help="Do not print the results")
+    output_group.add_argument("--json", action="store_const", dest="output", const="json",
+                              help="Print the results as JSON")
     subparsers = parser.add_subparsers(dest="command", description="Available commands", )
 
     # Subparser for 'habit-add' command
@@ -17,7 +162,8 @@ if __name__ == '__main__':
     # subparser for habit-delete command
     habit_delete_parser = subparsers.add_parser("habit-delete", description="Delete an existed habit",
                                                 help="Delete an existed habit")
-    habit_delete_parser.add_argument("--name", required=True, help="Type the name of a habit to delete")
+    habit_delete_parser.add_argument("--name", required=True, action="append",
+                                     help="Type the name of a habit to delete, repeat it to delete several habits")
 
     # subparser for habit-edit command
     habit_edit_parser = subparsers.add_parser("habit-edit", description="Edit a habit", help="Edit a habit")
@@ -30,15 +176,58 @@ if __name__ == '__main__':
                                                    help="Check-off a habit")
     habit_check_off_parser.add_argument("--name", required=True, help="Type the name of a habit to check-off")
 
+    # subparser for check-off of many habits read from stdin
+    habit_check_off_batch_parser = subparsers.add_parser("habit-check-off-batch",
+                                                         description="Check-off habits from NDJSON/CSV events on stdin",
+                                                         help="Check-off habits from NDJSON/CSV events on stdin")
+    habit_check_off_batch_parser.add_argument("--format", default="ndjson", choices=['ndjson', 'csv'],
+                                              help="Type the format of the events")
+    habit_check_off_batch_parser.add_argument("--chunk-size", type=int, default=10000,
+                                              help="Type the amount of events written per transaction")
+
+    # subparser for recompute-streaks
+    recompute_streaks_parser = subparsers.add_parser("recompute-streaks",
+                                                     description="Recompute streaks from the check-off history",
+                                                     help="Recompute streaks from the check-off history")
+    recompute_streaks_parser.add_argument("--name", action="append",
+                                          help="Type the name of a habit to recompute, all habits by default")
+
+    # subparser for habit-stats
+    habit_stats_parser = subparsers.add_parser("habit-stats", description="Prints the statistics of habits",
+                                               help="Prints the statistics of habits")
+    habit_stats_parser.add_argument("--name", help="Type the name of a habit, all habits by default")
+
+    # subparser for rebuild-stats
+    rebuild_stats_parser = subparsers.add_parser("rebuild-stats",
+                                                 description="Rebuild the habit statistics from the check-off history",
+                                                 help="Rebuild the habit statistics from the check-off history")
+
+    # subparser for archive
+    archive_parser = subparsers.add_parser("archive", description="Move old check-offs to the monthly archive",
+                                           help="Move old check-offs to the monthly archive")
+    archive_parser.add_argument("--days", type=int,
+                                help="Type the amount of days check-offs are kept unarchived, 365 by default")
+
+    # subparser for compact
+    compact_parser = subparsers.add_parser("compact", description="Return the free space of the database to the disk",
+                                           help="Return the free space of the database to the disk")
+    compact_parser.add_argument("--pages", type=int, help="Type the maximum amount of pages to free, all by default")
+
     # subparser for get-all
     habit_get_all_parser = subparsers.add_parser("get-all", help="Prints a list of all current habits",
                                                  description="Prints a list of all current habits")
+    habit_get_all_parser.add_argument("--limit", type=int, help="Type the maximum amount of habits to print")
+    habit_get_all_parser.add_argument("--cursor", type=int, default=0,
+                                      help="Type the cursor printed at the end of the previous page")
 
     # subparser for get-all-by-periodicity
     habit_get_all_by_periodicity = subparsers.add_parser("get-all-by-periodicity",
                                                          help="Prints a list of habits with daily/weekly periodicity",
                                                          description="Prints a list of habits with daily/weekly periodicity")
     habit_get_all_by_periodicity.add_argument("--periodicity", required=True, help="Type the periodicity")
+    habit_get_all_by_periodicity.add_argument("--limit", type=int, help="Type the maximum amount of habits to print")
+    habit_get_all_by_periodicity.add_argument("--cursor", type=int, default=0,
+                                              help="Type the cursor printed at the end of the previous page")
 
     # subparser for get-current-longest-streak
     habit_get_current_longest_streak = subparsers.add_parser("current-longest-streak",
@@ -50,34 +239,211 @@ if __name__ == '__main__':
                                                      help="Prints the longest streak for all the time",
                                                      description="Prints the longest streak for all the time")
 
+    # subparser for leaderboard
+    leaderboard_parser = subparsers.add_parser("leaderboard", help="Prints the habits with the highest streaks",
+                                               description="Prints the habits with the highest streaks")
+    leaderboard_parser.add_argument("--top", type=int, default=10, help="Type the amount of habits to print")
+    leaderboard_parser.add_argument("--kind", default="current", choices=['current', 'longest'],
+                                    help="Type which streak to rank by, current or longest of all time")
+    leaderboard_parser.add_argument("--periodicity", choices=['daily', 'weekly'],
+                                    help="Type the periodicity of the habits to rank, all habits by default")
+
     # subparser for get-longest-streak-name
     habit_get_longest_streak_by_name = subparsers.add_parser("longest-streak-by-name",
                                                              description="Prints the longest streak for all the time for the particular habit",
                                                              help="Prints the longest streak for all the time for the particular habit")
     habit_get_longest_streak_by_name.add_argument("--name", required=True, help="Type the name of a habit")
 
+    # subparsers for export and import
+    export_parser = subparsers.add_parser("export", description="Export habits and check-offs to a file",
+                                          help="Export habits and check-offs to a file")
+    export_parser.add_argument("--path", required=True,
+                               help="Type the file of the binary format or the directory of the CSV format")
+    export_parser.add_argument("--format", default="binary", choices=['binary', 'csv'],
+                               help="Type the format of the export")
+    import_parser = subparsers.add_parser("import", description="Import habits and check-offs from an export",
+                                          help="Import habits and check-offs from an export")
+    import_parser.add_argument("--path", required=True,
+                               help="Type the file of the binary format or the directory of the CSV format")
+    import_parser.add_argument("--format", default="binary", choices=['binary', 'csv'],
+                               help="Type the format of the export")
+    import_parser.add_argument("--replace", action="store_true",
+                               help="Delete the existing habits and check-offs before importing")
+
+    # subparser for snapshot
+    snapshot_parser = subparsers.add_parser("snapshot", description="Write a read-only snapshot of the habits",
+                                            help="Write a read-only snapshot of the habits")
+    snapshot_parser.add_argument("--path", default="db/habits.snapshot", help="Type the path of the snapshot")
+
+    # subparser for serve
+    serve_parser = subparsers.add_parser("serve", description="Run the tracker daemon serving the other commands",
+                                         help="Run the tracker daemon serving the other commands")
+    # the commands run with --no-daemon write behind the daemon, which would keep serving stale cached habits
+    serve_parser.add_argument("--cache-size", type=int, default=0,
+                              help="Type the amount of habits kept in the habit cache of the daemon, only safe "
+                                   "when every write goes through the daemon")
+    serve_parser.add_argument("--instrument", action="store_true",
+                              help="Collect method latencies and SQL statement traces, printed by the stats command")
+    serve_parser.add_argument("--slow-query-ms", type=float, default=50.0,
+                              help="Type the duration of the statements logged with their query plan")
+
+    # subparser for stats
+    stats_parser = subparsers.add_parser("stats", description="Print the instrumentation of the tracker daemon",
+                                         help="Print the instrumentation of the tracker daemon")
+    stats_parser.add_argument("--prometheus", action="store_true",
+                              help="Print the Prometheus text exposition format")
+
     arguments = parser.parse_args()
 
+    if arguments.command == 'serve':
+        from src.server import serve
+        from src.tracker import HabitTracker
+
+        instrumentation = None
+        if arguments.instrument:
+            from src.instrumentation import Instrumentation
+
+            instrumentation = Instrumentation(arguments.slow_query_ms)
+        serve(functools.partial(HabitTracker, cache_size=arguments.cache_size, instrumentation=instrumentation),
+              arguments.socket)
+        sys.exit()
+
+    if arguments.command in ('export', 'import'):
+        from src import transfer
+        from src.tracker import HabitTracker
+
+        if arguments.command == 'import':
+            daemon = connect(arguments.socket)
+            if daemon is not None:
+                # the daemon would keep serving its cached view of the replaced habits
+                daemon.close()
+                sys.exit('Stop the tracker daemon before importing')
+            try:
+                counts = transfer.import_history(HabitTracker(), arguments.path, arguments.format, arguments.replace)
+            except ValueError as error:
+                sys.exit(str(error))
+            line = "Imported {habits} habits and {check_offs} check-offs from {path}"
+        else:
+            counts = transfer.export_history(HabitTracker(), arguments.path, arguments.format)
+            line = "Exported {habits} habits and {check_offs} check-offs to {path}"
+        present(counts, arguments.output, [line.format(path=arguments.path, **counts)])
+        sys.exit()
+
+    if arguments.command == 'snapshot':
+        from src.snapshot import write_snapshot
+        from src.tracker import HabitTracker
+
+        count = write_snapshot(HabitTracker(user_id=arguments.user), arguments.path)
+        present(count, arguments.output, ["Snapshot of {} habits is written to {}".format(count, arguments.path)])
+        sys.exit()
+
+    habit_tracker = None
+    if arguments.snapshot:
+        from src.snapshot import SnapshotReader
+
+        if arguments.command not in SNAPSHOT_COMMANDS:
+            sys.exit("{} can not be answered from a snapshot".format(arguments.command))
+        habit_tracker = SnapshotReader(arguments.snapshot)
+        if habit_tracker.is_stale():
+            print("The snapshot is older than the database, run the snapshot command to refresh it", file=sys.stderr)
+    elif not arguments.no_daemon:
+        # commands go to the daemon when it runs, otherwise they are executed in this process
+        habit_tracker = connect(arguments.socket, arguments.user)
+    if habit_tracker is None:
+        from src.tracker import HabitTracker
+
+        habit_tracker = HabitTracker(user_id=arguments.user)
+
+    output = arguments.output
     if arguments.command == "habit-add":
-        habit_tracker.add_habit(arguments.name, arguments.periodicity)
+        result = habit_tracker.add_habit(arguments.name, arguments.periodicity)
+        present(result, output, result_lines(arguments.command, result))
     elif arguments.command == 'habit-delete':
-        habit_tracker.delete_habit(arguments.name)
+        if len(arguments.name) == 1:
+            result = habit_tracker.delete_habit(arguments.name[0])
+            present(result, output, result_lines(arguments.command, result))
+        else:
+            results = habit_tracker.delete_habits(arguments.name)
+            present(results, output, [line for result in results for line in result_lines(arguments.command, result)])
     elif arguments.command == 'habit-edit':
+        name = arguments.name
         if arguments.new_name:
-            habit_tracker.change_name(arguments.name, arguments.new_name)
+            result = habit_tracker.change_name(name, arguments.new_name)
+            present(result, output, result_lines(arguments.command, result))
+            name = result.name
         if arguments.new_periodicity:
-            habit_tracker.change_periodicity(arguments.name, arguments.new_periodicity)
+            result = habit_tracker.change_periodicity(name, arguments.new_periodicity)
+            present(result, output, result_lines(arguments.command, result))
     elif arguments.command == 'habit-check-off':
-        habit_tracker.check_off(arguments.name)
+        result = habit_tracker.check_off(arguments.name)
+        present(result, output, result_lines(arguments.command, result))
+    elif arguments.command == 'habit-check-off-batch':
+        totals = habit_tracker.check_off_many(read_events(sys.stdin, arguments.format), arguments.chunk_size)
+        present(totals, output, ["Checked off {checked} events, skipped {skipped} events, "
+                                 "{unknown} events of unknown habits".format(**totals)])
+    elif arguments.command == 'recompute-streaks':
+        habit_ids = habit_tracker.get_habit_ids(arguments.name) if arguments.name else None
+        recomputed = habit_tracker.recompute_streaks(habit_ids)
+        present(recomputed, output, ["Streaks of {} habits are recomputed".format(recomputed)])
+    elif arguments.command == 'habit-stats':
+        if arguments.name:
+            stats = habit_tracker.get_stats(arguments.name)
+            lines = ['You do not have habit with name "{}"'.format(arguments.name)] if stats is None else \
+                [STATS_MESSAGE.format(**stats.as_dict())]
+        else:
+            stats = habit_tracker.get_stats_all()
+            lines = [STATS_MESSAGE.format(**habit.as_dict()) for habit in stats] or ["You don't have habits"]
+        present(stats, output, lines)
+    elif arguments.command == 'stats':
+        # the measurements live in the process of the tracker, only the daemon lives long enough to collect them
+        info = habit_tracker.instrumentation_info(arguments.prometheus)
+        if info is None:
+            sys.exit("Instrumentation is off, start the tracker daemon with serve --instrument")
+        if arguments.prometheus:
+            print(info, end='')
+        else:
+            present(info, output, stats_lines(info))
+    elif arguments.command == 'archive':
+        archived = habit_tracker.archive(arguments.days)
+        present(archived, output, ["Archived {check_offs} check-offs before {cutoff} into {masks} monthly masks"
+                                   .format(**archived)])
+    elif arguments.command == 'compact':
+        compacted = habit_tracker.compact(arguments.pages)
+        lines = ["Freed {freed_pages} pages of {page_size} bytes, {free_pages} free pages are left".format(**compacted)]
+        if compacted['vacuumed']:
+            lines.insert(0, "The database is rebuilt to free space incrementally from now on")
+        present(compacted, output, lines)
+    elif arguments.command == 'rebuild-stats':
+        rebuilt = habit_tracker.rebuild_stats()
+        present(rebuilt, output, ["Statistics of {} habits are rebuilt".format(rebuilt)])
     elif arguments.command == 'get-all':
-        habit_tracker.get_all_habits()
+        batch_size = min(arguments.limit or 1000, 1000)
+        stream_habits(habit_tracker.iter_habits(None, batch_size, arguments.cursor), output,
+                      "Name - {}; periodicity - {}, created - {}", arguments.limit)
     elif arguments.command == 'get-all-by-periodicity':
-        habit_tracker.get_all_by_periodicity(arguments.periodicity)
+        batch_size = min(arguments.limit or 1000, 1000)
+        count = stream_habits(habit_tracker.iter_habits(arguments.periodicity, batch_size, arguments.cursor), output,
+                              "Name - {}; periodicity - {}; creation date - {}", arguments.limit)
+        if not count and output == 'text':
+            print('No habits were found with "{}" periodicity'.format(arguments.periodicity))
     elif arguments.command == 'current-longest-streak':
-        habit_tracker.get_current_longest_streak()
+        habits = habit_tracker.get_current_longest_streak()
+        lines = ["Current longest streak {}, name {}".format(*habit) for habit in habits]
+        present(habits, output, lines or ["You don't have habits"])
     elif arguments.command == 'longest-streak-for-all-time':
-        habit_tracker.get_longest_streak()
+        habits = habit_tracker.get_longest_streak()
+        lines = ['Longest streak for all time is equal to {}, habit name "{}"'.format(*habit) for habit in habits]
+        present(habits, output, lines or ["You don't have habits"])
+    elif arguments.command == 'leaderboard':
+        habits = habit_tracker.top_streaks(arguments.top, arguments.kind, arguments.periodicity)
+        lines = ["{}. {} ({}) - {}".format(rank, *habit[1:]) for rank, habit in enumerate(habits, start=1)]
+        present(habits, output, lines or ["You don't have habits"])
     elif arguments.command == 'longest-streak-by-name':
-        habit_tracker.get_longest_streak_by_name(arguments.name)
+        streak = habit_tracker.get_longest_streak_by_name(arguments.name)
+        if streak is None:
+            lines = ['You do not have habit with name "{}"'.format(arguments.name)]
+        else:
+            lines = ['Longest streak for "{}" habit is equal to {}'.format(arguments.name, streak)]
+        present(streak, output, lines)
     else:
         parser.print_help()
@@ -0,0 +1,150 @@
+"""
+Vectorized analytics over the check-off history of all habits.
+
+The history is read once into compact NumPy arrays sorted by habit and date, and every report is computed
+for all habits at once with array operations instead of Python loops over check-off rows.
+Requires NumPy, which the rest of the tracker does not need.
+
+    history = CheckOffHistory.load(tracker.conn)
+    habit_ids, current, longest = streaks(history)
+"""
+import datetime
+import itertools
+
+import numpy as np
+
+from src.tracker import EPOCH_ORDINAL, iter_check_offs
+
+# 1970-01-01, day key 0, is a Thursday
+EPOCH_WEEKDAY = 3
+
+
+class CheckOffHistory:
+    """
+    Check-offs of all habits as parallel arrays sorted by habit_id and day key. `weekly` flags the check-offs
+    of weekly habits, `periods` holds the day key of the check-offs of daily habits and the week key of those
+    of weekly habits.
+    """
+    __slots__ = ('habit_ids', 'day_keys', 'weekly', 'periods')
+
+    def __init__(self, habit_ids, day_keys, weekly):
+        self.habit_ids = habit_ids
+        self.day_keys = day_keys
+        self.weekly = weekly
+        self.periods = np.where(weekly, (day_keys + EPOCH_WEEKDAY) // 7, day_keys).astype(np.int32)
+
+    @classmethod
+    def load(cls, conn):
+        """
+        Reads the check-offs of the existing habits in one scan of the check-off index, merged with the archived
+        check-offs.
+        :param conn: sqlite3.Connection to the tracker database.
+        :return: CheckOffHistory
+        """
+        habits = conn.execute("SELECT habit_id, periodicity = 'weekly' FROM habits_table ORDER BY habit_id")
+        habits = np.fromiter(itertools.chain.from_iterable(habits), dtype=np.int32).reshape(-1, 2)
+        rows = iter_check_offs(conn)
+        columns = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int32).reshape(-1, 2)
+        habit_ids, day_keys = columns[:, 0], columns[:, 1]
+        # periodicities are looked up here rather than joined per row, which costs a quarter of the read
+        index = np.searchsorted(habits[:, 0], habit_ids).clip(max=max(len(habits) - 1, 0))
+        exists = habits[index, 0] == habit_ids if len(habits) else np.zeros(len(habit_ids), dtype=bool)
+        return cls(habit_ids[exists], day_keys[exists], habits[index[exists], 1].astype(bool))
+
+    def __len__(self):
+        return len(self.habit_ids)
+
+
+def streak_runs(history):
+    """
+    Splits the history of every habit into streaks: runs of check-offs in consecutive periods.
+    Several check-offs in one period count once.
+    :param history: CheckOffHistory
+    :return: A tuple of arrays (habit_ids, last_periods, lengths) with one entry per streak,
+             ordered by habit and time.
+    """
+    habit_ids, periods = history.habit_ids, history.periods
+    if not len(habit_ids):
+        empty = np.empty(0, dtype=np.int32)
+        return empty, empty, empty
+    new_habit = np.empty(len(habit_ids), dtype=bool)
+    new_habit[0] = True
+    np.not_equal(habit_ids[1:], habit_ids[:-1], out=new_habit[1:])
+    step = np.diff(periods, prepend=periods[0])
+    # drop repeated check-offs of a period
+    keep = new_habit | (step != 0)
+    habit_ids, periods, new_habit = habit_ids[keep], periods[keep], new_habit[keep]
+
+    starts = np.flatnonzero(new_habit | (np.diff(periods, prepend=periods[0]) != 1))
+    ends = np.append(starts[1:], len(periods)) - 1
+    return habit_ids[starts], periods[ends], (ends - starts + 1).astype(np.int32)
+
+
+def streaks(history):
+    """
+    Computes the streaks of all habits like HabitTracker.recompute_streaks does.
+    :param history: CheckOffHistory
+    :return: A tuple of arrays (habit_ids, current_streaks, longest_streaks) with one entry per checked-off habit,
+             the current streak being the streak of the last check-off.
+    """
+    run_habit_ids, _, lengths = streak_runs(history)
+    if not len(run_habit_ids):
+        return run_habit_ids, lengths, lengths
+    firsts = np.flatnonzero(np.diff(run_habit_ids, prepend=run_habit_ids[0] - 1))
+    lasts = np.append(firsts[1:], len(run_habit_ids)) - 1
+    return run_habit_ids[firsts], lengths[lasts], np.maximum.reduceat(lengths, firsts)
+
+
+def streak_length_distribution(history):
+    """
+    :param history: CheckOffHistory
+    :return: An array whose element i is the amount of streaks of length i over all habits.
+    """
+    return np.bincount(streak_runs(history)[2])
+
+
+def completion_heatmap(history, start, end):
+    """
+    Counts the check-offs of all habits per day, laid out as a calendar of weeks from Monday to Sunday.
+    :param history: CheckOffHistory
+    :param start: The first date of the heatmap.
+    :param end: The last date of the heatmap.
+    :return: An int array of shape (weeks, 7); days outside [start, end] are 0.
+    """
+    first_day = start.toordinal() - EPOCH_ORDINAL
+    last_day = end.toordinal() - EPOCH_ORDINAL
+    # start the calendar on the Monday of the first day
+    calendar_start = first_day - (first_day + EPOCH_WEEKDAY) % 7
+    weeks = (last_day - calendar_start) // 7 + 1
+    day_keys = history.day_keys
+    day_keys = day_keys[(day_keys >= first_day) & (day_keys <= last_day)]
+    return np.bincount(day_keys - calendar_start, minlength=weeks * 7).reshape(weeks, 7)
+
+
+def weekday_completion(history, today=None):
+    """
+    Computes per weekday which share of the days the daily habits were checked-off, counting the days of every
+    habit from its first check-off to today.
+    :param history: CheckOffHistory
+    :param today: The last day to count, today by default.
+    :return: A tuple of arrays (habit_ids, ratios, overall): the ratios of every daily habit with the shape
+             (habits, 7), Monday first, and the ratios of all daily habits together with the shape (7,).
+    """
+    today = today or datetime.date.today()
+    habit_ids, day_keys = history.habit_ids[~history.weekly], history.day_keys[~history.weekly]
+    if not len(habit_ids):
+        return habit_ids, np.zeros((0, 7)), np.zeros(7)
+    firsts = np.flatnonzero(np.diff(habit_ids, prepend=habit_ids[0] - 1))
+    habit_index = np.cumsum(np.diff(habit_ids, prepend=habit_ids[0]) != 0)
+    weekdays = (day_keys + EPOCH_WEEKDAY) % 7
+    checked = np.bincount(habit_index * 7 + weekdays, minlength=len(firsts) * 7).reshape(-1, 7)
+
+    # days d in [first, last] with (d + EPOCH_WEEKDAY) % 7 == weekday, for every habit and weekday
+    first = day_keys[firsts][:, None].astype(np.int64)
+    last = today.toordinal() - EPOCH_ORDINAL
+    residue = (np.arange(7) - EPOCH_WEEKDAY) % 7
+    days = (last - residue) // 7 - (first - 1 - residue) // 7
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = np.where(days > 0, checked / days, 0.0)
+        overall = np.where(days.sum(axis=0) > 0, checked.sum(axis=0) / days.sum(axis=0), 0.0)
+    return habit_ids[firsts], ratios, overall
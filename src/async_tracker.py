@@ -0,0 +1,176 @@
+"""
+asyncio front-end of the habit tracker.
+
+AsyncHabitTracker owns a HabitTracker living on a dedicated worker thread, so the blocking SQLite calls never
+run on the event loop. Check-offs requested concurrently by many coroutines are coalesced: all of those waiting
+when the worker becomes free are applied in one BEGIN IMMEDIATE transaction with a single commit.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from src.tracker import HabitTracker
+
+
+def _in_executor(method):
+    """
+    Creates an awaitable version of a HabitTracker method that runs on the worker thread.
+    :param method: The name of the HabitTracker method.
+    :return: A coroutine function returning the result of the method.
+    """
+    async def run_in_executor(self, *args, **kwargs):
+        call = functools.partial(getattr(self.tracker, method), *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+    run_in_executor.__name__ = method
+    run_in_executor.__doc__ = getattr(HabitTracker, method).__doc__
+    return run_in_executor
+
+
+class AsyncHabitTracker:
+    """
+    Awaitable version of HabitTracker for asyncio applications.
+    All methods run one by one on a single worker thread that owns the SQLite connection,
+    while check_off calls of concurrent coroutines are group-committed.
+    """
+
+    def __init__(self, db_path="db/habits_table.db", max_group_size=1000, **kwargs):
+        """
+        :param db_path: The database of the tracker.
+        :param max_group_size: The maximum amount of check-offs committed together.
+        :param kwargs: Other arguments of HabitTracker, such as clock and cache_size.
+        """
+        self.tracker = None
+        self.max_group_size = max_group_size
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='habit-async',
+                                           initializer=self._start_tracker, initargs=(db_path, kwargs))
+        # create the tracker right away, so a broken database fails the constructor
+        self.executor.submit(int).result()
+
+        # check-offs waiting for the next group commit, as (name, future) pairs
+        self.pending = []
+        self.flusher = None
+        # the amount of group commits and of the check-offs they contained
+        self.group_commits = 0
+        self.grouped_check_offs = 0
+
+    def _start_tracker(self, db_path, kwargs):
+        self.tracker = HabitTracker(db_path, **kwargs)
+
+    add_habit = _in_executor('add_habit')
+    delete_habit = _in_executor('delete_habit')
+    delete_habits = _in_executor('delete_habits')
+    change_name = _in_executor('change_name')
+    change_periodicity = _in_executor('change_periodicity')
+    check_off_many = _in_executor('check_off_many')
+    recompute_streaks = _in_executor('recompute_streaks')
+    rebuild_stats = _in_executor('rebuild_stats')
+    rebuild_bitmaps = _in_executor('rebuild_bitmaps')
+    archive = _in_executor('archive')
+    compact = _in_executor('compact')
+    cache_info = _in_executor('cache_info')
+    instrumentation_info = _in_executor('instrumentation_info')
+    get_habit_ids = _in_executor('get_habit_ids')
+    get_habits_page = _in_executor('get_habits_page')
+    get_all_habits = _in_executor('get_all_habits')
+    get_all_by_periodicity = _in_executor('get_all_by_periodicity')
+    get_current_longest_streak = _in_executor('get_current_longest_streak')
+    get_longest_streak = _in_executor('get_longest_streak')
+    top_streaks = _in_executor('top_streaks')
+    get_longest_streak_by_name = _in_executor('get_longest_streak_by_name')
+    get_stats = _in_executor('get_stats')
+    get_stats_all = _in_executor('get_stats_all')
+    count_check_offs = _in_executor('count_check_offs')
+    get_streak_at = _in_executor('get_streak_at')
+    get_completed_habits = _in_executor('get_completed_habits')
+
+    async def iter_habits(self, periodicity=None, batch_size=1000, after_id=0):
+        """
+        Streams the habits page by page, see HabitTracker.iter_habits.
+        :return: An asynchronous generator of (habit_id, name, periodicity, creation_date) tuples.
+        """
+        while True:
+            page = await self.get_habits_page(periodicity, batch_size, after_id)
+            for habit in page:
+                yield habit
+            if len(page) < batch_size:
+                return
+            after_id = page[-1][0]
+
+    async def check_off(self, name):
+        """
+        Check-off the habit, see HabitTracker.check_off.
+        The check-off is queued and committed together with the check-offs of other coroutines.
+        :param name: The name of the habit to check-off.
+        :return: The result of HabitTracker.check_off.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((name, future))
+        if self.flusher is None or self.flusher.done():
+            self.flusher = loop.create_task(self._flush())
+        return await future
+
+    async def _flush(self):
+        """
+        Applies the queued check-offs group by group until the queue is empty.
+        Check-offs queued while a group is being committed go into the next group.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            group, self.pending = self.pending[:self.max_group_size], self.pending[self.max_group_size:]
+            outcomes = await loop.run_in_executor(self.executor, self._check_off_group, [name for name, _ in group])
+            for (_, future), (result, error) in zip(group, outcomes):
+                if future.done():
+                    # the waiting coroutine was cancelled
+                    continue
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+
+    def _check_off_group(self, names):
+        """
+        Checks-off the habits in one transaction on the worker thread.
+        If any check-off fails, the whole group is rolled back and every check-off is retried in its own
+        transaction, so only the failing one reports the error.
+        :param names: The names of the habits to check-off, in the order of the requests.
+        :return: A list of (result, exception) pairs, one for every name.
+        """
+        tracker = self.tracker
+        tracker.conn.execute('BEGIN IMMEDIATE')
+        try:
+            results = [tracker.check_off(name) for name in names]
+            tracker.conn.commit()
+        except Exception:
+            if tracker.conn.in_transaction:
+                tracker.conn.rollback()
+            # the cache may hold streaks of the rolled back check-offs
+            tracker.habit_cache.invalidate()
+            return [self._check_off_alone(name) for name in names]
+        self.group_commits += 1
+        self.grouped_check_offs += len(names)
+        return [(result, None) for result in results]
+
+    def _check_off_alone(self, name):
+        try:
+            return self.tracker.check_off(name), None
+        except Exception as error:
+            return None, error
+
+    async def close(self):
+        """
+        Waits for the queued check-offs, then stops the worker thread and closes the database connection.
+        :return: None
+        """
+        if self.flusher is not None:
+            await self.flusher
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.tracker.conn.close)
+        self.executor.shutdown()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
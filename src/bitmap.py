@@ -0,0 +1,99 @@
+"""
+Bitmap encoding of the check-off history, kept by every HabitTracker and read by the ones created with
+history_engine='bitmap'.
+
+The history of a habit is a bitset with one bit per period, a day for daily habits and an ISO week for weekly ones,
+numbered by the day and week keys of src/tracker.py. The bitset is stored in habit_bitmap as words of WORD_BITS
+bits, one row per habit and word: bit i of the word w is set when the habit was checked-off in the period
+w * WORD_BITS + i. A check-off sets its bit with one upsert, however long the history is, and the check-offs of a
+range of periods are counted with int.bit_count over the few words covering it instead of a scan of their rows.
+The words are aligned to the key 0 rather than to the creation of the habit, so check-offs before the creation
+date, e.g. imported ones, need no shifting of the bitset, and a habit only has the words it has check-offs in.
+
+SQLite integers are signed, a word with its highest bit set is read as a negative number and masked back here.
+"""
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+
+# Sets the bit of the period :key in the bitset of the habit :habit_id; 6 and 63 are the shift and the mask of WORD_BITS
+SET_BIT_QUERY = """
+    INSERT INTO habit_bitmap (habit_id, word, bits) VALUES (:habit_id, :key >> 6, 1 << (:key & 63))
+    ON CONFLICT (habit_id, word) DO UPDATE SET bits = bits | excluded.bits
+"""
+
+# Fills habit_bitmap from the check-off history, archived check-offs included, of the habits matching {}. Several
+# check-offs of a weekly habit in one week set the same bit, so the periods are made distinct before their bits are
+# summed.
+REBUILD_BITMAPS_QUERY = """
+    INSERT INTO habit_bitmap (habit_id, word, bits)
+    SELECT habit_id, key >> 6, SUM(1 << (key & 63))
+    FROM (SELECT DISTINCT check_off_history.habit_id,
+                 CASE WHEN periodicity = 'daily' THEN day_key ELSE week_key END AS key
+          FROM check_off_history JOIN habits_table ON habits_table.habit_id = check_off_history.habit_id
+          WHERE {})
+    GROUP BY habit_id, key >> 6
+"""
+
+
+def word_of(key):
+    """
+    :param key: A day or week key.
+    :return: The number of the word holding the bit of the period.
+    """
+    return key // WORD_BITS
+
+
+def stored_bits(bits):
+    """
+    :param bits: The bits of a word, between 0 and WORD_MASK.
+    :return: The signed integer SQLite stores the word as.
+    """
+    return bits - (1 << WORD_BITS) if bits >> (WORD_BITS - 1) else bits
+
+
+def count_bits(words, first_key, last_key):
+    """
+    Counts the periods with a check-off in a range.
+    :param words: An iterable of (word number, bits) pairs of one habit covering the range, in any order.
+    :param first_key: The key of the first period of the range.
+    :param last_key: The key of the last period of the range, included.
+    :return: The amount of set bits between the two periods.
+    """
+    count = 0
+    first_word, last_word = word_of(first_key), word_of(last_key)
+    for word, bits in words:
+        if word < first_word or word > last_word:
+            continue
+        bits &= WORD_MASK
+        if word == first_word:
+            bits &= WORD_MASK << (first_key - word * WORD_BITS)
+        if word == last_word:
+            bits &= (1 << (last_key - word * WORD_BITS + 1)) - 1
+        count += bits.bit_count()
+    return count
+
+
+def run_ending(words, key):
+    """
+    Measures the run of consecutive periods with a check-off that ends with a period.
+    :param words: An iterable of (word number, bits) pairs of one habit in descending word order, starting with
+                  the word of the period or a later one; read only as far as the run goes.
+    :param key: The key of the last period of the run.
+    :return: The length of the run, 0 if the period has no check-off.
+    """
+    length = 0
+    expected_word, position = word_of(key), key % WORD_BITS
+    for word, bits in words:
+        if word > expected_word:
+            continue
+        if word < expected_word:
+            # the words in between have no check-offs
+            break
+        # the zero bits at and below the position; without any the run goes on in the previous word
+        gaps = ~bits & ((1 << (position + 1)) - 1)
+        if gaps:
+            return length + position - (gaps.bit_length() - 1)
+        length += position + 1
+        expected_word, position = word - 1, WORD_BITS - 1
+    return length
+
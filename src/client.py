@@ -0,0 +1,92 @@
+"""
+Thin client of the habit tracker daemon (see src/server.py).
+
+It only needs the standard socket and json modules and the result classes, so CLI commands sent to
+a running daemon skip importing sqlite3, opening the database and creating the tables.
+"""
+import json
+import socket
+
+from src import results
+
+DEFAULT_SOCKET_PATH = "db/tracker.sock"
+
+
+class TrackerClient:
+    """
+    Proxy of a HabitTracker living in the daemon. Calling a method of the proxy sends it to the daemon
+    and returns its result.
+    """
+
+    def __init__(self, sock, user_id=None):
+        self.sock = sock
+        # the user the daemon runs the methods for, the user of the daemon's tracker if None
+        self.user_id = user_id
+        self.reader = sock.makefile('r', encoding='utf-8')
+        self.writer = sock.makefile('w', encoding='utf-8')
+
+    def call(self, method, *args, stream=None):
+        """
+        Runs a HabitTracker method in the daemon.
+        :param method: The name of the method.
+        :param args: JSON serializable arguments of the method.
+        :param stream: Optional iterable sent line by line after the request and passed to the method
+                       as its first argument, so large inputs never have to fit into a single message.
+        :return: The result of the method.
+        """
+        request = {'method': method, 'args': args, 'stream': stream is not None}
+        if self.user_id is not None:
+            request['user'] = self.user_id
+        self.writer.write(json.dumps(request) + '\n')
+        if stream is not None:
+            for item in stream:
+                self.writer.write(json.dumps(item) + '\n')
+            self.writer.write('\n')
+        self.writer.flush()
+        response = json.loads(self.reader.readline(), object_hook=results.decode)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def check_off_many(self, events, *args):
+        return self.call('check_off_many', *args, stream=events)
+
+    def iter_habits(self, periodicity=None, batch_size=1000, after_id=0):
+        """
+        Streams the habits of the daemon page by page, see HabitTracker.iter_habits.
+        :return: A generator of (habit_id, name, periodicity, creation_date) tuples.
+        """
+        while True:
+            page = self.call('get_habits_page', periodicity, batch_size, after_id)
+            yield from map(tuple, page)
+            if len(page) < batch_size:
+                return
+            after_id = page[-1][0]
+
+    def __getattr__(self, method):
+        def remote_method(*args):
+            return self.call(method, *args)
+        return remote_method
+
+    def close(self):
+        self.reader.close()
+        self.writer.close()
+        self.sock.close()
+
+
+def connect(socket_path=DEFAULT_SOCKET_PATH, user_id=None):
+    """
+    Connects to the daemon if it is running.
+    :param socket_path: The path of the daemon's Unix-domain socket.
+    :param user_id: The user whose habits the client works on, the user of the daemon's tracker if None.
+    :return: A TrackerClient or None if no daemon listens on the socket.
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return TrackerClient(sock, user_id)
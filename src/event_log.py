@@ -0,0 +1,321 @@
+"""
+Write-ahead event log of check-offs with group commit.
+
+LoggedHabitTracker acknowledges a check-off once it is appended to an append-only log file and fsynced, instead
+of after a SQLite transaction of its own. A writer thread fsyncs the check-offs of all waiting callers together,
+and an applier thread folds the logged check-offs into the database in large transactions through the bulk
+check-off path. The sequence number of the last applied check-off is stored in the same transaction, so the
+check-offs a crash left in the log are applied exactly once when the tracker starts again.
+"""
+import datetime
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+
+from src.instrumentation import instrumented
+from src.pool import PooledHabitTracker, _write
+from src.results import CheckOffResult, Status
+from src.tracker import EPOCH_ORDINAL, day_key
+
+# a log record: sequence number, habit_id and day key of the check-off, followed by the CRC-32 of the three
+PAYLOAD = struct.Struct('<Qqi')
+CHECKSUM = struct.Struct('<I')
+RECORD_SIZE = PAYLOAD.size + CHECKSUM.size
+# the longest wait of the applier thread between failed attempts to apply the log
+MAX_APPLY_BACKOFF = 1.0
+
+
+def read_log(path, after_sequence=0):
+    """
+    Reads the records of an event log. A record torn by a crash and everything after it is cut off the file.
+    :param path: The path of the log.
+    :param after_sequence: The sequence number of the last record already applied.
+    :return: A tuple with a list of the (sequence, habit_id, day_key) records after after_sequence and the highest
+             sequence number in the log, at least after_sequence.
+    """
+    records = []
+    last_sequence = after_sequence
+    try:
+        stream = open(path, 'r+b')
+    except FileNotFoundError:
+        return records, last_sequence
+    with stream:
+        data = stream.read()
+        valid = 0
+        while valid + RECORD_SIZE <= len(data):
+            payload = data[valid:valid + PAYLOAD.size]
+            if zlib.crc32(payload) != CHECKSUM.unpack_from(data, valid + PAYLOAD.size)[0]:
+                break
+            sequence, habit_id, day = PAYLOAD.unpack(payload)
+            last_sequence = max(last_sequence, sequence)
+            if sequence > after_sequence:
+                records.append((sequence, habit_id, day))
+            valid += RECORD_SIZE
+        if valid < len(data):
+            stream.truncate(valid)
+    return records, last_sequence
+
+
+class EventLog:
+    """
+    Append-only file of fixed-size check-off records. Appended records are buffered and written by a writer thread,
+    which fsyncs them as a group once the group holds group_size records or its first record waited for
+    group_interval seconds. With the default interval of 0 a group is written as soon as the previous one is
+    fsynced, and holds the records appended meanwhile; a longer interval makes larger groups on slow disks at
+    the cost of latency.
+    """
+
+    def __init__(self, path, last_sequence=0, group_size=1000, group_interval=0.0):
+        self.path = path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        created = not os.path.exists(path)
+        self.file = open(path, 'ab')
+        if created:
+            # make the new directory entry durable, not just the records written to the file
+            directory = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self.sequence = last_sequence
+        # (sequence, habit_id, day key, record, future) waiting for the next group
+        self.pending = []
+        # (sequence, habit_id, day key) fsynced but not dropped by drop_durable yet, in sequence order
+        self.durable = []
+        self.groups = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.writer = threading.Thread(target=self._write_groups, name='event-log-writer', daemon=True)
+        self.writer.start()
+
+    def submit(self, habit_id, day):
+        """
+        Queues a check-off for the next group.
+        :param habit_id: The id of the checked-off habit.
+        :param day: The day key of the check-off.
+        :return: A Future resolving to the sequence number of the record once it is fsynced.
+        """
+        future = Future()
+        with self.lock:
+            if self.closed:
+                raise ValueError('The event log is closed')
+            self.sequence += 1
+            payload = PAYLOAD.pack(self.sequence, habit_id, day)
+            self.pending.append((self.sequence, habit_id, day, payload + CHECKSUM.pack(zlib.crc32(payload)), future))
+            if len(self.pending) == 1 or len(self.pending) >= self.group_size:
+                self.wakeup.notify()
+        return future
+
+    def append(self, habit_id, day):
+        """
+        Appends a check-off and waits until it is durable.
+        :return: The sequence number of the record.
+        """
+        return self.submit(habit_id, day).result()
+
+    def _write_groups(self):
+        while True:
+            with self.lock:
+                while not self.pending and not self.closed:
+                    self.wakeup.wait()
+                if not self.pending:
+                    return
+                deadline = time.monotonic() + self.group_interval
+                while len(self.pending) < self.group_size and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.wakeup.wait(remaining)
+                group, self.pending = self.pending, []
+            size = self.file.tell()
+            try:
+                self.file.write(b''.join(item[3] for item in group))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except Exception as error:
+                # a partly written group would hide the records appended after it from read_log
+                self.file.truncate(size)
+                for item in group:
+                    item[4].set_exception(error)
+                continue
+            with self.lock:
+                self.groups += 1
+                self.durable.extend(item[:3] for item in group)
+            for item in group:
+                item[4].set_result(item[0])
+
+    def peek_durable(self):
+        """
+        :return: A list of the (sequence, habit_id, day_key) records fsynced and not dropped yet, in sequence order.
+        """
+        with self.lock:
+            return list(self.durable)
+
+    def drop_durable(self, applied_sequence):
+        """
+        Forgets the durable records up to an applied one. Records are only dropped once their transaction has
+        committed, so the ones of a failed transaction are applied again by the next attempt.
+        :param applied_sequence: The sequence number of the last applied record.
+        :return: None
+        """
+        with self.lock:
+            self.durable = [record for record in self.durable if record[0] > applied_sequence]
+
+    def truncate(self, applied_sequence):
+        """
+        Empties the log file if every record in it is applied.
+        :param applied_sequence: The sequence number of the last applied record.
+        :return: True if the log was emptied.
+        """
+        with self.lock:
+            if applied_sequence != self.sequence:
+                return False
+            # by path, as the tracker empties the log after closing it too
+            os.truncate(self.path, 0)
+            return True
+
+    def close(self):
+        """
+        Writes the pending records and closes the log.
+        :return: None
+        """
+        with self.lock:
+            self.closed = True
+            self.wakeup.notify()
+        self.writer.join()
+        self.file.close()
+
+
+class LoggedHabitTracker(PooledHabitTracker):
+    """
+    PooledHabitTracker whose check-offs go through an EventLog. check_off returns as soon as the check-off is
+    durable in the log and the applier thread writes the logged check-offs to the database every apply_interval
+    seconds, so reads see a check-off after a short delay; apply_logged applies them right away.
+    Streaks are computed when the check-offs are applied, like check_off_many does. When applying fails, e.g. on
+    a locked database, the check-offs stay in the log and the applier thread retries them, waiting up to
+    MAX_APPLY_BACKOFF seconds between attempts; apply_error holds the error of the last failed attempt.
+    """
+
+    def __init__(self, db_path="db/habits_table.db", log_path=None, group_size=1000, group_interval=0.0,
+                 apply_interval=0.05, **kwargs):
+        super().__init__(db_path, **kwargs)
+        self.log_path = log_path or db_path + '.events'
+        self.apply_interval = apply_interval
+        self.apply_lock = threading.Lock()
+        self.apply_error = None
+
+        # replay the check-offs a crash left in the log
+        applied_sequence = self.conn.execute('SELECT applied_sequence FROM event_log_state').fetchone()[0]
+        records, last_sequence = read_log(self.log_path, applied_sequence)
+        if records:
+            self.apply_events(records)
+        self.replayed = len(records)
+        self.log = EventLog(self.log_path, last_sequence, group_size, group_interval)
+        self.log.truncate(last_sequence)
+
+        self.stopping = threading.Event()
+        self.applier = threading.Thread(target=self._apply_periodically, name='event-log-applier', daemon=True)
+        self.applier.start()
+
+    def connect(self):
+        """
+        Opens a connection in WAL mode with synchronous=FULL: an applied transaction must be durable before the
+        log records it applied are dropped. The fsync is paid once per applied group of check-offs.
+        :return: sqlite3.Connection
+        """
+        conn = super().connect()
+        conn.execute('PRAGMA synchronous = FULL')
+        return conn
+
+    @instrumented
+    def check_off(self, name):
+        """
+        Logs a check-off of the habit for today and waits until the log is fsynced.
+        :param name: The name of the habit.
+        :return: CheckOffResult with the status LOGGED, or NOT_FOUND if the habit does not exist.
+        """
+        scope, parameters = self._user_scope()
+        habit = self.conn.execute('SELECT habit_id FROM habits_table WHERE name = ?' + scope,
+                                  (name, *parameters)).fetchone()
+        if habit is None:
+            return CheckOffResult(Status.NOT_FOUND, name)
+        self.log.append(habit[0], day_key(self.clock()))
+        return CheckOffResult(Status.LOGGED, name, habit[0])
+
+    def _apply_periodically(self):
+        delay = self.apply_interval
+        while not self.stopping.wait(delay):
+            try:
+                self.apply_logged()
+            except Exception as error:
+                self.apply_error = error
+                delay = min(max(delay, 0.01) * 2, max(MAX_APPLY_BACKOFF, self.apply_interval))
+            else:
+                self.apply_error = None
+                delay = self.apply_interval
+
+    def apply_logged(self):
+        """
+        Applies the check-offs that are durable in the log and not applied yet, and empties the log when
+        nothing else is in it.
+        :return: The amount of applied check-offs.
+        """
+        with self.apply_lock:
+            records = self.log.peek_durable()
+            if records:
+                self.apply_events(records)
+                self.log.drop_durable(records[-1][0])
+                self.log.truncate(records[-1][0])
+        return len(records)
+
+    @_write
+    @instrumented
+    def apply_events(self, records, chunk_size=10000):
+        """
+        Applies logged check-offs in one transaction through the bulk check-off path, together with the sequence
+        number of the last one. Check-offs of deleted habits and repeated check-offs of a period are skipped.
+        :param records: A list of (sequence, habit_id, day_key) records in sequence order.
+        :param chunk_size: The amount of check-offs resolved and written at once.
+        :return: None
+        """
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for start in range(0, len(records), chunk_size):
+                chunk = records[start:start + chunk_size]
+                habit_ids = list({habit_id for _, habit_id, _ in chunk})
+                habits = {habit_id: (user_id, name) for habit_id, user_id, name in self.conn.execute(
+                    'SELECT habit_id, user_id, name FROM habits_table WHERE habit_id IN ({})'
+                    .format(','.join('?' * len(habit_ids))), habit_ids)}
+                # names are resolved within the habits of their user, whichever user logged them
+                events = {}
+                for _, habit_id, day in chunk:
+                    if habit_id in habits:
+                        user_id, name = habits[habit_id]
+                        events.setdefault(user_id, []).append(
+                            (name, datetime.date.fromordinal(EPOCH_ORDINAL + day)))
+                for user_id, user_events in events.items():
+                    self.for_user(user_id)._check_off_chunk(user_events)
+            self.conn.execute('UPDATE event_log_state SET applied_sequence = ?', (records[-1][0],))
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def close(self):
+        """
+        Applies the remaining check-offs of the log, then closes the log and the tracker. If applying fails, the
+        check-offs are left in the log and replayed when the tracker starts again.
+        :return: None
+        """
+        self.stopping.set()
+        self.applier.join()
+        self.log.close()
+        try:
+            self.apply_logged()
+        finally:
+            super().close()
@@ -0,0 +1,318 @@
+"""
+Opt-in instrumentation of the HabitTracker methods.
+
+A HabitTracker created with an Instrumentation counts the calls of its public methods and keeps a latency
+histogram of every method. Every SQL statement the methods execute is traced through the trace callback and the
+progress handler of the connection: the statements are grouped by method and by their text with the literals
+replaced by ?, and statements slower than slow_query_ms are kept together with their EXPLAIN QUERY PLAN.
+
+The duration of a statement is measured from the moment SQLite starts running it to the start of the next
+statement of the method, or to the return of the method for the last one. It includes the Python code that
+consumes the rows, and the duration of a COMMIT is the time of its fsync.
+
+Without an Instrumentation the methods only pay for one attribute check, and no callback is installed.
+"""
+import bisect
+import collections
+import functools
+import re
+import sqlite3
+import threading
+import time
+
+# Upper bounds in seconds of the buckets of the latency histograms, the last bucket is unbounded
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Amount of SQLite virtual machine instructions between two calls of the progress handler
+PROGRESS_STEPS = 1000
+
+# Statements EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+# String and number literals, and lists of placeholders such as the names of an IN (...)
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r'\?(?:\s*,\s*\?)+')
+
+
+def normalize(statement):
+    """
+    Turns a traced statement into the key its executions are grouped by.
+    :param statement: The SQL of the statement, with its parameters expanded to literals.
+    :return: The statement with collapsed whitespace, the literals replaced by ? and lists of them by "?, ...".
+    """
+    return PLACEHOLDER_LISTS.sub('?, ...', LITERALS.sub('?', ' '.join(statement.split())))
+
+
+def instrumented(method):
+    """
+    Makes a HabitTracker method report its calls to the instrumentation of the tracker, if it has one.
+    :param method: The HabitTracker method.
+    :return: The wrapped method.
+    """
+    name = method.__name__
+
+    @functools.wraps(method)
+    def timed(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return method(self, *args, **kwargs)
+        return instrumentation.call(name, method, self, args, kwargs)
+    return timed
+
+
+class LatencyHistogram:
+    """Counts durations in the buckets of BUCKETS"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, share):
+        """
+        :param share: The share of the durations at or below the quantile, e.g. 0.99.
+        :return: The upper bound of the bucket of the quantile in seconds, at most the longest duration.
+        """
+        rank = share * self.count
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class StatementStats:
+    """Executions of one statement of a method"""
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.vm_steps = 0
+
+
+class StatementTracer:
+    """
+    Trace callback and progress handler of one connection. The connection is only used by one thread at a time,
+    so the tracer keeps the statement that runs on it.
+    """
+
+    def __init__(self, instrumentation, conn, counter=None):
+        self.instrumentation = instrumentation
+        self.conn = conn
+        # the StatementCounter of the tracker, a connection only has one trace callback
+        self.counter = counter
+        # (method, statement, start time) of the running statement
+        self.current = None
+        self.steps = 0
+        # slow statements of the running method call, explained when it returns
+        self.slow = []
+        self.explaining = False
+        conn.set_trace_callback(self)
+        conn.set_progress_handler(self.progress, PROGRESS_STEPS)
+
+    def __call__(self, statement):
+        now = time.perf_counter()
+        if self.explaining:
+            return
+        if self.counter is not None:
+            self.counter(statement)
+        self.finish(now)
+        method = self.instrumentation.current_method()
+        if method is not None:
+            self.current = method, statement, now
+            self.steps = 0
+            self.instrumentation.local.tracers.add(self)
+
+    def progress(self):
+        self.steps += 1
+        return 0
+
+    def finish(self, now):
+        """
+        Records the running statement as finished.
+        :param now: The time the statement finished at, from time.perf_counter.
+        :return: None
+        """
+        if self.current is None:
+            return
+        method, statement, started = self.current
+        self.current = None
+        seconds = now - started
+        self.instrumentation.record_statement(method, statement, seconds, self.steps * PROGRESS_STEPS)
+        if seconds * 1000 >= self.instrumentation.slow_query_ms:
+            self.slow.append((method, statement, seconds))
+
+    def explain_slow(self):
+        """
+        Adds the slow statements of the finished method call to the slow query log with their query plans.
+        :return: None
+        """
+        slow, self.slow = self.slow, []
+        for method, statement, seconds in slow:
+            plan = None
+            if statement.lstrip().upper().startswith(EXPLAINABLE):
+                self.explaining = True
+                try:
+                    plan = [row[3] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + statement)]
+                except sqlite3.Error as error:
+                    plan = ['EXPLAIN QUERY PLAN failed: {}'.format(error)]
+                finally:
+                    self.explaining = False
+            self.instrumentation.record_slow(method, statement, seconds, plan)
+
+
+class Instrumentation:
+    """
+    Call counts and latency histograms of the HabitTracker methods, statistics of their SQL statements and a log
+    of the slow statements. One instance can be shared by several trackers and threads.
+    """
+
+    def __init__(self, slow_query_ms=50.0, max_slow_queries=100):
+        """
+        :param slow_query_ms: Statements taking at least this many milliseconds are logged with their query plan.
+        :param max_slow_queries: The amount of slow statements kept, the oldest ones are dropped.
+        """
+        self.slow_query_ms = slow_query_ms
+        # method name -> LatencyHistogram
+        self.methods = {}
+        # (method name, normalized statement) -> StatementStats
+        self.statements = {}
+        self.slow_queries = collections.deque(maxlen=max_slow_queries)
+        self.lock = threading.Lock()
+        # the stack of the instrumented methods running on a thread and the tracers of the connections they use
+        self.local = threading.local()
+
+    def trace(self, conn, counter=None):
+        """
+        Installs the statement tracer on a connection of an instrumented tracker.
+        :param conn: sqlite3.Connection
+        :param counter: The StatementCounter of the tracker, called for every statement as well.
+        :return: StatementTracer
+        """
+        return StatementTracer(self, conn, counter)
+
+    def current_method(self):
+        """
+        :return: The name of the innermost instrumented method running on this thread, or None.
+        """
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def call(self, name, method, tracker, args, kwargs):
+        """
+        Runs a method of a tracker and records its duration. When the outermost instrumented method returns, the
+        last statement it ran is finished and its slow statements are explained.
+        :return: The result of the method.
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        outermost = not stack
+        if outermost:
+            self.local.tracers = set()
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            return method(tracker, *args, **kwargs)
+        finally:
+            now = time.perf_counter()
+            stack.pop()
+            with self.lock:
+                histogram = self.methods.get(name)
+                if histogram is None:
+                    histogram = self.methods[name] = LatencyHistogram()
+                histogram.observe(now - started)
+            if outermost:
+                tracers, self.local.tracers = self.local.tracers, set()
+                for tracer in tracers:
+                    tracer.finish(now)
+                    tracer.explain_slow()
+
+    def record_statement(self, method, statement, seconds, vm_steps):
+        key = method, normalize(statement)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats()
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.vm_steps += vm_steps
+
+    def record_slow(self, method, statement, seconds, plan):
+        with self.lock:
+            self.slow_queries.append({'method': method, 'statement': statement, 'ms': round(seconds * 1000, 3),
+                                      'plan': plan})
+
+    def report(self):
+        """
+        Summarizes the collected measurements.
+        :return: A dictionary with the 'methods' by name, each with its 'calls', 'total_ms', 'mean_ms', 'p50_ms',
+                 'p99_ms' and 'max_ms', the 'statements' with the time spent in them, the slowest first, and the
+                 'slow_queries' with their 'plan', the oldest first. p50 and p99 are bucket bounds.
+        """
+        with self.lock:
+            methods = {name: {'calls': histogram.count, 'total_ms': round(histogram.sum * 1000, 3),
+                              'mean_ms': round(histogram.sum * 1000 / histogram.count, 3),
+                              'p50_ms': round(histogram.quantile(0.5) * 1000, 3),
+                              'p99_ms': round(histogram.quantile(0.99) * 1000, 3),
+                              'max_ms': round(histogram.max * 1000, 3)}
+                       for name, histogram in sorted(self.methods.items())}
+            statements = [{'method': method, 'statement': statement, 'calls': stats.calls,
+                           'total_ms': round(stats.seconds * 1000, 3),
+                           'mean_ms': round(stats.seconds * 1000 / stats.calls, 3),
+                           'max_ms': round(stats.max_seconds * 1000, 3), 'vm_steps': stats.vm_steps}
+                          for (method, statement), stats in self.statements.items()]
+            slow_queries = list(self.slow_queries)
+        statements.sort(key=lambda stats: -stats['total_ms'])
+        return {'methods': methods, 'statements': statements, 'slow_queries': slow_queries}
+
+    def prometheus(self):
+        """
+        Renders the measurements in the Prometheus text exposition format.
+        :return: str
+        """
+        lines = ['# HELP habit_tracker_method_duration_seconds Duration of the HabitTracker method calls.',
+                 '# TYPE habit_tracker_method_duration_seconds histogram']
+        with self.lock:
+            for name, histogram in sorted(self.methods.items()):
+                labels = 'method="{}"'.format(_escape(name))
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('habit_tracker_method_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                        labels, bound, cumulative))
+                lines.append('habit_tracker_method_duration_seconds_sum{{{}}} {!r}'.format(labels, histogram.sum))
+                lines.append('habit_tracker_method_duration_seconds_count{{{}}} {}'.format(labels, histogram.count))
+            statements = sorted(self.statements.items())
+            slow_queries = len(self.slow_queries)
+        lines += ['# HELP habit_tracker_statement_duration_seconds Time spent in the SQL statements of the methods.',
+                  '# TYPE habit_tracker_statement_duration_seconds summary']
+        for (method, statement), stats in statements:
+            labels = 'method="{}",statement="{}"'.format(_escape(method), _escape(statement))
+            lines.append('habit_tracker_statement_duration_seconds_sum{{{}}} {!r}'.format(labels, stats.seconds))
+            lines.append('habit_tracker_statement_duration_seconds_count{{{}}} {}'.format(labels, stats.calls))
+        lines += ['# HELP habit_tracker_statement_vm_steps_total SQLite virtual machine steps of the statements, '
+                  'counted in units of {}.'.format(PROGRESS_STEPS),
+                  '# TYPE habit_tracker_statement_vm_steps_total counter']
+        for (method, statement), stats in statements:
+            lines.append('habit_tracker_statement_vm_steps_total{{method="{}",statement="{}"}} {}'.format(
+                _escape(method), _escape(statement), stats.vm_steps))
+        lines += ['# HELP habit_tracker_slow_queries Slow statements in the slow query log.',
+                  '# TYPE habit_tracker_slow_queries gauge',
+                  'habit_tracker_slow_queries {}'.format(slow_queries)]
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,148 @@
+"""
+Thread-safe habit tracker for multi-threaded services.
+
+PooledHabitTracker switches the database to WAL journaling, so readers never wait for the writer, and gives
+every thread its own SQLite connection. Report queries such as get_all_habits run in parallel on the threads
+that call them, while every write is queued to a single writer thread and committed there one at a time.
+"""
+import functools
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.tracker import HabitCache, HabitTracker, configure
+
+
+class LockedHabitCache(HabitCache):
+    """HabitCache that can be shared between threads"""
+
+    def __init__(self, size):
+        super().__init__(size)
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        with self.lock:
+            return super().get(name)
+
+    def put(self, name, entry):
+        with self.lock:
+            super().put(name, entry)
+
+    def invalidate(self, *names):
+        with self.lock:
+            super().invalidate(*names)
+
+
+def _write(method):
+    """
+    Makes a HabitTracker method run on the writer thread of the PooledHabitTracker.
+    :param method: The HabitTracker method that writes to the database.
+    :return: The wrapped method, which waits for the writer and returns the result of the method.
+    """
+    @functools.wraps(method)
+    def run_on_writer(self, *args, **kwargs):
+        if threading.get_ident() == self.writer_ident:
+            return method(self, *args, **kwargs)
+        return self.writer.submit(method, self, *args, **kwargs).result()
+    return run_on_writer
+
+
+def _thread_local(name):
+    """
+    Creates a property whose value is kept per thread.
+    :param name: The attribute name of the value in the thread local storage.
+    :return: property
+    """
+    def get(self):
+        value = getattr(self.local, name, None)
+        if value is None:
+            value = self.conn.cursor()
+            setattr(self.local, name, value)
+        return value
+
+    def set(self, value):
+        setattr(self.local, name, value)
+
+    return property(get, set)
+
+
+class PooledHabitTracker(HabitTracker):
+    """
+    HabitTracker that can be used from many threads at once.
+    Every thread gets its own connection on first use; writes are serialized through a single writer thread.
+    The database has to be a file, an in-memory database can not be shared between connections.
+    """
+
+    def __init__(self, db_path="db/habits_table.db", **kwargs):
+        if db_path == ':memory:':
+            raise ValueError('PooledHabitTracker needs a database file')
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.writer_ident = None
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='habit-writer',
+                                         initializer=self._start_writer)
+        super().__init__(db_path, **kwargs)
+        self.habit_cache = LockedHabitCache(self.habit_cache.size)
+
+    def _start_writer(self):
+        self.writer_ident = threading.get_ident()
+
+    def connect(self):
+        """
+        Opens a connection in WAL mode with synchronous=NORMAL: commits do not wait for an fsync,
+        which happens at checkpoints instead, and a crash can only lose the last transactions.
+        :return: sqlite3.Connection
+        """
+        # closed by close() from whichever thread calls it, otherwise used only by the thread that opened it
+        conn = configure(sqlite3.connect(self.db_path, timeout=30, check_same_thread=False))
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        counter = getattr(self, 'statement_counter', None)
+        instrumentation = getattr(self, 'instrumentation', None)
+        if instrumentation is not None:
+            instrumentation.trace(conn, counter)
+        elif counter is not None:
+            conn.set_trace_callback(counter)
+        with self.connections_lock:
+            self.connections.append(conn)
+        return conn
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self.connect()
+        return conn
+
+    @conn.setter
+    def conn(self, conn):
+        self.local.conn = conn
+
+    habits_cursor = _thread_local('habits_cursor')
+    check_off_cursor = _thread_local('check_off_cursor')
+
+    add_habit = _write(HabitTracker.add_habit)
+    delete_habit = _write(HabitTracker.delete_habit)
+    delete_habits = _write(HabitTracker.delete_habits)
+    change_name = _write(HabitTracker.change_name)
+    change_periodicity = _write(HabitTracker.change_periodicity)
+    check_off = _write(HabitTracker.check_off)
+    check_off_many = _write(HabitTracker.check_off_many)
+    recompute_streaks = _write(HabitTracker.recompute_streaks)
+    rebuild_stats = _write(HabitTracker.rebuild_stats)
+    rebuild_bitmaps = _write(HabitTracker.rebuild_bitmaps)
+    archive = _write(HabitTracker.archive)
+    compact = _write(HabitTracker.compact)
+
+    def close(self):
+        """
+        Stops the writer thread and closes the connections of all threads.
+        The tracker must not be used by any thread afterwards.
+        :return: None
+        """
+        self.writer.shutdown()
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections.clear()
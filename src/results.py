@@ -0,0 +1,104 @@
+"""
+Result objects returned by the HabitTracker methods that change habits, and habit statistics.
+
+They tell the outcomes apart with a Status instead of printed text, so callers can branch on them and
+presentation is left to the caller (see main.py). The module only depends on the standard library,
+so the daemon client can decode results without importing the tracker.
+"""
+import enum
+
+
+class Status(enum.Enum):
+    """Outcome of a habit change or a check-off"""
+    ADDED = 'added'
+    DUPLICATE = 'duplicate'
+    DELETED = 'deleted'
+    RENAMED = 'renamed'
+    PERIODICITY_CHANGED = 'periodicity changed'
+    NOT_FOUND = 'not found'
+    ON_STREAK = 'on streak'
+    STREAK_BROKEN = 'streak broken'
+    ALREADY_CHECKED = 'already checked'
+    LOGGED = 'logged'
+
+
+class Result:
+    """Base of the lightweight result classes, whose fields are listed in __slots__"""
+    __slots__ = ()
+
+    def __init__(self, *args, **kwargs):
+        values = dict(zip(self.__slots__, args), **kwargs)
+        for field in self.__slots__:
+            setattr(self, field, values.get(field))
+
+    def as_dict(self):
+        """
+        :return: The fields of the result as a JSON serializable dictionary, with the status as its value.
+        """
+        fields = {field: getattr(self, field) for field in self.__slots__}
+        if 'status' in fields:
+            fields['status'] = fields['status'].value
+        return fields
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, field) == getattr(other, field)
+                                                 for field in self.__slots__)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join('{}={!r}'.format(field, getattr(self, field))
+                                                              for field in self.__slots__))
+
+
+class HabitResult(Result):
+    """
+    Outcome of adding, deleting or editing a habit.
+    `previous` is the old name of a renamed habit or the old periodicity of a changed one.
+    """
+    __slots__ = ('status', 'name', 'habit_id', 'periodicity', 'previous')
+
+
+class CheckOffResult(Result):
+    """Outcome of a check-off with the streaks of the habit after it"""
+    __slots__ = ('status', 'name', 'habit_id', 'current_streak', 'longest_streak')
+
+    @property
+    def checked_off(self):
+        return self.status in (Status.ON_STREAK, Status.STREAK_BROKEN)
+
+
+class HabitStats(Result):
+    """
+    Statistics of a habit. The check-off dates are ISO dates, None if the habit was never checked-off.
+    The completion rate is the share of the periods since the first check-off that are checked-off.
+    """
+    __slots__ = ('habit_id', 'name', 'periodicity', 'current_streak', 'longest_streak', 'total_check_offs',
+                 'first_check_off', 'last_check_off', 'last_7_days', 'last_30_days', 'completion_rate')
+
+
+RESULT_TYPES = {result_type.__name__: result_type for result_type in (HabitResult, CheckOffResult, HabitStats)}
+
+
+def encode(value):
+    """
+    JSON `default` hook tagging results with their type, so decode() can restore them.
+    :param value: The object the json module can not serialize.
+    :return: A JSON serializable dictionary.
+    """
+    if isinstance(value, Result):
+        return dict(value.as_dict(), result_type=type(value).__name__)
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def decode(fields):
+    """
+    JSON `object_hook` turning the dictionaries written by encode() back into results.
+    :param fields: A decoded JSON object.
+    :return: The result, or the dictionary itself if it is not a result.
+    """
+    result_type = RESULT_TYPES.get(fields.get('result_type'))
+    if result_type is None:
+        return fields
+    fields = {field: fields.get(field) for field in result_type.__slots__}
+    if 'status' in fields:
+        fields['status'] = Status(fields['status'])
+    return result_type(**fields)
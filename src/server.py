@@ -0,0 +1,145 @@
+"""
+Long-running habit tracker daemon.
+
+Keeps one warm HabitTracker behind a Unix-domain socket, so CLI commands do not pay for the interpreter
+imports, the database connection and the schema checks on every invocation. The protocol is JSON lines:
+a request {"method": "check_off", "args": ["running"], "stream": false} is answered by
+{"result": ...} or {"error": "..."}, results of habit changes and check-offs are tagged with their type
+(see src/results.py). When "stream" is true, the request is followed by one JSON line per item of
+the method's first argument and an empty line. The daemon reads the whole stream before running the method,
+which gets the items as a list. A request with a "user" runs the method on the habits of that user instead of
+the user of the daemon's tracker.
+"""
+import contextlib
+import json
+import os
+import signal
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+from src import results
+from src.client import connect
+
+# HabitTracker methods the daemon runs on behalf of clients
+METHODS = frozenset([
+    'add_habit', 'delete_habit', 'delete_habits', 'change_name', 'change_periodicity', 'check_off', 'check_off_many',
+    'recompute_streaks', 'get_habit_ids', 'get_habits_page', 'get_all_habits', 'get_all_by_periodicity',
+    'get_current_longest_streak', 'get_longest_streak', 'top_streaks', 'get_longest_streak_by_name', 'cache_info',
+    'get_stats', 'get_stats_all', 'rebuild_stats', 'instrumentation_info', 'archive', 'compact',
+    'count_check_offs', 'get_streak_at', 'get_completed_habits', 'rebuild_bitmaps',
+])
+
+
+class TrackerRequestHandler(socketserver.StreamRequestHandler):
+    """Serves the requests of one client connection until the client disconnects"""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('A request must be a JSON object')
+                # the stream is read to its end before the request can fail, so its lines are never taken for requests
+                stream = self.read_stream() if request.get('stream') else None
+                args = request.get('args', [])
+                if not isinstance(args, list):
+                    raise ValueError('The arguments of a request must be a JSON array')
+                if stream is not None:
+                    args = [[tuple(item) if isinstance(item, list) else item for item in map(json.loads, stream)],
+                            *args]
+            except ValueError as error:
+                response = {'error': '{}: {}'.format(type(error).__name__, error)}
+            else:
+                response = self.server.dispatch(request.get('method'), args, request.get('user'))
+            self.wfile.write(json.dumps(response, default=results.encode).encode('utf-8') + b'\n')
+
+    def read_stream(self):
+        """
+        Reads the streamed argument of a request up to its end, on the thread of the connection, so a slow client
+        never holds up the worker thread the methods of all clients run on.
+        :return: A list of the lines sent by the client, one JSON item each.
+        """
+        lines = []
+        for line in self.rfile:
+            if not line.strip():
+                break
+            lines.append(line)
+        return lines
+
+
+class TrackerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix-domain socket server of a single HabitTracker. Every client connection is handled by its own thread,
+    while all the tracker methods run one by one on a dedicated worker thread that owns the SQLite connection.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, tracker_factory):
+        if os.path.exists(socket_path):
+            client = connect(socket_path)
+            if client is not None:
+                client.close()
+                raise RuntimeError('A daemon is already serving on {}'.format(socket_path))
+            # left behind by a daemon that did not shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, TrackerRequestHandler)
+        self.socket_path = socket_path
+        self.tracker = None
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tracker',
+                                         initializer=self.start_tracker, initargs=(tracker_factory,))
+        # create the tracker right away, so a broken database fails the start of the daemon
+        self.worker.submit(int).result()
+
+    def start_tracker(self, tracker_factory):
+        self.tracker = tracker_factory()
+
+    def dispatch(self, method, args, user_id=None):
+        """
+        Runs a method of the tracker on the worker thread.
+        :param method: The name of the HabitTracker method.
+        :param args: The arguments of the method.
+        :param user_id: The user to run the method for, the user of the tracker if None.
+        :return: The response to send back to the client.
+        """
+        if method not in METHODS:
+            return {'error': 'Unknown method {}'.format(method)}
+        return self.worker.submit(self.run_method, method, args, user_id).result()
+
+    def run_method(self, method, args, user_id=None):
+        """
+        Runs a method of the tracker.
+        :param method: The name of the HabitTracker method.
+        :param args: The arguments of the method.
+        :param user_id: The user to run the method for, the user of the tracker if None.
+        :return: The response to send back to the client.
+        """
+        tracker = self.tracker if user_id is None else self.tracker.for_user(user_id)
+        try:
+            result = getattr(tracker, method)(*args)
+        except Exception as error:
+            return {'error': '{}: {}'.format(type(error).__name__, error)}
+        return {'result': result}
+
+    def server_close(self):
+        super().server_close()
+        self.worker.submit(self.tracker.conn.close).result()
+        self.worker.shutdown()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+
+
+def serve(tracker_factory, socket_path):
+    """
+    Serves a tracker on the socket until the process is interrupted or terminated.
+    Must be called from the main thread, which receives the signals.
+    :param tracker_factory: Callable creating the HabitTracker to serve, called on the worker thread.
+    :param socket_path: The path of the Unix-domain socket to listen on.
+    :return: None
+    """
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    with TrackerServer(socket_path, tracker_factory) as server:
+        print("Serving habit tracker on {}".format(socket_path))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
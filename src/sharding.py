@@ -0,0 +1,271 @@
+"""
+Habits of many users spread over several SQLite files.
+
+ShardedHabitTracker places every user in one shard, a database file, chosen by consistent hashing of the user id:
+the shards own points of a hash ring and a user belongs to the first point after the hash of its id. All the
+habits of a user live in one shard, so the work for a user is the work of a single HabitTracker, while the shards
+are written to in parallel, each by its own writer. Reads over all users run on every shard at once in a thread
+pool, sqlite3 releases the GIL while a query runs, and the per-shard results are merged.
+
+Adding or removing a shard only moves the users whose ring points change owner, about 1/N of them, instead of
+almost all of them as hashing modulo N would. rebalance() moves them while the shards are offline.
+"""
+import bisect
+import hashlib
+import heapq
+import itertools
+import operator
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from src.pool import PooledHabitTracker
+from src.tracker import STREAK_INDEXES, HabitTracker
+
+
+def ring_hash(key):
+    """
+    :param key: A user id or a ring point name.
+    :return: A 64-bit hash of the key, stable across processes and Python versions.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def shard_name(path):
+    """
+    :param path: The path of a shard database.
+    :return: The name the shard is placed on the ring by, its file name, so moving the files does not move users.
+    """
+    return os.path.basename(path)
+
+
+class HashRing:
+    """Consistent hash ring of shard names, each placed on the ring virtual_nodes times to even out the load"""
+
+    def __init__(self, shards, virtual_nodes=64):
+        points = sorted((ring_hash('{}#{}'.format(shard, number)), shard)
+                        for shard in shards for number in range(virtual_nodes))
+        if not points:
+            raise ValueError('A hash ring needs at least one shard')
+        self.hashes = [point[0] for point in points]
+        self.shards = [point[1] for point in points]
+
+    def shard_for(self, key):
+        """
+        :param key: The user id.
+        :return: The name of the shard owning the first ring point after the hash of the key.
+        """
+        position = bisect.bisect(self.hashes, ring_hash(key))
+        return self.shards[position % len(self.shards)]
+
+
+class ShardedHabitTracker:
+    """
+    Routes the habits of every user to one of several database files.
+    The habits of a user are reached through for_user, a HabitTracker bound to the user in its shard; habit ids are
+    only unique within a shard. get_all_habits and top_streaks read all shards in parallel.
+    """
+
+    def __init__(self, shard_paths, virtual_nodes=64, max_workers=None, **kwargs):
+        """
+        :param shard_paths: The paths of the shard databases, created if missing.
+        :param virtual_nodes: The amount of ring points per shard.
+        :param max_workers: The amount of threads reading the shards, one per shard by default.
+        :param kwargs: Passed to the PooledHabitTracker of every shard.
+        """
+        self.shards = {}
+        for path in shard_paths:
+            name = shard_name(path)
+            if name in self.shards:
+                raise ValueError('Shard file name {} is used twice'.format(name))
+            self.shards[name] = PooledHabitTracker(path, user_id=None, **kwargs)
+        self.ring = HashRing(self.shards, virtual_nodes)
+        self.readers = ThreadPoolExecutor(max_workers=max_workers or len(self.shards),
+                                          thread_name_prefix='shard-reader')
+
+    def shard_for(self, user_id):
+        """
+        :param user_id: The id of the user.
+        :return: The PooledHabitTracker of the shard of the user, working on all users of the shard.
+        """
+        return self.shards[self.ring.shard_for(user_id)]
+
+    def for_user(self, user_id):
+        """
+        :param user_id: The id of the user.
+        :return: The tracker of the shard of the user bound to the user, see HabitTracker.for_user.
+        """
+        return self.shard_for(user_id).for_user(user_id)
+
+    def _read_all(self, query, parameters=()):
+        """
+        Runs a query on every shard in parallel, every reader thread on its own connection of the shard.
+        :return: A list with the rows of every shard.
+        """
+        def read(shard):
+            return shard.conn.execute(query, parameters).fetchall()
+        return list(self.readers.map(read, self.shards.values()))
+
+    def get_all_habits(self):
+        """
+        Retrieves the habits of all users from all shards.
+        :return: A list of (user_id, name, periodicity, creation_date) tuples ordered by user_id, the habits of a
+                 user by habit_id.
+        """
+        rows = self._read_all('SELECT user_id, name, periodicity, creation_date FROM habits_table '
+                              'INDEXED BY habits_user_idx ORDER BY user_id, habit_id')
+        # every user lives in one shard, so a stable sort by user_id keeps the habit_id order of each user; the
+        # sort finds the sorted run of every shard and merges them in C, faster than heapq.merge in Python
+        return sorted(itertools.chain.from_iterable(rows), key=operator.itemgetter(0))
+
+    def top_streaks(self, k=10, kind='current', periodicity=None):
+        """
+        Retrieves the K habits with the highest streaks of all users. Every shard reads its own top K from its
+        streak index and the lists are merged. Habits with equal streaks are ordered by shard, then by habit_id.
+
+        :param k: The amount of habits to return.
+        :param kind: 'current' for the current streaks or 'longest' for the longest streaks of all time.
+        :param periodicity: The periodicity to filter the habits by, all habits by default.
+        :return: A list of (user_id, name, periodicity, streak) tuples, the highest streak first.
+        """
+        if kind not in STREAK_INDEXES:
+            raise ValueError('Unknown streak kind {}, expected one of {}'.format(kind, ', '.join(STREAK_INDEXES)))
+        column, index = STREAK_INDEXES[kind]
+        query = 'SELECT user_id, name, periodicity, {0} FROM habits_table INDEXED BY {1}'.format(column, index)
+        if periodicity is None:
+            parameters = (k,)
+        else:
+            query += ' WHERE periodicity = ?'
+            parameters = (periodicity, k)
+        rows = self._read_all(query + ' ORDER BY {} DESC, habit_id LIMIT ?'.format(column), parameters)
+        return list(heapq.merge(*rows, key=lambda habit: -habit[3]))[:k]
+
+    def close(self):
+        """
+        Stops the reader threads and closes all shards.
+        :return: None
+        """
+        self.readers.shutdown()
+        for shard in self.shards.values():
+            shard.close()
+
+
+def rebalance(shard_paths, new_shard_paths, virtual_nodes=64):
+    """
+    Moves the users to the shards the ring of new_shard_paths places them in, e.g. after adding or removing a
+    shard. No tracker may use the shards meanwhile. The users a target shard receives from one source shard are
+    copied in one transaction and then deleted from the source in another, and a user copied again replaces its
+    earlier copy, so a rebalance interrupted by a crash is finished by running it again.
+    Habits get new habit ids in their new shard.
+
+    :param shard_paths: The paths of the current shards.
+    :param new_shard_paths: The paths of the shards after rebalancing, created if missing. A shard missing from
+                            them gives away all its users and is left empty.
+    :param virtual_nodes: The amount of ring points per shard, as used by the ShardedHabitTracker.
+    :return: A dictionary with the amount of moved 'users' and 'habits'.
+    """
+    targets = {shard_name(path): path for path in new_shard_paths}
+    ring = HashRing(targets, virtual_nodes)
+    for path in new_shard_paths:
+        # creates and migrates the new shards
+        HabitTracker(path).conn.close()
+
+    moved = {'users': 0, 'habits': 0}
+    for source_path in shard_paths:
+        source = HabitTracker(source_path)
+        moves = {}
+        for (user_id,) in source.conn.execute('SELECT DISTINCT user_id FROM habits_table'):
+            target = ring.shard_for(user_id)
+            if target != shard_name(source_path):
+                moves.setdefault(target, []).append((user_id,))
+        for target, users in moves.items():
+            moved['habits'] += _copy_users(source_path, targets[target], users)
+            _delete_users(source.conn, users)
+            moved['users'] += len(users)
+        source.conn.close()
+    return moved
+
+
+def _create_moving_users(conn, users):
+    conn.execute('CREATE TEMP TABLE IF NOT EXISTS moving_users (user_id TEXT PRIMARY KEY)')
+    conn.execute('DELETE FROM moving_users')
+    conn.executemany('INSERT INTO moving_users (user_id) VALUES (?)', users)
+
+
+def _delete_users(conn, users, schema='main'):
+    """
+    Deletes the habits of the users with their check-offs and statistics, within the transaction of the caller
+    when there is one.
+    :param conn: The connection of the database.
+    :param users: A list of (user_id,) tuples.
+    :param schema: The name of the database in the connection.
+    :return: None
+    """
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        _create_moving_users(conn, users)
+        habits = ('SELECT habit_id FROM {}.habits_table WHERE user_id IN (SELECT user_id FROM moving_users)'
+                  .format(schema))
+        conn.execute('DELETE FROM {0}.check_off_table WHERE habit_id IN ({1})'.format(schema, habits))
+        conn.execute('DELETE FROM {0}.check_off_archive WHERE habit_id IN ({1})'.format(schema, habits))
+        conn.execute('DELETE FROM {0}.habit_bitmap WHERE habit_id IN ({1})'.format(schema, habits))
+        conn.execute('DELETE FROM {0}.habit_stats WHERE habit_id IN ({1})'.format(schema, habits))
+        conn.execute('DELETE FROM {}.habits_table WHERE user_id IN (SELECT user_id FROM moving_users)'
+                     .format(schema))
+        if owns_transaction:
+            conn.commit()
+    except Exception:
+        if owns_transaction:
+            conn.rollback()
+        raise
+
+
+def _copy_users(source_path, target_path, users):
+    """
+    Copies the habits, check-offs and statistics of the users from one shard to another in one transaction,
+    replacing what the target holds of them. The rows are copied by SQLite from the attached source database.
+    :return: The amount of copied habits.
+    """
+    conn = sqlite3.connect(target_path)
+    try:
+        conn.execute('ATTACH DATABASE ? AS source', (source_path,))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            _delete_users(conn, users)
+            copied = conn.execute("""INSERT INTO habits_table (name, periodicity, creation_date, current_streak,
+                                                              longest_streak, user_id)
+                                     SELECT name, periodicity, creation_date, current_streak, longest_streak, user_id
+                                     FROM source.habits_table
+                                     WHERE user_id IN (SELECT user_id FROM moving_users)
+                                     ORDER BY habit_id""").rowcount
+            # the old and the new id of every copied habit, matched by user and name
+            conn.execute("""CREATE TEMP TABLE moved_habits AS
+                            SELECT old.habit_id AS old_id, new.habit_id AS new_id
+                            FROM source.habits_table AS old
+                            JOIN main.habits_table AS new ON new.user_id = old.user_id AND new.name = old.name
+                            WHERE old.user_id IN (SELECT user_id FROM moving_users)""")
+            conn.execute("""INSERT INTO check_off_table (habit_id, date)
+                            SELECT new_id, date FROM moved_habits
+                            JOIN source.check_off_table ON check_off_table.habit_id = old_id
+                            ORDER BY new_id, date""")
+            conn.execute("""INSERT INTO check_off_archive (habit_id, month_day_key, days)
+                            SELECT new_id, month_day_key, days FROM moved_habits
+                            JOIN source.check_off_archive ON check_off_archive.habit_id = old_id""")
+            conn.execute("""INSERT INTO habit_bitmap (habit_id, word, bits)
+                            SELECT new_id, word, bits FROM moved_habits
+                            JOIN source.habit_bitmap ON habit_bitmap.habit_id = old_id""")
+            conn.execute("""INSERT INTO habit_stats (habit_id, total_check_offs, first_day_key, last_day_key,
+                                                     recent_day_mask)
+                            SELECT new_id, total_check_offs, first_day_key, last_day_key, recent_day_mask
+                            FROM moved_habits JOIN source.habit_stats ON habit_stats.habit_id = old_id""")
+            conn.execute('DROP TABLE moved_habits')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        conn.execute('DETACH DATABASE source')
+    finally:
+        conn.close()
+    return copied
@@ -0,0 +1,107 @@
+"""
+Accelerated time-travel simulation of habit tracking.
+
+Replays years of synthetic check-off activity for many habits against an in-memory or temporary
+database in seconds, driving the real streak code paths of HabitTracker with a simulated clock.
+
+Run from the repository root:
+    python -m src.simulation --habits 1000 --years 3 [--bulk] [--profile]
+"""
+import argparse
+import cProfile
+import datetime
+import pstats
+import random
+import time
+
+from src.tracker import HabitTracker
+
+
+class SimulatedClock:
+    """Clock for HabitTracker that returns a simulated date instead of the real one"""
+
+    def __init__(self, today):
+        self.today = today
+
+    def __call__(self):
+        return self.today
+
+    def advance(self, days=1):
+        """
+        Moves the simulated date forward.
+        :param days: The amount of days to move.
+        :return: The new simulated date.
+        """
+        self.today += datetime.timedelta(days=days)
+        return self.today
+
+
+def simulate(tracker, clock, habits, days, completion=0.8, bulk=False, seed=0):
+    """
+    Adds the habits and replays the given amount of days of check-offs, advancing the clock after every day.
+    Every habit is checked-off on a day with the `completion` probability; weekly habits are attempted every
+    day as well, so the already-checked path is exercised too.
+
+    :param tracker: HabitTracker to simulate on; its clock must be `clock`.
+    :param clock: The SimulatedClock of the tracker.
+    :param habits: The amount of habits, half of them daily and half weekly.
+    :param days: The amount of days to simulate.
+    :param completion: Probability of a habit being checked-off on a day.
+    :param bulk: Check-off every simulated day with one check_off_many call instead of check_off per habit.
+    :param seed: Seed of the random generator.
+    :return: A dictionary with the amount of simulated 'days', check-off 'attempts' and elapsed 'seconds'.
+    """
+    generator = random.Random(seed)
+    names = ['habit-{}'.format(number) for number in range(habits)]
+    for number, name in enumerate(names):
+        tracker.add_habit(name, ('daily', 'weekly')[number % 2])
+
+    attempts = 0
+    started = time.perf_counter()
+    for _ in range(days):
+        done = [name for name in names if generator.random() < completion]
+        attempts += len(done)
+        if bulk:
+            tracker.check_off_many((name, clock.today) for name in done)
+        else:
+            for name in done:
+                tracker.check_off(name)
+        clock.advance()
+    return {'days': days, 'attempts': attempts, 'seconds': time.perf_counter() - started}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Habit tracking simulation")
+    parser.add_argument("--habits", type=int, default=1000, help="Amount of habits")
+    parser.add_argument("--years", type=float, default=3, help="Amount of years to simulate")
+    parser.add_argument("--completion", type=float, default=0.8, help="Probability of a daily check-off")
+    parser.add_argument("--db-path", default=":memory:", help="Database to simulate on, in memory by default")
+    parser.add_argument("--bulk", action="store_true", help="Check-off with check_off_many once a day")
+    parser.add_argument("--cache-size", type=int, default=0, help="Size of the habit cache of the tracker")
+    parser.add_argument("--profile", action="store_true", help="Print the profile of the simulation")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    arguments = parser.parse_args()
+
+    days = int(arguments.years * 365)
+    clock = SimulatedClock(datetime.date.today() - datetime.timedelta(days=days))
+    tracker = HabitTracker(arguments.db_path, clock=clock, cache_size=arguments.cache_size)
+    profile = cProfile.Profile() if arguments.profile else None
+
+    if profile:
+        profile.enable()
+    result = simulate(tracker, clock, arguments.habits, days, arguments.completion, arguments.bulk,
+                      arguments.seed)
+    if profile:
+        profile.disable()
+
+    rows = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+    print("days: {days}, attempts: {attempts}, seconds: {seconds:.2f}".format(**result))
+    print("check-offs: {}, attempts/sec: {:.0f}".format(rows, result['attempts'] / result['seconds']))
+    if arguments.cache_size:
+        print("habit cache: {hits} hits, {misses} misses".format(**tracker.cache_info()))
+    if profile:
+        pstats.Stats(profile).sort_stats('cumulative').print_stats(15)
+
+
+if __name__ == '__main__':
+    main()
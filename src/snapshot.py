@@ -0,0 +1,319 @@
+"""
+Read-only snapshots of the habits for read-heavy deployments.
+
+write_snapshot() dumps the habits into a compact file that SnapshotReader memory-maps and answers the read-only
+HabitTracker queries from, with hash and binary search over fixed-width records, without SQLite. Opening a reader only maps
+the file, and the pages are shared by all the processes reading the same snapshot through the OS page cache.
+
+File layout, all integers little-endian:
+- HEADER: magic, amount of habits, amount of hash slots, the database_signature of the database when the snapshot
+  was taken and the location of the database path in the string table.
+- RECORD per habit, sorted by the UTF-8 bytes of the name: the location of the name in the string table,
+  habit_id, streaks, period key of the last check-off, the location of the creation date and the periodicity.
+- Three uint32 arrays of record numbers ordering the habits by habit_id, by current streak and by longest
+  streak, the highest streak first and ties by habit_id like the streak indexes of the database.
+- A uint32 open addressing hash table of record numbers with linear probing, keyed by the CRC-32 of the name,
+  which finds a habit by name with one or two probes. A binary search in Python costs as much as the
+  SQLite index lookup it replaces.
+- The string table.
+"""
+import bisect
+import itertools
+import mmap
+import os
+import struct
+import zlib
+
+from src.tracker import STREAK_INDEXES
+
+MAGIC = b'HABITSNP'
+HEADER = struct.Struct('<8sIIIqqqqII')
+RECORD = struct.Struct('<IIqiiiIIB3x')
+# the name location at the start of a record, read by the name lookup
+NAME = struct.Struct('<II')
+# hash slot without a record
+EMPTY_SLOT = 0xFFFFFFFF
+INDEX = struct.Struct('<I')
+
+PERIODICITIES = ('daily', 'weekly')
+# last period of a habit that was never checked-off
+NO_PERIOD = -2 ** 31
+
+SNAPSHOT_QUERY = """
+    SELECT habits_table.habit_id, name, periodicity, creation_date, current_streak, longest_streak, last_day_key
+    FROM habits_table LEFT JOIN habit_stats ON habit_stats.habit_id = habits_table.habit_id
+"""
+
+
+def database_signature(db_path):
+    """
+    :param db_path: The path of the database file.
+    :return: A tuple with the file change counter of the database header, which SQLite increments on every commit
+             outside of WAL mode, and the size and the modification time in ns of the database and of its WAL file,
+             zeros for a missing file. Any committed write changes it.
+    """
+    try:
+        with open(db_path, 'rb') as stream:
+            stream.seek(24)
+            signature = [int.from_bytes(stream.read(4), 'big')]
+    except FileNotFoundError:
+        signature = [0]
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature += [0, 0]
+        else:
+            signature += [stat.st_size, stat.st_mtime_ns]
+    return tuple(signature)
+
+
+def write_snapshot(tracker, path):
+    """
+    Writes a snapshot of the habits of the user of the tracker. The file is written next to the path and moved over it,
+    so readers never see a partial snapshot and keep reading the previous one until they reopen it.
+    :param tracker: HabitTracker with a database file. A tracker of all users needs unique habit names.
+    :param path: The path of the snapshot.
+    :return: The amount of habits in the snapshot.
+    """
+    # taken before reading, so a write committed during the read makes the snapshot stale instead of being missed
+    signature = database_signature(tracker.db_path)
+    if tracker.user_id is None:
+        habits = tracker.conn.execute(SNAPSHOT_QUERY).fetchall()
+    else:
+        habits = tracker.conn.execute(SNAPSHOT_QUERY + ' WHERE user_id = ?', (tracker.user_id,)).fetchall()
+    habits.sort(key=lambda habit: habit[1].encode('utf-8'))
+
+    strings = bytearray()
+
+    def add_string(value):
+        encoded = (value or '').encode('utf-8')
+        strings.extend(encoded)
+        return len(strings) - len(encoded), len(encoded)
+
+    records = bytearray()
+    for habit_id, name, periodicity, creation_date, current_streak, longest_streak, last_day in habits:
+        weekly = periodicity == 'weekly'
+        if last_day is None:
+            last_period = NO_PERIOD
+        else:
+            last_period = (last_day + 3) // 7 if weekly else last_day
+        records += RECORD.pack(*add_string(name), habit_id, current_streak, longest_streak, last_period,
+                               *add_string(creation_date), weekly)
+
+    numbers = range(len(habits))
+    orders = [sorted(numbers, key=lambda number: habits[number][0]),
+              sorted(numbers, key=lambda number: (-habits[number][4], habits[number][0])),
+              sorted(numbers, key=lambda number: (-habits[number][5], habits[number][0]))]
+    # at most half of the slots are used, so the probe sequences stay short
+    slot_count = 1 << (2 * len(habits)).bit_length()
+    slots = [EMPTY_SLOT] * slot_count
+    for number, habit in enumerate(habits):
+        slot = zlib.crc32(habit[1].encode('utf-8')) & (slot_count - 1)
+        while slots[slot] != EMPTY_SLOT:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = number
+    db_path = add_string(os.path.abspath(tracker.db_path))
+
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as stream:
+        stream.write(HEADER.pack(MAGIC, len(habits), slot_count, *signature, *db_path))
+        stream.write(records)
+        for order in orders + [slots]:
+            stream.write(struct.pack('<{}I'.format(len(order)), *order))
+        stream.write(strings)
+    os.replace(temporary_path, path)
+    return len(habits)
+
+
+class _HabitIds:
+    """Sequence of the habit ids of the records in habit_id order, for bisect"""
+
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __len__(self):
+        return self.reader.count
+
+    def __getitem__(self, position):
+        offset = self.reader.orders['habit_id'] + INDEX.size * position
+        number = INDEX.unpack_from(self.reader.map, offset)[0]
+        return RECORD.unpack_from(self.reader.map, self.reader.record_offset(number))[2]
+
+
+class SnapshotReader:
+    """
+    Answers the read-only HabitTracker queries from a snapshot written by write_snapshot.
+    The answers reflect the database at the time of the snapshot, see is_stale.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as stream:
+            self.map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size or self.map[:len(MAGIC)] != MAGIC:
+            self.map.close()
+            raise ValueError('{} is not a habit snapshot'.format(path))
+        _, self.count, self.slot_count, *signature, db_path_offset, db_path_length = HEADER.unpack_from(self.map)
+        self.signature = tuple(signature)
+        index_offset = HEADER.size + RECORD.size * self.count
+        self.orders = {}
+        for order in ('habit_id', 'current', 'longest'):
+            self.orders[order] = index_offset
+            index_offset += INDEX.size * self.count
+        self.slots_offset = index_offset
+        self.strings_offset = index_offset + INDEX.size * self.slot_count
+        self.db_path = self.string(db_path_offset, db_path_length)
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def is_stale(self):
+        """
+        :return: True if the database was written to since the snapshot was taken.
+        """
+        return database_signature(self.db_path) != self.signature
+
+    def record_offset(self, number):
+        return HEADER.size + RECORD.size * number
+
+    def string(self, offset, length):
+        start = self.strings_offset + offset
+        return self.map[start:start + length].decode('utf-8')
+
+    def record(self, number):
+        """
+        :param number: The number of the record.
+        :return: A (habit_id, name, periodicity, creation_date, current_streak, longest_streak, last_period) tuple.
+        """
+        name_offset, name_length, habit_id, current_streak, longest_streak, last_period, date_offset, date_length, \
+            weekly = RECORD.unpack_from(self.map, self.record_offset(number))
+        return (habit_id, self.string(name_offset, name_length), PERIODICITIES[weekly],
+                self.string(date_offset, date_length) or None, current_streak, longest_streak,
+                None if last_period == NO_PERIOD else last_period)
+
+    def ordered(self, order, start=0):
+        """
+        :param order: 'habit_id', 'current' or 'longest'.
+        :param start: The position in the order to start at.
+        :return: A generator of the records in the order.
+        """
+        offset = self.orders[order]
+        for position in range(start, self.count):
+            yield self.record(INDEX.unpack_from(self.map, offset + INDEX.size * position)[0])
+
+    def find(self, name):
+        """
+        Looks a habit up in the hash table of the names.
+        :param name: The name of the habit.
+        :return: The number of the record of the habit, or None if the habit does not exist.
+        """
+        key = name.encode('utf-8')
+        snapshot, mask = self.map, self.slot_count - 1
+        slot = zlib.crc32(key) & mask
+        while True:
+            number = INDEX.unpack_from(snapshot, self.slots_offset + INDEX.size * slot)[0]
+            if number == EMPTY_SLOT:
+                return None
+            offset, length = NAME.unpack_from(snapshot, self.record_offset(number))
+            offset += self.strings_offset
+            if snapshot[offset:offset + length] == key:
+                return number
+            slot = (slot + 1) & mask
+
+    def get_habit(self, name):
+        """
+        :param name: The name of the habit.
+        :return: A (habit_id, name, periodicity, creation_date, current_streak, longest_streak, last_period) tuple,
+                 the last period being the day key or week key of the last check-off, or None if the habit does not
+                 exist.
+        """
+        number = self.find(name)
+        return None if number is None else self.record(number)
+
+    def get_habit_ids(self, names):
+        """
+        :param names: The names of the habits.
+        :return: A list with the ids of the habits that exist.
+        """
+        return [habit[0] for habit in map(self.get_habit, names) if habit is not None]
+
+    def get_longest_streak_by_name(self, name):
+        """
+        :param name: The name of the habit.
+        :return: The longest streak, or None if the habit does not exist.
+        """
+        number = self.find(name)
+        return None if number is None else RECORD.unpack_from(self.map, self.record_offset(number))[4]
+
+    def get_habits_page(self, periodicity=None, limit=1000, after_id=0):
+        """
+        :return: A list of (habit_id, name, periodicity, creation_date) tuples, see HabitTracker.get_habits_page.
+        """
+        return list(itertools.islice(self.iter_habits(periodicity, after_id=after_id), limit))
+
+    def iter_habits(self, periodicity=None, batch_size=1000, after_id=0):
+        """
+        Streams the habits after a habit_id, found by binary search; batch_size is accepted for compatibility
+        with HabitTracker.iter_habits, the snapshot is not read in batches.
+        :return: A generator of (habit_id, name, periodicity, creation_date) tuples.
+        """
+        start = bisect.bisect_right(_HabitIds(self), after_id)
+        for habit in self.ordered('habit_id', start):
+            if periodicity is None or habit[2] == periodicity:
+                yield habit[:4]
+
+    def get_all_habits(self):
+        """
+        :return: A list of (name, periodicity, creation_date) tuples ordered by habit_id.
+        """
+        return [habit[1:4] for habit in self.ordered('habit_id')]
+
+    def get_all_by_periodicity(self, periodicity):
+        """
+        :return: A list of (name, periodicity, creation_date) tuples of the periodicity ordered by habit_id.
+        """
+        return [habit[1:4] for habit in self.ordered('habit_id') if habit[2] == periodicity]
+
+    def _highest(self, kind):
+        field = 4 if kind == 'current' else 5
+        habits = []
+        for habit in self.ordered(kind):
+            if habits and habit[field] != habits[0][0]:
+                break
+            habits.append((habit[field], habit[1]))
+        return habits
+
+    def get_current_longest_streak(self):
+        """
+        :return: A list of (current_streak, name) tuples of the habits with the highest current streak.
+        """
+        return self._highest('current')
+
+    def get_longest_streak(self):
+        """
+        :return: A list of (longest_streak, name) tuples of the habits with the highest streak of all time.
+        """
+        return self._highest('longest')
+
+    def top_streaks(self, k=10, kind='current', periodicity=None):
+        """
+        :return: A list of (habit_id, name, periodicity, streak) tuples, see HabitTracker.top_streaks.
+        """
+        if kind not in STREAK_INDEXES:
+            raise ValueError('Unknown streak kind {}, expected one of {}'.format(kind, ', '.join(STREAK_INDEXES)))
+        field = 4 if kind == 'current' else 5
+        habits = []
+        for habit in self.ordered(kind):
+            if len(habits) == k:
+                break
+            if periodicity is None or habit[2] == periodicity:
+                habits.append((*habit[:3], habit[field]))
+        return habits
+
@@ -1,14 +1,476 @@
+import copy
+import heapq
 import sqlite3
 import datetime
+import itertools
+from collections import OrderedDict
 from sqlite3 import IntegrityError
 
+from src import bitmap
+from src.instrumentation import instrumented
+from src.results import CheckOffResult, HabitResult, HabitStats, Status
+
+# Days covered by the recent_day_mask of habit_stats: bit i is set when the habit was checked-off
+# i days before its last check-off
+RECENT_DAYS = 30
+
+# Check-offs older than this many days are moved to the monthly archive by archive, unless told otherwise
+RETENTION_DAYS = 365
+
+# Fills habit_stats from the whole check-off history of {history}
+REBUILD_STATS_TEMPLATE = """
+    INSERT INTO habit_stats (habit_id, total_check_offs, first_day_key, last_day_key, recent_day_mask)
+    SELECT {history}.habit_id, COUNT(*), MIN({history}.day_key), MAX({history}.day_key),
+           SUM(CASE WHEN last.day_key - {history}.day_key < {days}
+                    THEN 1 << (last.day_key - {history}.day_key) ELSE 0 END)
+    FROM {history}
+    JOIN (SELECT habit_id, MAX(day_key) AS day_key FROM {history} GROUP BY habit_id) AS last
+    ON last.habit_id = {history}.habit_id
+    WHERE {history}.habit_id IN (SELECT habit_id FROM habits_table)
+    GROUP BY {history}.habit_id
+"""
+
+# Used by the migration that adds habit_stats, which runs before the check-off archive exists
+REBUILD_STATS_QUERY = REBUILD_STATS_TEMPLATE.format(history='check_off_table', days=RECENT_DAYS)
+
+# Used by rebuild_stats, reads the check-off table and the archive
+REBUILD_HISTORY_STATS_QUERY = REBUILD_STATS_TEMPLATE.format(history='check_off_history', days=RECENT_DAYS)
+
+# The limit habits after the habit :after with the day key before which their check-offs are archived: the cutoff,
+# or the day of their last check-off, which stays in the check-off table. The third column tells whether the habit
+# has check-offs before it. The first and the last check-off of a habit are seeks on the check-off index.
+ARCHIVE_BOUNDS_QUERY = """
+    SELECT habit_id, MIN(last_day_key, :cutoff), first_day_key < MIN(last_day_key, :cutoff)
+    FROM (SELECT habit_id,
+                 (SELECT MIN(day_key) FROM check_off_table WHERE check_off_table.habit_id = habits_table.habit_id)
+                     AS first_day_key,
+                 (SELECT MAX(day_key) FROM check_off_table WHERE check_off_table.habit_id = habits_table.habit_id)
+                     AS last_day_key
+          FROM habits_table WHERE habit_id > :after ORDER BY habit_id LIMIT :limit)
+"""
+
+# Adds the check-offs of a habit before a day key to the monthly masks of the archive. The days of a month are
+# distinct bits of its mask, so their SUM is their OR, and a month archived by several runs merges its masks.
+ARCHIVE_QUERY = """
+    INSERT INTO check_off_archive (habit_id, month_day_key, days)
+    SELECT habit_id, month_day_key, SUM(1 << (day_key - month_day_key))
+    FROM (SELECT habit_id, day_key, CAST(julianday(date, 'start of month') - 2440587.5 AS INTEGER) AS month_day_key
+          FROM check_off_table WHERE habit_id = ? AND day_key < ?)
+    GROUP BY habit_id, month_day_key
+    ON CONFLICT (habit_id, month_day_key) DO UPDATE SET days = days | excluded.days
+"""
+
+# Counts a check-off of the day :day_key, which is never before the last check-off of the habit, in habit_stats
+UPDATE_STATS_QUERY = """
+    INSERT INTO habit_stats (habit_id, total_check_offs, first_day_key, last_day_key, recent_day_mask)
+    VALUES (:habit_id, 1, :day_key, :day_key, 1)
+    ON CONFLICT (habit_id) DO UPDATE
+    SET total_check_offs = total_check_offs + 1,
+        last_day_key = :day_key,
+        recent_day_mask = CASE WHEN :day_key - last_day_key >= {days} THEN 1
+                               ELSE ((recent_day_mask << (:day_key - last_day_key)) | 1) & {mask} END
+""".format(days=RECENT_DAYS, mask=(1 << RECENT_DAYS) - 1)
+
+# Reads the columns of HabitTracker._habit_stats
+STATS_QUERY = """
+    SELECT habits_table.habit_id, name, periodicity, current_streak, longest_streak,
+           total_check_offs, first_day_key, last_day_key, recent_day_mask
+    FROM habits_table LEFT JOIN habit_stats ON habit_stats.habit_id = habits_table.habit_id
+"""
+
+# Schema migrations applied on top of the base tables, in order. PRAGMA user_version stores
+# how many of them the database has already received, so every script runs exactly once.
+MIGRATIONS = (
+    # 1: drop duplicated check-offs and index check-offs by (habit_id, date), so the last
+    # check-off of a habit is a single seek on a covering index instead of a scan and a sort
+    """
+    DELETE FROM check_off_table
+        WHERE id NOT IN (SELECT MIN(id) FROM check_off_table GROUP BY habit_id, date);
+    CREATE UNIQUE INDEX IF NOT EXISTS check_off_habit_date_idx ON check_off_table (habit_id, date);
+    """,
+    # 2: add the day key (days since 1970-01-01) and the week key (ISO weeks since the week of 1970-01-01) of
+    # every check-off, so "already checked this period" and "next period" are integer comparisons. The keys are
+    # generated columns computed by SQLite from the date, stored in the index that replaces the date index:
+    # it is unique per day and covers both keys and the date.
+    """
+    ALTER TABLE check_off_table ADD COLUMN day_key INTEGER
+        GENERATED ALWAYS AS (CAST(julianday(date) - 2440587.5 AS INTEGER)) VIRTUAL;
+    ALTER TABLE check_off_table ADD COLUMN week_key INTEGER
+        GENERATED ALWAYS AS (CAST((julianday(date, 'weekday 0', '-6 days') - 2440584.5) / 7 AS INTEGER)) VIRTUAL;
+    DROP INDEX IF EXISTS check_off_habit_date_idx;
+    CREATE UNIQUE INDEX check_off_habit_period_idx ON check_off_table (habit_id, day_key, week_key, date);
+    """,
+    # 3: index habits by periodicity; the index stores the habit_id too, so a page of the habits of one periodicity
+    # after a given habit_id is a range seek instead of a scan of the whole table
+    """
+    CREATE INDEX IF NOT EXISTS habits_periodicity_idx ON habits_table (periodicity);
+    """,
+    # 4: index both streaks in descending order, the rowid in the index breaks ties by ascending habit_id, so
+    # the maximum streak is a seek and the top K habits are the first K entries of an index scan
+    """
+    CREATE INDEX IF NOT EXISTS habits_current_streak_idx ON habits_table (current_streak DESC);
+    CREATE INDEX IF NOT EXISTS habits_longest_streak_idx ON habits_table (longest_streak DESC);
+    """,
+    # 5: per-habit statistics kept up to date by every check-off, so reading them does not aggregate the history
+    """
+    CREATE TABLE habit_stats
+        (
+        habit_id INTEGER PRIMARY KEY,
+        total_check_offs INT NOT NULL DEFAULT 0,
+        first_day_key INT,
+        last_day_key INT,
+        recent_day_mask INT NOT NULL DEFAULT 0
+        );
+    """ + REBUILD_STATS_QUERY + ";",
+    # 6: the sequence number of the last check-off event applied from the event log of a LoggedHabitTracker,
+    # written in the transaction that applies the events, so a replay after a crash skips the applied ones
+    """
+    CREATE TABLE event_log_state (id INTEGER PRIMARY KEY CHECK (id = 1), applied_sequence INT NOT NULL);
+    INSERT INTO event_log_state (id, applied_sequence) VALUES (1, 0);
+    """,
+    # 7: the user or tenant owning every habit, '' for the habits created before habits had users, indexed so the
+    # habits of one user are a range seek; the rowid in the index keeps them in habit_id order
+    """
+    ALTER TABLE habits_table ADD COLUMN user_id TEXT NOT NULL DEFAULT '';
+    CREATE INDEX IF NOT EXISTS habits_user_idx ON habits_table (user_id);
+    """,
+    # 8: give every user its own habit names. SQLite can not change a constraint in place, so the habits are
+    # copied into a table with UNIQUE (user_id, name) instead of UNIQUE (name), which keeps the habit ids. Its
+    # index finds a habit of a user by name with one seek. The indexes are created again, along with (user_id, ...)
+    # indexes that keep the listings and the streaks of one user range seeks however many users there are.
+    """
+    CREATE TABLE habits_table_new
+        (
+        habit_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        periodicity TEXT CHECK (periodicity IN ("daily","weekly")),
+        creation_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+        current_streak INT DEFAULT 0,
+        longest_streak INT DEFAULT 0,
+        user_id TEXT NOT NULL DEFAULT '',
+        UNIQUE (user_id, name)
+        );
+    INSERT INTO habits_table_new (habit_id, name, periodicity, creation_date, current_streak, longest_streak, user_id)
+        SELECT habit_id, name, periodicity, creation_date, current_streak, longest_streak, user_id FROM habits_table;
+    DROP TABLE habits_table;
+    ALTER TABLE habits_table_new RENAME TO habits_table;
+    CREATE INDEX habits_periodicity_idx ON habits_table (periodicity);
+    CREATE INDEX habits_current_streak_idx ON habits_table (current_streak DESC);
+    CREATE INDEX habits_longest_streak_idx ON habits_table (longest_streak DESC);
+    CREATE INDEX habits_user_idx ON habits_table (user_id);
+    CREATE INDEX habits_user_periodicity_idx ON habits_table (user_id, periodicity);
+    CREATE INDEX habits_user_current_streak_idx ON habits_table (user_id, current_streak DESC);
+    CREATE INDEX habits_user_longest_streak_idx ON habits_table (user_id, longest_streak DESC);
+    """,
+    # 9: delete the check-offs and statistics of habits deleted before, and rebuild both tables with a foreign key
+    # that deletes them together with their habit. The (habit_id, ...) index of the check-offs lets SQLite find the
+    # check-offs of a deleted habit with one seek.
+    """
+    DELETE FROM check_off_table
+        WHERE NOT EXISTS (SELECT 1 FROM habits_table WHERE habits_table.habit_id = check_off_table.habit_id);
+    DELETE FROM habit_stats
+        WHERE NOT EXISTS (SELECT 1 FROM habits_table WHERE habits_table.habit_id = habit_stats.habit_id);
+    CREATE TABLE check_off_table_new
+        (
+        id INTEGER PRIMARY KEY,
+        habit_id INT NOT NULL REFERENCES habits_table (habit_id) ON DELETE CASCADE,
+        date DATE,
+        day_key INTEGER GENERATED ALWAYS AS (CAST(julianday(date) - 2440587.5 AS INTEGER)) VIRTUAL,
+        week_key INTEGER
+            GENERATED ALWAYS AS (CAST((julianday(date, 'weekday 0', '-6 days') - 2440584.5) / 7 AS INTEGER)) VIRTUAL
+        );
+    INSERT INTO check_off_table_new (id, habit_id, date) SELECT id, habit_id, date FROM check_off_table;
+    DROP TABLE check_off_table;
+    ALTER TABLE check_off_table_new RENAME TO check_off_table;
+    CREATE UNIQUE INDEX check_off_habit_period_idx ON check_off_table (habit_id, day_key, week_key, date);
+    CREATE TABLE habit_stats_new
+        (
+        habit_id INTEGER PRIMARY KEY REFERENCES habits_table (habit_id) ON DELETE CASCADE,
+        total_check_offs INT NOT NULL DEFAULT 0,
+        first_day_key INT,
+        last_day_key INT,
+        recent_day_mask INT NOT NULL DEFAULT 0
+        );
+    INSERT INTO habit_stats_new SELECT habit_id, total_check_offs, first_day_key, last_day_key, recent_day_mask
+        FROM habit_stats;
+    DROP TABLE habit_stats;
+    ALTER TABLE habit_stats_new RENAME TO habit_stats;
+    """,
+    # 10: archive of old check-offs with one row per habit and month, see archive. Bit i of days is set when the
+    # habit was checked-off on the day month_day_key + i, the day key of the first day of the month plus i.
+    # check_off_history reads the check-offs of both tables.
+    """
+    CREATE TABLE check_off_archive
+        (
+        habit_id INT NOT NULL REFERENCES habits_table (habit_id) ON DELETE CASCADE,
+        month_day_key INT NOT NULL,
+        days INT NOT NULL,
+        PRIMARY KEY (habit_id, month_day_key)
+        ) WITHOUT ROWID;
+    CREATE VIEW check_off_history (habit_id, day_key, week_key) AS
+        SELECT habit_id, day_key, week_key FROM check_off_table
+        UNION ALL
+        SELECT habit_id, day_key, (day_key + 3) / 7
+        FROM (WITH RECURSIVE month_days (day) AS (SELECT 0 UNION ALL SELECT day + 1 FROM month_days WHERE day < 30)
+              SELECT habit_id, month_day_key + day AS day_key
+              FROM check_off_archive JOIN month_days ON days >> day & 1);
+    """,
+    # 11: the check-off history of every habit as a bitset of its periods, see src/bitmap.py
+    """
+    CREATE TABLE habit_bitmap
+        (
+        habit_id INT NOT NULL REFERENCES habits_table (habit_id) ON DELETE CASCADE,
+        word INT NOT NULL,
+        bits INT NOT NULL,
+        PRIMARY KEY (habit_id, word)
+        ) WITHOUT ROWID;
+    """,
+    # 12: the bitsets are kept up to date by every check-off from now on, whatever the history engine of the
+    # tracker; the ones left stale by trackers with the table engine, which did not keep them, are rebuilt
+    """
+    DELETE FROM habit_bitmap;
+    """ + bitmap.REBUILD_BITMAPS_QUERY.format('1') + ";",
+)
+
+# Storage engines of the check-off history a HabitTracker can be created with
+HISTORY_ENGINES = ('table', 'bitmap')
+
+# Streak columns of top_streaks and the indexes ordering habits by them
+STREAK_INDEXES = {
+    'current': ('current_streak', 'habits_current_streak_idx'),
+    'longest': ('longest_streak', 'habits_longest_streak_idx'),
+}
+
+# Indexes ordering the habits of one user by their streaks
+USER_STREAK_INDEXES = {
+    'current': 'habits_user_current_streak_idx',
+    'longest': 'habits_user_longest_streak_idx',
+}
+
+
+# Ordinal of 1970-01-01, day keys are counted from it
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def day_key(date):
+    """
+    Converts a date to its day key, the number of days since 1970-01-01.
+    :param date: The date to convert.
+    :return: Integer day key.
+    """
+    return date.toordinal() - EPOCH_ORDINAL
+
+
+def week_key(date):
+    """
+    Converts a date to its week key, the number of ISO weeks (Monday to Sunday) since the week of 1970-01-01.
+    Unlike the ISO week number it keeps growing across years, so consecutive weeks always differ by one.
+    :param date: The date to convert.
+    :return: Integer week key.
+    """
+    # 1970-01-01 is a Thursday, its Monday is 3 days earlier
+    return (date.toordinal() - EPOCH_ORDINAL + 3) // 7
+
+
+def period_key(date, periodicity):
+    """
+    Converts a date to the key of its period for a habit with the given periodicity.
+    :param date: The date to convert.
+    :param periodicity: The periodicity of the habit, daily or weekly.
+    :return: The day key for daily habits and the week key for weekly habits.
+    """
+    return day_key(date) if periodicity == 'daily' else week_key(date)
+
+
+def period_days(first_key, last_key, periodicity):
+    """
+    Converts a range of periods to the range of days they cover.
+    :param first_key: The key of the first period.
+    :param last_key: The key of the last period.
+    :param periodicity: The periodicity of the keys, daily or weekly.
+    :return: The day keys of the first day of the first period and of the last day of the last period.
+    """
+    if periodicity == 'daily':
+        return first_key, last_key
+    # the week key w runs from the Monday 7w - 3 to the Sunday 7w + 3
+    return first_key * 7 - 3, last_key * 7 + 3
+
+
+def to_date(value):
+    """
+    :param value: A datetime.date or an ISO formatted string.
+    :return: datetime.date
+    """
+    return value if isinstance(value, datetime.date) else datetime.date.fromisoformat(value)
+
+
+def is_same_period(last_date, date, periodicity):
+    """
+    Checks if two dates belong to the same period of a habit.
+    :param last_date: The date of the previous check-off.
+    :param date: The date of the new check-off.
+    :param periodicity: The periodicity of the habit, daily or weekly.
+    :return: Boolean. True if both dates are in the same day/week.
+    """
+    return period_key(last_date, periodicity) == period_key(date, periodicity)
+
+
+def is_next_period(last_date, date, periodicity):
+    """
+    Checks if a date belongs to the period right after the period of the previous check-off.
+    :param last_date: The date of the previous check-off.
+    :param date: The date of the new check-off.
+    :param periodicity: The periodicity of the habit, daily or weekly.
+    :return: Boolean. True if the new check-off continues the streak.
+    """
+    return period_key(date, periodicity) - period_key(last_date, periodicity) == 1
+
+
+def iter_check_offs(conn, condition='', parameters=()):
+    """
+    Streams the check-offs of the check-off table and of the archive in (habit_id, day key) order.
+    Both tables are read in the order of their indexes and merged here; the check_off_history view holds the same
+    rows, but SQLite sorts all of them to order it. Without archived check-offs the cursor of the check-off table
+    is returned as it is.
+    :param conn: sqlite3.Connection to the tracker database.
+    :param condition: A WHERE clause on the habit_id column, applied to both tables.
+    :param parameters: The parameters of the condition.
+    :return: An iterator of (habit_id, day key) tuples.
+    """
+    check_offs = conn.execute('SELECT habit_id, day_key FROM check_off_table{} ORDER BY habit_id, day_key'
+                              .format(condition), parameters)
+    archived = conn.execute('SELECT habit_id, month_day_key, days FROM check_off_archive{} '
+                            'ORDER BY habit_id, month_day_key'.format(condition), parameters)
+    first = archived.fetchone()
+    if first is None:
+        return check_offs
+    archived_days = ((habit_id, month_day_key + day)
+                     for habit_id, month_day_key, days in itertools.chain((first,), archived)
+                     for day in range(days.bit_length()) if days >> day & 1)
+    return heapq.merge(archived_days, check_offs)
+
+
+def configure(conn):
+    """
+    Prepares a new connection to a tracker database. Foreign keys are enforced, so deleting a habit deletes its
+    check-offs and statistics. A new database is created with incremental vacuum, which lets compact return free
+    pages to the file system in small steps; the pragma has no effect on a database that already has tables.
+    :param conn: sqlite3.Connection
+    :return: The connection.
+    """
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    conn.execute('PRAGMA foreign_keys = ON')
+    return conn
+
+
+class StatementCounter:
+    """Counts the SQL statements and commits executed on a connection through its trace callback"""
+
+    def __init__(self, conn):
+        self.statements = 0
+        self.commits = 0
+        conn.set_trace_callback(self)
+
+    def __call__(self, statement):
+        self.statements += 1
+        if statement.startswith('COMMIT'):
+            # every commit of a write transaction is at least one fsync of the journal and the database
+            self.commits += 1
+
+
+class HabitCache:
+    """
+    Bounded least-recently-used cache of habit metadata by habit name.
+    An entry is a list [habit_id, periodicity, current_streak, longest_streak, last day key, last week key].
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, name):
+        """
+        Looks up the cached metadata of a habit and marks it as recently used.
+        :param name: The name of the habit.
+        :return: The cache entry or None if the habit is not cached.
+        """
+        if not self.size:
+            return None
+        entry = self.entries.get(name)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return entry
+
+    def put(self, name, entry):
+        """
+        Stores the metadata of a habit, evicting the least recently used habit when the cache is full.
+        :param name: The name of the habit.
+        :param entry: The cache entry.
+        :return: None
+        """
+        if not self.size:
+            return
+        self.entries[name] = entry
+        self.entries.move_to_end(name)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, *names):
+        """
+        Drops the given habits from the cache, or the whole cache if no name is given.
+        :param names: The names of the habits to drop.
+        :return: None
+        """
+        if not names:
+            self.entries.clear()
+        for name in names:
+            self.entries.pop(name, None)
+
 
 class HabitTracker:
     """Habit tracker main class"""
 
-    def __init__(self, db_path="db/habits_table.db"):
+    def __init__(self, db_path="db/habits_table.db", count_statements=False, clock=datetime.date.today, cache_size=0,
+                 user_id='', instrumentation=None, history_engine='table'):
+        if history_engine not in HISTORY_ENGINES:
+            raise ValueError('Unknown history engine {!r}, expected one of {}'.format(
+                history_engine, ', '.join(HISTORY_ENGINES)))
         # Connecting to SQLite
-        self.conn = sqlite3.connect(db_path)
+        self.db_path = db_path
+        self.conn = self.connect()
+
+        # The user whose habits the tracker works on. '' is the default user, which owns the habits of databases
+        # created before habits had users. None works on the habits of all users, e.g. for reports over all of
+        # them; it adds habits to the default user, and habit names are only unique per user, so finding a habit
+        # by name then is neither an index seek nor unambiguous.
+        self.user_id = user_id
+
+        # Callable returning the current date, replaced by simulations and tests to travel in time
+        self.clock = clock
+
+        # Metadata of recently used habits, saves the habit lookup of check_off in long-lived processes.
+        # It is only correct while this tracker is the only writer of the database, so it is disabled by default.
+        self.habit_cache = HabitCache(cache_size)
+
+        # Statement and commit counters of the last check-off, filled only when counting is enabled
+        self.statement_counter = StatementCounter(self.conn) if count_statements else None
+        self.last_check_off_stats = None
+
+        # Call counts, latencies and SQL statement traces of the public methods, see src/instrumentation.py.
+        # Collected only when an Instrumentation is given, which replaces the trace callback of the statement counter.
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            instrumentation.trace(self.conn, self.statement_counter)
+
+        # Where count_check_offs, get_streak_at and get_completed_habits read the check-off history from: 'table'
+        # answers them from the check-off rows, 'bitmap' from the bitsets of the habits, see src/bitmap.py. Every
+        # tracker keeps the bitsets up to date, so trackers with either engine can share a database.
+        self.history_engine = history_engine
 
         # Creating a cursor object using the cursor() method for both tables in order to operate on them respectively
         self.habits_cursor = self.conn.cursor()
@@ -34,153 +496,770 @@ class HabitTracker:
                                 FOREIGN KEY (habit_id) REFERENCES habits_table(habit_id)
                                 )''')
         self.conn.commit()
+        self.migrate()
+
+    def connect(self):
+        """
+        Opens a new connection to the database of the tracker, see configure.
+        :return: sqlite3.Connection
+        """
+        return configure(sqlite3.connect(self.db_path))
+
+    def for_user(self, user_id):
+        """
+        Creates a view of the tracker bound to one user. The view shares the connections of the tracker, so creating
+        it costs no database work, and is closed together with the tracker. It does not use the habit cache.
+        :param user_id: The user whose habits the view works on.
+        :return: A copy of the tracker bound to the user, or the tracker itself if it is bound to the user.
+        """
+        if user_id == self.user_id:
+            return self
+        view = copy.copy(self)
+        view.user_id = user_id
+        view.habit_cache = HabitCache(0)
+        return view
+
+    def _user_scope(self, keyword='AND', table='habits_table'):
+        """
+        Builds the condition limiting the habits to the user of the tracker.
+        :param keyword: The keyword the condition is joined to the query with, AND or WHERE.
+        :param table: The table or alias of habits_table in the query.
+        :return: A tuple with the condition, empty if the tracker is not bound to a user, and its parameters.
+        """
+        if self.user_id is None:
+            return '', ()
+        return ' {} {}.user_id = ?'.format(keyword, table), (self.user_id,)
+
+    def migrate(self):
+        """
+        Brings the database schema up to date by applying the migrations it has not received yet.
+        Each migration runs in its own transaction together with the user_version bump.
+        :return: The schema version of the database.
+        """
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version < len(MIGRATIONS):
+            # tables are rebuilt by copying them and dropping the old one, which must neither cascade to the rows
+            # referencing it nor fail on them; the pragma can only be changed outside a transaction
+            self.conn.execute('PRAGMA foreign_keys = OFF')
+            try:
+                for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+                    self.conn.executescript('BEGIN;{} PRAGMA user_version = {}; COMMIT;'.format(script, number))
+            finally:
+                self.conn.execute('PRAGMA foreign_keys = ON')
+        return len(MIGRATIONS)
 
+    @instrumented
     def add_habit(self, name, periodicity):
         """
         Adds a habit with the provided parameters if it doesn't exist.
-        If it exists - throws an error.
+        If the periodicity is not valid - throws an error.
 
         :param name: habit name
         :param periodicity: habit periodicity
-        :return: habit-id
+        :return: HabitResult with the ADDED status and the habit-id, or the DUPLICATE status if the habit exists.
         """
-        insert_query = """INSERT INTO habits_table (name, periodicity) VALUES(?,?)"""
-        values = name, periodicity
+        insert_query = """INSERT INTO habits_table (name, periodicity, user_id) VALUES(?,?,?)"""
+        values = name, periodicity, '' if self.user_id is None else self.user_id
         try:
             self.habits_cursor.execute(insert_query, values)
             habit_id = self.habits_cursor.lastrowid
             self.conn.commit()
-            print("Habit '{}' with periodicity '{}'is added to the table".format(name, periodicity))
-            return habit_id
+            self.habit_cache.invalidate(name)
+            return HabitResult(Status.ADDED, name, habit_id, periodicity)
         except IntegrityError as sql_err:
             if 'habits_table.name' in str(sql_err):
-                print('Habit with name "{}" already exists'.format(name))
-            else:
-                raise sql_err
+                return HabitResult(Status.DUPLICATE, name)
+            raise sql_err
         except Exception as error:
             raise error
 
+    @instrumented
     def delete_habit(self, name):
         """
-        Deleting of an existed habit from the habits table. If habit does not exist it prints a message indicating so.
+        Deleting of an existed habit from the habits table.
+        Its check-offs and statistics are deleted by SQLite along with it, through the foreign keys.
         :param name: The habits name to delete
-        :return: None
+        :return: HabitResult with the DELETED status, or NOT_FOUND if the habit does not exist.
         """
-        self.habits_cursor.execute("SELECT COUNT(*) FROM habits_table WHERE name = ?", (name,))
-        count = self.habits_cursor.fetchone()[0]
-        if count == 0:
-            print("You don't have this habit")
-        elif count == 1:
-            self.habits_cursor.execute("DELETE FROM habits_table WHERE name = ?", (name,))
-            self.conn.commit()
-            print("Habit '{}' is deleted".format(name))
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute("DELETE FROM habits_table WHERE name = ?{} RETURNING habit_id".format(scope),
+                                   (name, *parameters))
+        deleted = self.habits_cursor.fetchone()
+        self.conn.commit()
+        if deleted is None:
+            return HabitResult(Status.NOT_FOUND, name)
+        self.habit_cache.invalidate(name)
+        return HabitResult(Status.DELETED, name, deleted[0])
+
+    @instrumented
+    def delete_habits(self, names, chunk_size=500):
+        """
+        Deletes many habits in one transaction, with one DELETE per chunk of names. Their check-offs and statistics
+        are deleted by SQLite along with them, through the foreign keys.
+        :param names: The names of the habits to delete.
+        :param chunk_size: The amount of names deleted by one statement.
+        :return: A list with a HabitResult of every distinct name, in the order of the names: DELETED, or NOT_FOUND
+                 if the habit does not exist.
+        """
+        names = list(dict.fromkeys(names))
+        scope, parameters = self._user_scope()
+        deleted = {}
+        owns_transaction = not self.conn.in_transaction
+        if owns_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            for start in range(0, len(names), chunk_size):
+                chunk = names[start:start + chunk_size]
+                self.habits_cursor.execute('DELETE FROM habits_table WHERE name IN ({}){} RETURNING name, habit_id'
+                                           .format(','.join('?' * len(chunk)), scope), (*chunk, *parameters))
+                deleted.update(self.habits_cursor.fetchall())
+            if owns_transaction:
+                self.conn.commit()
+        except Exception:
+            if owns_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            self.habit_cache.invalidate(*deleted)
+        return [HabitResult(Status.DELETED, name, deleted[name]) if name in deleted else
+                HabitResult(Status.NOT_FOUND, name) for name in names]
 
+    @instrumented
     def change_name(self, old_name, new_name):
         """
         Changing the name of an existed habit in the habits table
         :param old_name: The current name of the habit to change.
         :param new_name: The new name to assign to the habit.
-        :return:None
+        :return: HabitResult with the RENAMED status, or NOT_FOUND with the old name if the habit does not exist.
         """
-        update_query = "UPDATE habits_table SET name = ? WHERE name = ?"
-        values = (new_name, old_name)
+        scope, parameters = self._user_scope()
+        update_query = "UPDATE habits_table SET name = ? WHERE name = ?{} RETURNING habit_id".format(scope)
+        values = (new_name, old_name, *parameters)
         self.habits_cursor.execute(update_query, values)
+        renamed = self.habits_cursor.fetchone()
         self.conn.commit()
-        if self.habits_cursor.rowcount > 0:
-            print("Habit name changed from '{}' to '{}'.".format(old_name, new_name))
-        else:
-            print("No habit found with the name '{}'.".format(old_name))
+        self.habit_cache.invalidate(old_name, new_name)
+        if renamed is None:
+            return HabitResult(Status.NOT_FOUND, old_name)
+        return HabitResult(Status.RENAMED, new_name, renamed[0], previous=old_name)
 
+    @instrumented
     def change_periodicity(self, name, new_periodicity):
         """
         Changing the periodicity of an existing habit in the habits table
         :param name: The name of the habit to edit periodicity
         :param new_periodicity: The new periodicity value to set for the habit
-        :return:None
+        :return: HabitResult with the PERIODICITY_CHANGED status and the old periodicity as `previous`,
+                 or NOT_FOUND if the habit does not exist.
         """
-        self.habits_cursor.execute('SELECT periodicity FROM habits_table WHERE name = ?', (name,))
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute('SELECT habit_id, periodicity FROM habits_table WHERE name = ?' + scope,
+                                   (name, *parameters))
         periodicity_info = self.habits_cursor.fetchone()
-        if periodicity_info:
-            old_periodicity = periodicity_info[0]
-            self.habits_cursor.execute("UPDATE habits_table SET periodicity = ? WHERE name = ?",
-                                       (new_periodicity, name))
-            self.conn.commit()
-            print("Habit periodicity changed from '{}' to '{}'.".format(old_periodicity, new_periodicity))
-        else:
-            print("No habit found with the name '{}'.".format(name))
+        if not periodicity_info:
+            return HabitResult(Status.NOT_FOUND, name)
+        habit_id, old_periodicity = periodicity_info
+        self.habits_cursor.execute("UPDATE habits_table SET periodicity = ? WHERE habit_id = ?",
+                                   (new_periodicity, habit_id))
+        # the bits stand for other periods now
+        self._rebuild_bitmaps('habits_table.habit_id = ?', (habit_id,))
+        self.conn.commit()
+        self.habit_cache.invalidate(name)
+        return HabitResult(Status.PERIODICITY_CHANGED, name, habit_id, new_periodicity, old_periodicity)
 
+    @instrumented
     def check_off(self, name):
         """
         Check-off the habit in the check-off table.
-        If the habit does not exist it prints a message respectively.
         If the habit exists, it checks-off in the table check-off, moreover it checks if the habit is on streak.
         If the habit is on streak it adds 1 point to the current streak in the table habits table.
         If the habit is not on streak, it breaks the habit.
         Also, it updates the longest streak value if it is bigger than a current streak.
-        If the habit is already checked-off it prints a message respectively.
+        If the habit does not exist or is already checked-off in the current period, nothing is written.
+
+        The whole check-off is one BEGIN IMMEDIATE transaction: a single read of the habit together with the period
+        keys of its last check-off, one UPDATE ... RETURNING of the streaks, one INSERT and the upserts of the habit
+        statistics and of the bitset of the habit, followed by one commit. The read is skipped when the habit is in
+        the habit cache.
 
         :param name: The name of the habit to check-off.
-        :return: None
+        :return: CheckOffResult with the ON_STREAK, STREAK_BROKEN, ALREADY_CHECKED or NOT_FOUND status.
         """
-        date_today = datetime.date.today()
-        self.habits_cursor.execute('SELECT habit_id, periodicity FROM habits_table WHERE name = ?', (name,))
-        habit_info = self.habits_cursor.fetchone()
-        if habit_info is None:
-            print('Habit with name {} does not exist'.format(name))
-            return
-        habit_id = habit_info[0]
-
-        self.check_off_cursor.execute('SELECT date FROM check_off_table WHERE habit_id = ?', (habit_id,))
-        check_off_info = self.check_off_cursor.fetchone()
-
-        habit_periodicity = habit_info[1]
-
-        if habit_info is not None:
-            if check_off_info:
-                last_check_off = check_off_info[0]
-                last_check_off_date = datetime.datetime.strptime(last_check_off, "%Y-%m-%d").date()
-                diff = date_today - last_check_off_date
-
-                if habit_periodicity == 'daily' and diff.days == 0:
-                    print("You have check the habit today already")
-                    return
-                elif habit_periodicity == 'weekly' and \
-                        last_check_off_date.isocalendar()[1] == date_today.isocalendar()[1]:
-                    print("You have check the habit today already")
-                    return
-
-            if habit_periodicity == "daily":
-                is_on_streak = self.daily_on_streak(habit_id)
-            else:
-                is_on_streak = self.weekly_on_streak(habit_id)
-
-            if is_on_streak:
-                self.habits_cursor.execute('SELECT current_streak, longest_streak FROM habits_table WHERE habit_id = ?',
-                                           (habit_id,))
-                streak_info = self.habits_cursor.fetchone()
-                current_streak = streak_info[0]
-                longest_streak = streak_info[1]
-                updated_streak = current_streak + 1
-                self.habits_cursor.execute('UPDATE habits_table SET current_streak = ? WHERE habit_id = ?',
-                                           (updated_streak, habit_id,))
-                if updated_streak > longest_streak:
-                    self.habits_cursor.execute('UPDATE habits_table SET longest_streak = ? WHERE habit_id = ?',
-                                               (updated_streak, habit_id,))
+        date_today = self.clock()
+        today_day_key, today_week_key = day_key(date_today), week_key(date_today)
+        counter = self.statement_counter
+        if counter is not None:
+            statements, commits = counter.statements, counter.commits
+
+        habit = self.habit_cache.get(name)
+        owns_transaction = not self.conn.in_transaction
+        if owns_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            if habit is None:
+                scope, parameters = self._user_scope()
+                self.habits_cursor.execute("""SELECT habits_table.habit_id, periodicity, current_streak,
+                                                     longest_streak, last.day_key, last.week_key
+                                              FROM habits_table LEFT JOIN check_off_table AS last
+                                              ON last.id = (SELECT id FROM check_off_table
+                                                            WHERE check_off_table.habit_id = habits_table.habit_id
+                                                            ORDER BY day_key DESC LIMIT 1)
+                                              WHERE name = ?{}""".format(scope), (name, *parameters))
+                habit_info = self.habits_cursor.fetchone()
+                if habit_info is None:
+                    if owns_transaction:
+                        self.conn.rollback()
+                    return CheckOffResult(Status.NOT_FOUND, name)
+                habit = list(habit_info)
+                self.habit_cache.put(name, habit)
+            habit_id, habit_periodicity, _, _, last_day_key, last_week_key = habit
+
+            # periods passed since the last check-off, None if the habit was never checked-off
+            distance = None
+            if last_day_key is not None:
+                if habit_periodicity == 'daily':
+                    distance = today_day_key - last_day_key
+                else:
+                    distance = today_week_key - last_week_key
+            if distance is not None and distance <= 0:
+                if owns_transaction:
+                    self.conn.rollback()
+                return CheckOffResult(Status.ALREADY_CHECKED, name, habit_id, habit[2], habit[3])
+            is_on_streak = distance is None or distance == 1
+
+            self.habits_cursor.execute("""UPDATE habits_table
+                                          SET current_streak = CASE WHEN :on_streak THEN current_streak + 1 ELSE 1 END,
+                                              longest_streak = MAX(longest_streak,
+                                                  CASE WHEN :on_streak THEN current_streak + 1 ELSE 1 END)
+                                          WHERE habit_id = :habit_id
+                                          RETURNING current_streak, longest_streak""",
+                                       {'on_streak': is_on_streak, 'habit_id': habit_id})
+            habit[2:4] = self.habits_cursor.fetchone()
+            self.check_off_cursor.execute('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                          (habit_id, date_today.isoformat()))
+            self.check_off_cursor.execute(UPDATE_STATS_QUERY, {'habit_id': habit_id, 'day_key': today_day_key})
+            self.check_off_cursor.execute(bitmap.SET_BIT_QUERY, {
+                'habit_id': habit_id, 'key': today_day_key if habit_periodicity == 'daily' else today_week_key})
+            if owns_transaction:
+                self.conn.commit()
+            habit[4:] = today_day_key, today_week_key
+        except Exception:
+            self.habit_cache.invalidate(name)
+            # the transaction of a caller is left to the caller, with the work it did before
+            if owns_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            if counter is not None:
+                self.last_check_off_stats = {'statements': counter.statements - statements,
+                                             'commits': counter.commits - commits}
+
+        status = Status.ON_STREAK if is_on_streak else Status.STREAK_BROKEN
+        return CheckOffResult(status, name, habit_id, habit[2], habit[3])
+
+    @instrumented
+    def check_off_many(self, events, chunk_size=10000):
+        """
+        Checks-off many habits at once, e.g. when replaying events recorded by a device.
+        Events are consumed lazily in chunks; every chunk resolves its habit names with one query, computes the
+        streak transitions in memory and writes the check-offs and streaks with executemany in one transaction.
+        Within a chunk the events are applied in date order. An event that falls into the period of the habit's
+        last check-off, or before it, is skipped, as well as an event of a habit that does not exist.
+
+        :param events: An iterable of (name, date) pairs, where date is a datetime.date or an ISO formatted string.
+        :param chunk_size: The amount of events written per transaction.
+        :return: A dictionary with the amount of 'checked', 'skipped' and 'unknown' events.
+        """
+        totals = {'checked': 0, 'skipped': 0, 'unknown': 0}
+        events = iter(events)
+        while True:
+            chunk = list(itertools.islice(events, chunk_size))
+            if not chunk:
+                break
+            for key, value in self._check_off_chunk(chunk).items():
+                totals[key] += value
+        return totals
+
+    def _check_off_chunk(self, chunk):
+        """
+        Applies one chunk of check_off_many in a single transaction.
+        :param chunk: A list of (name, date) pairs.
+        :return: A dictionary with the amount of 'checked', 'skipped' and 'unknown' events.
+        """
+        chunk = [(name, date if isinstance(date, datetime.date) else datetime.date.fromisoformat(date))
+                 for name, date in chunk]
+        chunk.sort(key=lambda event: event[1])
+        names = list({name for name, _ in chunk})
+        counts = {'checked': 0, 'skipped': 0, 'unknown': 0}
+        check_offs = []
+        stats = []
+        touched = set()
+
+        scope, parameters = self._user_scope()
+        owns_transaction = not self.conn.in_transaction
+        if owns_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.habits_cursor.execute("""SELECT name, habit_id, periodicity, current_streak, longest_streak,
+                                                 (SELECT CASE habits_table.periodicity
+                                                             WHEN 'daily' THEN day_key ELSE week_key END
+                                                  FROM check_off_table
+                                                  WHERE check_off_table.habit_id = habits_table.habit_id
+                                                  ORDER BY day_key DESC LIMIT 1)
+                                          FROM habits_table WHERE name IN ({}){}""".format(
+                                           ','.join('?' * len(names)), scope), (*names, *parameters))
+            # name -> [habit_id, periodicity, current_streak, longest_streak, period key of the last check-off]
+            habits = {row[0]: list(row[1:]) for row in self.habits_cursor}
+
+            for name, date in chunk:
+                habit = habits.get(name)
+                if habit is None:
+                    counts['unknown'] += 1
+                    continue
+                habit_id, periodicity, current_streak, longest_streak, last_key = habit
+                key = period_key(date, periodicity)
+                if last_key is not None and key <= last_key:
+                    counts['skipped'] += 1
+                    continue
+                if last_key is None or key - last_key == 1:
+                    current_streak += 1
+                else:
+                    current_streak = 1
+                habit[2:] = current_streak, max(longest_streak, current_streak), key
+                check_offs.append((habit_id, date.isoformat()))
+                stats.append({'habit_id': habit_id, 'day_key': day_key(date), 'key': key})
+                touched.add(name)
+
+            self.check_off_cursor.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                              check_offs)
+            self.check_off_cursor.executemany(UPDATE_STATS_QUERY, stats)
+            self.check_off_cursor.executemany(bitmap.SET_BIT_QUERY, stats)
+            self.habits_cursor.executemany('UPDATE habits_table SET current_streak = ?, longest_streak = ? '
+                                           'WHERE habit_id = ?',
+                                           ((habits[name][2], habits[name][3], habits[name][0]) for name in touched))
+            if owns_transaction:
                 self.conn.commit()
-                print("Habit '{}' is on streak".format(name))
-            else:
-                self.habits_cursor.execute('UPDATE habits_table SET current_streak = 1 WHERE habit_id = ?',
-                                           (habit_id,))
+        except Exception:
+            if owns_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            self.habit_cache.invalidate(*touched)
+        counts['checked'] = len(check_offs)
+        return counts
+
+    @instrumented
+    def recompute_streaks(self, habit_ids=None, batch_size=10000):
+        """
+        Recomputes the current and the longest streak of habits from their whole check-off history.
+        Useful after historical imports, deletions of check-offs or fixes of wrong dates, which the incremental
+        streaks maintained by check_off do not notice. The period keys of the history are streamed in (habit_id, day)
+        order with a cursor over the check-off index, merged with the archived check-offs, so every habit is
+        computed in one pass with constant memory.
+        The streaks are written back with executemany in batches, all within one transaction.
+        The current streak is the streak that ends with the last check-off, as check_off would have left it.
+
+        :param habit_ids: The ids of the habits to recompute. All habits of the user of the tracker are recomputed
+                          if None.
+        :param batch_size: The amount of habits written per executemany call.
+        :return: The amount of recomputed habits.
+        """
+        condition, parameters = ' WHERE 1', ()
+        if habit_ids is not None:
+            parameters = tuple(habit_ids)
+            condition += ' AND habit_id IN ({})'.format(','.join('?' * len(parameters)))
+        if self.user_id is not None:
+            # the habits of the user, read in habit_id order from the user index
+            condition += ' AND habit_id IN (SELECT habit_id FROM habits_table WHERE user_id = ?)'
+            parameters += (self.user_id,)
+
+        owns_transaction = not self.conn.in_transaction
+        if owns_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            periodicities = dict(self.conn.execute('SELECT habit_id, periodicity FROM habits_table' + condition,
+                                                   parameters))
+            # habits without check-offs keep these values, the others are overwritten below
+            self.conn.execute('UPDATE habits_table SET current_streak = 0, longest_streak = 0' + condition,
+                              parameters)
+
+            update_query = 'UPDATE habits_table SET current_streak = ?, longest_streak = ? WHERE habit_id = ?'
+            streaks = []
+            habit_id = periodicity = last_key = None
+            current_streak = longest_streak = 0
+            for row_habit_id, day in iter_check_offs(self.conn, condition, parameters):
+                if row_habit_id != habit_id:
+                    if periodicity is not None:
+                        streaks.append((current_streak, longest_streak, habit_id))
+                        if len(streaks) == batch_size:
+                            self.habits_cursor.executemany(update_query, streaks)
+                            streaks.clear()
+                    habit_id, periodicity, last_key = row_habit_id, periodicities.get(row_habit_id), None
+                    current_streak = longest_streak = 0
+                if periodicity is None:
+                    # check-off of a deleted habit
+                    continue
+                key = day if periodicity == 'daily' else (day + 3) // 7
+                if key == last_key:
+                    continue
+                if last_key is not None and key - last_key == 1:
+                    current_streak += 1
+                else:
+                    current_streak = 1
+                if current_streak > longest_streak:
+                    longest_streak = current_streak
+                last_key = key
+            if periodicity is not None:
+                streaks.append((current_streak, longest_streak, habit_id))
+            self.habits_cursor.executemany(update_query, streaks)
+            if owns_transaction:
                 self.conn.commit()
-                print("BROKEN STREAK of the '{}' habit it is equal to 1 ".format(name))
-            insert_query = """INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)"""
-            values = (habit_id, date_today)
-            self.check_off_cursor.execute(insert_query, values)
-            self.conn.commit()
+        except Exception:
+            if owns_transaction:
+                self.conn.rollback()
+            raise
+        finally:
+            self.habit_cache.invalidate()
+        return len(periodicities)
 
-            print("Habit '{}' is checked off. Congrats, you are doing great!".format(name))
-        else:
-            print("Habit '{}' doesn't exist.".format(name))
+    @instrumented
+    def rebuild_stats(self):
+        """
+        Rebuilds the habit statistics from the whole check-off history, archived check-offs included, e.g. after
+        check-offs were written directly to the database.
+        :return: The amount of habits with check-offs.
+        """
+        owns_transaction = not self.conn.in_transaction
+        if owns_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            self.conn.execute('DELETE FROM habit_stats')
+            rebuilt = self.conn.execute(REBUILD_HISTORY_STATS_QUERY).rowcount
+            if owns_transaction:
+                self.conn.commit()
+        except Exception:
+            if owns_transaction:
+                self.conn.rollback()
+            raise
+        return rebuilt
+
+    @instrumented
+    def rebuild_bitmaps(self):
+        """
+        Rebuilds the bitsets of the bitmap history engine from the whole check-off history, archived check-offs
+        included, e.g. after check-offs were written directly to the database.
+        :return: The amount of words written.
+        """
+        owns_transaction = not self.conn.in_transaction
+        if owns_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            rebuilt = self._rebuild_bitmaps('1')
+            if owns_transaction:
+                self.conn.commit()
+        except Exception:
+            if owns_transaction:
+                self.conn.rollback()
+            raise
+        return rebuilt
+
+    def _rebuild_bitmaps(self, condition, parameters=()):
+        """
+        Replaces the bitsets of the habits matching a condition, within the transaction of the caller.
+        :param condition: A condition on the columns of habits_table, qualified with the table name.
+        :param parameters: The parameters of the condition.
+        :return: The amount of words written.
+        """
+        self.conn.execute('DELETE FROM habit_bitmap WHERE habit_id IN (SELECT habit_id FROM habits_table WHERE {})'
+                          .format(condition), parameters)
+        return self.conn.execute(bitmap.REBUILD_BITMAPS_QUERY.format(condition), parameters).rowcount
+
+    @instrumented
+    def archive(self, retention_days=None, batch_size=1000):
+        """
+        Moves the check-offs older than the retention period from the check-off table into check_off_archive,
+        which keeps one bitmask of the checked-off days per habit and month, so the check-off table only grows with
+        the retention period and the amount of habits. The last check-off of every habit stays in the check-off
+        table, where check_off and check_off_many find it. recompute_streaks, rebuild_stats, the analytics and the
+        export read both tables. The check-offs of all users are archived, batch_size habits per transaction, so
+        other writers wait for one batch at most. The freed pages are returned to the disk by compact.
+
+        :param retention_days: Check-offs more than this many days before today are archived, RETENTION_DAYS by
+                               default.
+        :param batch_size: The amount of habits archived per transaction.
+        :return: A dictionary with the amount of archived 'check_offs', the amount of monthly 'masks' written and
+                 the ISO date of the first day that is kept, the 'cutoff'.
+        """
+        if retention_days is None:
+            retention_days = RETENTION_DAYS
+        cutoff = self.clock() - datetime.timedelta(days=retention_days)
+        archived = {'check_offs': 0, 'masks': 0, 'cutoff': cutoff.isoformat()}
+        # the habits are paged by habit_id, as by get_habits_page
+        first_habit_id = self.conn.execute('SELECT MIN(habit_id) FROM habits_table').fetchone()[0]
+        parameters = {'after': None if first_habit_id is None else first_habit_id - 1, 'limit': batch_size,
+                      'cutoff': day_key(cutoff)}
+        while parameters['after'] is not None:
+            owns_transaction = not self.conn.in_transaction
+            if owns_transaction:
+                self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                bounds = self.conn.execute(ARCHIVE_BOUNDS_QUERY, parameters).fetchall()
+                parameters['after'] = bounds[-1][0] if bounds else None
+                bounds = [(habit_id, until) for habit_id, until, archivable in bounds if archivable]
+                archived['masks'] += self.conn.executemany(ARCHIVE_QUERY, bounds).rowcount
+                archived['check_offs'] += self.conn.executemany('DELETE FROM check_off_table '
+                                                                'WHERE habit_id = ? AND day_key < ?', bounds).rowcount
+                if owns_transaction:
+                    self.conn.commit()
+            except Exception:
+                if owns_transaction:
+                    self.conn.rollback()
+                raise
+        return archived
+
+    @instrumented
+    def compact(self, pages=None, step=1024):
+        """
+        Returns the free pages of the database, left behind by deleted habits and check-offs, to the file system.
+        The pages are moved to the end of the file and cut off by incremental vacuum, step pages per transaction,
+        so other writers wait for one step at most. A database created before incremental vacuum is rebuilt once
+        with VACUUM instead, which switches it to incremental vacuum and blocks all other connections while it runs.
+        Must not be called within a transaction.
+
+        :param pages: The maximum amount of pages to free, all free pages by default.
+        :param step: The amount of pages freed per transaction.
+        :return: A dictionary telling whether the database was 'vacuumed', the amount of 'freed_pages', the
+                 'free_pages' that are left and the 'page_size' in bytes.
+        """
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        if self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # the mode of a database with tables only changes with a VACUUM, which also drops all free pages
+            page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+            self.conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            self.conn.execute('VACUUM')
+            freed = page_count - self.conn.execute('PRAGMA page_count').fetchone()[0]
+            return {'vacuumed': True, 'freed_pages': freed, 'free_pages': 0, 'page_size': page_size}
+
+        freed = 0
+        free_pages = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+        while free_pages and (pages is None or freed < pages):
+            count = min(step, free_pages) if pages is None else min(step, free_pages, pages - freed)
+            # executescript steps the pragma to its end, execute would free a single page
+            self.conn.executescript('PRAGMA incremental_vacuum({})'.format(count))
+            remaining = self.conn.execute('PRAGMA freelist_count').fetchone()[0]
+            freed += free_pages - remaining
+            free_pages = remaining
+        return {'vacuumed': False, 'freed_pages': freed, 'free_pages': free_pages, 'page_size': page_size}
+
+    def _habit_stats(self, row):
+        """
+        Builds the statistics of a habit from its habits_table and habit_stats columns, relative to today.
+        :param row: habit_id, name, periodicity, current_streak, longest_streak, total_check_offs, first_day_key,
+                    last_day_key, recent_day_mask; the last four are None for a habit without check-offs.
+        :return: HabitStats
+        """
+        habit_id, name, periodicity, current_streak, longest_streak, total, first_day, last_day, mask = row
+        stats = HabitStats(habit_id=habit_id, name=name, periodicity=periodicity, current_streak=current_streak,
+                           longest_streak=longest_streak, total_check_offs=total or 0, completion_rate=0.0,
+                           last_7_days=0, last_30_days=0)
+        if last_day is None:
+            return stats
+        today = self.clock()
+        first_date = datetime.date.fromordinal(EPOCH_ORDINAL + first_day)
+        stats.first_check_off = first_date.isoformat()
+        stats.last_check_off = datetime.date.fromordinal(EPOCH_ORDINAL + last_day).isoformat()
+        # days passed since the day of bit 0 of the mask
+        shift = max(day_key(today) - last_day, 0)
+        stats.last_7_days = (mask & ((1 << max(7 - shift, 0)) - 1)).bit_count()
+        stats.last_30_days = (mask & ((1 << max(RECENT_DAYS - shift, 0)) - 1)).bit_count()
+        # share of the periods since the first check-off, including the current one, that are checked-off
+        periods = period_key(today, periodicity) - period_key(first_date, periodicity) + 1
+        stats.completion_rate = min(total / max(periods, 1), 1.0)
+        return stats
+
+    @instrumented
+    def get_stats(self, name):
+        """
+        Retrieves the statistics of a habit: its streaks, total check-offs, first and last check-off, the check-offs
+        in the last 7 and 30 days and the completion rate since the first check-off. One row is read.
+        :param name: The name of the habit.
+        :return: HabitStats, or None if the habit does not exist.
+        """
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute(STATS_QUERY + ' WHERE name = ?' + scope, (name, *parameters))
+        row = self.habits_cursor.fetchone()
+        return self._habit_stats(row) if row else None
+
+    @instrumented
+    def get_stats_all(self):
+        """
+        Retrieves the statistics of all habits, see get_stats.
+        :return: A list of HabitStats ordered by habit_id.
+        """
+        scope, parameters = self._user_scope('WHERE')
+        self.habits_cursor.execute(STATS_QUERY + scope + ' ORDER BY habits_table.habit_id', parameters)
+        return [self._habit_stats(row) for row in self.habits_cursor.fetchall()]
+
+    def _find_habit(self, name):
+        """
+        :param name: The name of a habit of the user of the tracker.
+        :return: The habit_id and the periodicity of the habit, or None if it does not exist.
+        """
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute('SELECT habit_id, periodicity FROM habits_table WHERE name = ?' + scope,
+                                   (name, *parameters))
+        return self.habits_cursor.fetchone()
+
+    @instrumented
+    def count_check_offs(self, name, start, end=None):
+        """
+        Counts the periods of a habit with a check-off between two dates, e.g. the days of the last 90 a daily habit
+        was done on. A weekly habit counts the weeks the dates fall in. The bitmap history engine counts the bits of
+        the few words covering the range, the table engine reads the check-offs of the range.
+        :param name: The name of the habit.
+        :param start: The first date of the range, a datetime.date or an ISO formatted string.
+        :param end: The last date of the range, included. Today by default.
+        :return: The amount of periods with a check-off, or None if the habit does not exist.
+        """
+        habit = self._find_habit(name)
+        if habit is None:
+            return None
+        habit_id, periodicity = habit
+        first_key = period_key(to_date(start), periodicity)
+        last_key = period_key(self.clock() if end is None else to_date(end), periodicity)
+        if self.history_engine == 'bitmap':
+            words = self.conn.execute('SELECT word, bits FROM habit_bitmap WHERE habit_id = ? AND word BETWEEN ? AND ?',
+                                      (habit_id, bitmap.word_of(first_key), bitmap.word_of(last_key)))
+            return bitmap.count_bits(words, first_key, last_key)
+        column = 'day_key' if periodicity == 'daily' else 'week_key'
+        return self.conn.execute('SELECT COUNT(DISTINCT {}) FROM check_off_history '
+                                 'WHERE habit_id = ? AND day_key BETWEEN ? AND ?'.format(column),
+                                 (habit_id, *period_days(first_key, last_key, periodicity))).fetchone()[0]
+
+    @instrumented
+    def get_streak_at(self, name, date=None):
+        """
+        Measures the streak of a habit on a date from its history: the periods with a check-off in a row that end
+        with the period of the date, or with the period before while the period of the date has no check-off yet.
+        Unlike the current streak kept by check_off it drops to 0 as soon as a period is missed, and it can be
+        asked for any date. The bitmap history engine finds the end of the streak with a few word operations.
+        :param name: The name of the habit.
+        :param date: The date, a datetime.date or an ISO formatted string. Today by default.
+        :return: The length of the streak, or None if the habit does not exist.
+        """
+        habit = self._find_habit(name)
+        if habit is None:
+            return None
+        habit_id, periodicity = habit
+        key = period_key(self.clock() if date is None else to_date(date), periodicity)
+        if self.history_engine == 'bitmap':
+            words = self.conn.execute('SELECT word, bits FROM habit_bitmap WHERE habit_id = ? AND word <= ? '
+                                      'ORDER BY word DESC', (habit_id, bitmap.word_of(key))).fetchall()
+            return bitmap.run_ending(words, key) or bitmap.run_ending(words, key - 1)
+        column = 'day_key' if periodicity == 'daily' else 'week_key'
+        keys = self.conn.execute('SELECT DISTINCT {} FROM check_off_history WHERE habit_id = ? AND day_key <= ? '
+                                 'ORDER BY 1 DESC'.format(column),
+                                 (habit_id, period_days(key, key, periodicity)[1]))
+        streak, expected = 0, key
+        for (period,) in keys:
+            if streak == 0 and period == key - 1:
+                # the period of the date is still open
+                expected = period
+            if period != expected:
+                break
+            streak += 1
+            expected -= 1
+        return streak
+
+    @instrumented
+    def get_completed_habits(self, start, end=None):
+        """
+        Finds the habits with a check-off in every period between two dates, e.g. the habits done every day of this
+        month. Weekly habits need a check-off in every week the dates fall in. The bitmap history engine compares
+        the bit counts of the words covering the range, the table engine counts the check-offs of the range.
+        :param start: The first date of the range, a datetime.date or an ISO formatted string.
+        :param end: The last date of the range, included. Today by default.
+        :return: A list of (name, periodicity) tuples of the habits of the user ordered by habit_id.
+        """
+        start, end = to_date(start), self.clock() if end is None else to_date(end)
+        first_day, last_day, first_week, last_week = day_key(start), day_key(end), week_key(start), week_key(end)
+        scope, parameters = self._user_scope()
+        if self.history_engine == 'bitmap':
+            words = self.conn.execute("""SELECT habits_table.habit_id, name, periodicity, word, bits
+                                         FROM habits_table JOIN habit_bitmap
+                                         ON habit_bitmap.habit_id = habits_table.habit_id
+                                         AND word BETWEEN CASE WHEN periodicity = 'daily' THEN ? ELSE ? END
+                                                      AND CASE WHEN periodicity = 'daily' THEN ? ELSE ? END
+                                         WHERE 1{}
+                                         ORDER BY habits_table.habit_id""".format(scope),
+                                      (bitmap.word_of(first_day), bitmap.word_of(first_week), bitmap.word_of(last_day),
+                                       bitmap.word_of(last_week), *parameters))
+            completed = []
+            for (_, name, periodicity), habit_words in itertools.groupby(words, key=lambda row: row[:3]):
+                first_key, last_key = (first_day, last_day) if periodicity == 'daily' else (first_week, last_week)
+                if bitmap.count_bits((row[3:] for row in habit_words), first_key, last_key) == last_key - first_key + 1:
+                    completed.append((name, periodicity))
+            return completed
+        # the days of the weeks cover those of the dates, the condition on them alone is applied to both tables
+        first_week_day, last_week_day = period_days(first_week, last_week, 'weekly')
+        return self.conn.execute("""SELECT name, periodicity
+                                    FROM check_off_history JOIN habits_table
+                                    ON habits_table.habit_id = check_off_history.habit_id
+                                    WHERE day_key BETWEEN ? AND ?
+                                    AND day_key BETWEEN CASE WHEN periodicity = 'daily' THEN ? ELSE ? END
+                                                    AND CASE WHEN periodicity = 'daily' THEN ? ELSE ? END{}
+                                    GROUP BY habits_table.habit_id
+                                    HAVING COUNT(DISTINCT CASE WHEN periodicity = 'daily' THEN day_key
+                                                               ELSE week_key END)
+                                           = CASE WHEN periodicity = 'daily' THEN ? ELSE ? END
+                                    ORDER BY habits_table.habit_id""".format(scope),
+                                 (first_week_day, last_week_day, first_day, first_week_day, last_day, last_week_day,
+                                  *parameters,
+                                  last_day - first_day + 1, last_week - first_week + 1)).fetchall()
+
+    def cache_info(self):
+        """
+        Reports the effectiveness of the habit cache.
+        :return: A dictionary with the amount of cache 'hits' and 'misses', the current 'size' and the 'max_size'.
+        """
+        return {'hits': self.habit_cache.hits, 'misses': self.habit_cache.misses,
+                'size': len(self.habit_cache.entries), 'max_size': self.habit_cache.size}
+
+    def instrumentation_info(self, prometheus=False):
+        """
+        Reports the measurements of the instrumentation of the tracker.
+        :param prometheus: Return the Prometheus text exposition format instead of a dictionary.
+        :return: See Instrumentation.report and Instrumentation.prometheus, or None if the tracker is not instrumented.
+        """
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.prometheus() if prometheus else self.instrumentation.report()
+
+    @instrumented
+    def get_habit_ids(self, names):
+        """
+        Retrieves the ids of the habits with the given names.
+        :param names: The names of the habits.
+        :return: A list with the ids of the habits that exist.
+        """
+        names = list(names)
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute('SELECT habit_id FROM habits_table WHERE name IN ({}){}'
+                                   .format(','.join('?' * len(names)), scope), (*names, *parameters))
+        return [row[0] for row in self.habits_cursor.fetchall()]
+
+    @instrumented
+    def last_check_off(self, habit_id):
+        """
+        Retrieves the most recent check-off of the habit.
+        The query is answered by a single seek on the (habit_id, day_key, week_key, date) index.
+        :param habit_id: The id of the habit.
+        :return: A tuple with the date, the day key and the week key of the last check-off
+                 or None if the habit was never checked-off.
+        """
+        self.check_off_cursor.execute('SELECT date, day_key, week_key FROM check_off_table WHERE habit_id = ? '
+                                      'ORDER BY day_key DESC LIMIT 1', (habit_id,))
+        return self.check_off_cursor.fetchone()
 
     def daily_on_streak(self, habit_id):
         """
@@ -188,20 +1267,11 @@ class HabitTracker:
         :param habit_id: The id of the habit to check.
         :return: Boolean. True if the habit is on streak, False otherwise.
         """
-        today = datetime.date.today()
-        # today = datetime.date(2023, 6, 3)
-        self.check_off_cursor.execute('SELECT date FROM check_off_table WHERE habit_id = ? ORDER BY date DESC',
-                                      (habit_id,))
-        habit_info = self.check_off_cursor.fetchone()
+        today = self.clock()
+        habit_info = self.last_check_off(habit_id)
         if habit_info is None:
             return True
-        habit_str = habit_info[0]
-        habit_last_date = datetime.datetime.strptime(habit_str, "%Y-%m-%d").date()
-        difference = today - habit_last_date
-        if difference.days == 1:
-            return True
-        else:
-            return False
+        return day_key(today) - habit_info[1] == 1
 
     def weekly_on_streak(self, habit_id):
         """
@@ -209,94 +1279,134 @@ class HabitTracker:
         :param habit_id: The id of the habit to check.
         :return: Boolean. True if the habit is on streak, False otherwise.
         """
-        today = datetime.date.today()
-        week_num = today.isocalendar()[1]
-        self.check_off_cursor.execute('SELECT date FROM check_off_table WHERE habit_id = ? ORDER BY date DESC',
-                                      (habit_id,))
-        check_off = self.check_off_cursor.fetchone()
+        today = self.clock()
+        check_off = self.last_check_off(habit_id)
         if check_off is None:
             return True
-        date_str = check_off[0]
-        habit_last_date = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
-        week_num_last = habit_last_date.isocalendar()[1]
-        difference = week_num - week_num_last
-        if difference == 1:
-            return True
+        return week_key(today) - check_off[2] == 1
+
+    @instrumented
+    def get_habits_page(self, periodicity=None, limit=1000, after_id=0):
+        """
+        Retrieves one page of habits ordered by habit_id, using the last habit_id of the previous page as the cursor.
+        :param periodicity: The periodicity to filter the habits by, all habits by default.
+        :param limit: The maximum amount of habits on the page.
+        :param after_id: The habit_id the page starts after, 0 for the first page.
+        :return: A list of (habit_id, name, periodicity, creation_date) tuples.
+        """
+        scope, parameters = self._user_scope()
+        if periodicity is None:
+            self.habits_cursor.execute('SELECT habit_id, name, periodicity, creation_date FROM habits_table '
+                                       'WHERE habit_id > ?{} ORDER BY habit_id LIMIT ?'.format(scope),
+                                       (after_id, *parameters, limit))
         else:
-            return False
+            self.habits_cursor.execute('SELECT habit_id, name, periodicity, creation_date FROM habits_table '
+                                       'WHERE periodicity = ? AND habit_id > ?{} ORDER BY habit_id LIMIT ?'
+                                       .format(scope), (periodicity, after_id, *parameters, limit))
+        return self.habits_cursor.fetchall()
 
+    def iter_habits(self, periodicity=None, batch_size=1000, after_id=0):
+        """
+        Streams the habits page by page, so only one batch of rows is held in memory at a time.
+        Every page is a separate query, no statement stays open between the batches.
+        :param periodicity: The periodicity to filter the habits by, all habits by default.
+        :param batch_size: The amount of habits fetched by one query.
+        :param after_id: The habit_id to start after, 0 to start from the first habit.
+        :return: A generator of (habit_id, name, periodicity, creation_date) tuples.
+        """
+        while True:
+            page = self.get_habits_page(periodicity, batch_size, after_id)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after_id = page[-1][0]
+
+    @instrumented
     def get_all_habits(self):
         """
         Retrieves information about all habits from the habits table.
-        :return: A list of tuples containing habit information.
+        :return: A list of tuples containing habit information, ordered by habit_id.
         """
-        self.habits_cursor.execute('SELECT name, periodicity, creation_date FROM habits_table')
-        habit_info = self.habits_cursor.fetchall()
-        # Print the retrieved habit information
-        for habit in habit_info:
-            print("Name - {}; periodicity - {}, created - {}".format(habit[0], habit[1], habit[2]))
-        return habit_info
+        scope, parameters = self._user_scope('WHERE')
+        self.habits_cursor.execute('SELECT name, periodicity, creation_date FROM habits_table{} ORDER BY habit_id'
+                                   .format(scope), parameters)
+        return self.habits_cursor.fetchall()
 
+    @instrumented
     def get_all_by_periodicity(self, periodicity):
         """
         Retrieves information about habits with specified periodicity from habits table.
         :param periodicity: The periodicity value to filter the habits by.
-        :return: A list of tuples containing habit information.
+        :return: A list of tuples containing habit information, ordered by habit_id.
         """
-        self.habits_cursor.execute('SELECT name, periodicity, creation_date FROM habits_table WHERE periodicity = ?',
-                                   (periodicity,))
-        habit_info = self.habits_cursor.fetchall()
-        if not habit_info:
-            print('No habits were found with "{}" periodicity'.format(periodicity))
-        else:
-            # Print the retrieved habit information
-            for habit in habit_info:
-                print("Name - {}; periodicity - {}; creation date - {}".format(habit[0], habit[1], habit[2]))
-        return habit_info
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute('SELECT name, periodicity, creation_date FROM habits_table WHERE periodicity = ?{} '
+                                   'ORDER BY habit_id'.format(scope), (periodicity, *parameters))
+        return self.habits_cursor.fetchall()
 
+    @instrumented
     def get_current_longest_streak(self):
         """
         Retrieves information about current longest streak of the habit.
         :return: A list of tuples containing habit information, including the current longest streak and name.
         """
+        scope, parameters = self._user_scope()
         self.habits_cursor.execute("""SELECT current_streak, name FROM habits_table
-                                        JOIN (SELECT MAX(current_streak) AS max_value
-                                        FROM habits_table) AS subquery
-                                        ON habits_table.current_streak = subquery.max_value""")
-        longest_streak = self.habits_cursor.fetchall()
-        if not longest_streak:
-            print("You don't have habits")
-            return
-        for habit in longest_streak:
-            print("Current longest streak {}, name {}".format(habit[0], habit[1]))
-        return longest_streak
+                                      WHERE current_streak = (SELECT MAX(current_streak) FROM habits_table
+                                                           WHERE 1{0}){0}""".format(scope), parameters * 2)
+        return self.habits_cursor.fetchall()
 
+    @instrumented
     def get_longest_streak(self):
         """
         Retrieves information about the habit with the longest streak of all time from the habits table.
         :return: A list of tuples containing habit information, including the longest streak and name.
         """
+        scope, parameters = self._user_scope()
         self.habits_cursor.execute("""SELECT longest_streak, name FROM habits_table
-                                                JOIN (SELECT MAX(longest_streak) AS max_value
-                                                FROM habits_table) AS subquery
-                                                ON habits_table.longest_streak = subquery.max_value""")
-        longest_streak = self.habits_cursor.fetchall()
-        if not longest_streak:
-            print("You don't have habits")
-            return
-        for habit in longest_streak:
-            print('Longest streak for all time is equal to {}, habit name "{}"'.format(habit[0], habit[1]))
-        return longest_streak
+                                      WHERE longest_streak = (SELECT MAX(longest_streak) FROM habits_table
+                                                           WHERE 1{0}){0}""".format(scope), parameters * 2)
+        return self.habits_cursor.fetchall()
 
+    @instrumented
+    def top_streaks(self, k=10, kind='current', periodicity=None):
+        """
+        Retrieves the K habits with the highest streaks, read in order from the index of the streak, so the cost
+        depends on K and not on the amount of habits. Habits with equal streaks are ordered by habit_id.
+        When filtering by periodicity the streak index is still used, skipping the habits of the other periodicity,
+        instead of sorting all the habits of the periodicity.
+
+        :param k: The amount of habits to return.
+        :param kind: 'current' for the current streaks or 'longest' for the longest streaks of all time.
+        :param periodicity: The periodicity to filter the habits by, all habits by default.
+        :return: A list of (habit_id, name, periodicity, streak) tuples, the highest streak first.
+        """
+        if kind not in STREAK_INDEXES:
+            raise ValueError('Unknown streak kind {}, expected one of {}'.format(kind, ', '.join(STREAK_INDEXES)))
+        column, index = STREAK_INDEXES[kind]
+        scope, parameters = self._user_scope()
+        if scope:
+            index = USER_STREAK_INDEXES[kind]
+        query = 'SELECT habit_id, name, periodicity, {0} FROM habits_table INDEXED BY {1} WHERE 1{2}'.format(
+            column, index, scope)
+        if periodicity is not None:
+            query += ' AND periodicity = ?'
+            parameters += (periodicity,)
+        self.habits_cursor.execute(query + ' ORDER BY {} DESC, habit_id LIMIT ?'.format(column), (*parameters, k))
+        return self.habits_cursor.fetchall()
+
+    @instrumented
     def get_longest_streak_by_name(self, name):
         """
         Retrieve the longest streak for a specific habit by its name from the habits table.
         :param name: The name of the habit to retrieve the longest streak for.
-        :return: None.
+        :return: The longest streak, or None if the habit does not exist.
         """
-        self.habits_cursor.execute('SELECT longest_streak FROM habits_table WHERE name = ?', (name,))
+        habit = self.habit_cache.get(name)
+        if habit is not None:
+            return habit[3]
+        scope, parameters = self._user_scope()
+        self.habits_cursor.execute('SELECT longest_streak FROM habits_table WHERE name = ?' + scope,
+                                   (name, *parameters))
         streak_info = self.habits_cursor.fetchone()
-        if not streak_info:
-            print('You do not have habit with name "{}"'.format(name))
-        else:
-            print('Longest streak for "{}" habit is equal to {}'.format(name, streak_info[0]))
+        return streak_info[0] if streak_info else None
@@ -0,0 +1,405 @@
+"""
+Export and import of the habits and their check-off history, for backups, moving a tracker to another
+machine and seeding test databases.
+
+Two formats are supported:
+- binary: a compact columnar file. After the MAGIC header it holds blocks of up to BLOCK_SIZE rows, each
+  starting with a (kind, rows) header. A habit block stores the habit_id, streak and periodicity columns as
+  fixed-width little-endian integer arrays, followed by the names, creation dates and user ids as string tables
+  (an array of UTF-8 lengths followed by the concatenated bytes). Files of the first version, VERSION_1_MAGIC,
+  have no user ids and are imported into the default user. A check-off block stores the habit_id and
+  day key columns. The file ends with an END block.
+- csv: a directory with habits.csv and check_offs.csv, both with a header row. A habits.csv without the user_id
+  column is imported into the default user.
+
+The check-offs moved to the archive of the tracker are exported like the others, and every check-off is imported
+into the check-off table.
+
+Both sides stream block by block, so neither needs the whole history in memory. Import writes in one
+transaction with bulk executemany calls. It drops the indexes of the tables first and rebuilds each of them
+with one sort at the end, instead of updating them on every inserted row, and builds the habit statistics and
+bitsets from the check-offs as they stream in rather than reading the imported history again.
+"""
+import csv
+import datetime
+import itertools
+import os
+import struct
+import sys
+from array import array
+from collections import defaultdict
+
+from src import bitmap
+from src.tracker import EPOCH_ORDINAL, RECENT_DAYS, iter_check_offs
+
+MAGIC = b'HABITS\x00\x02'
+VERSION_1_MAGIC = b'HABITS\x00\x01'
+BLOCK_SIZE = 65536
+
+# block kinds
+HABITS_BLOCK = b'H'
+CHECK_OFFS_BLOCK = b'C'
+END_BLOCK = b'E'
+BLOCK_HEADER = struct.Struct('<cI')
+
+PERIODICITIES = ('daily', 'weekly')
+HABIT_COLUMNS = ('habit_id', 'name', 'periodicity', 'creation_date', 'current_streak', 'longest_streak', 'user_id')
+CHECK_OFF_COLUMNS = ('habit_id', 'date')
+
+HABITS_QUERY = ('SELECT habit_id, name, periodicity, creation_date, current_streak, longest_streak, user_id '
+                'FROM habits_table ORDER BY habit_id')
+# check-offs of deleted habits are left out
+CHECK_OFFS_CONDITION = ' WHERE habit_id IN (SELECT habit_id FROM habits_table)'
+INSERT_HABIT_QUERY = ('INSERT INTO habits_table (habit_id, name, periodicity, creation_date, current_streak, '
+                      'longest_streak, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)')
+INSERT_CHECK_OFF_QUERY = 'INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)'
+
+
+class IsoDates(dict):
+    """Day key -> ISO date, computing every date once"""
+
+    def __missing__(self, key):
+        date = self[key] = datetime.date.fromordinal(EPOCH_ORDINAL + key).isoformat()
+        return date
+
+
+class DayKeys(dict):
+    """ISO date -> day key, parsing every date once"""
+
+    def __missing__(self, key):
+        day = self[key] = datetime.date.fromisoformat(key).toordinal() - EPOCH_ORDINAL
+        return day
+
+
+class HistoryBuilder:
+    """
+    Builds the bitsets of the bitmap history engine and the habit statistics from the imported rows as they are
+    written, so an import does not read the whole check-off history again to rebuild them. Every habit gets a
+    bitset of its days, which are its bitmap words for a daily habit and hold its statistics; the check-off table
+    has at most one check-off per habit and day.
+    """
+
+    def __init__(self):
+        self.weekly = {}
+        self.days = {}
+        self.weeks = {}
+        self.day_keys = DayKeys()
+
+    def habits(self, rows):
+        """
+        :param rows: Rows of INSERT_HABIT_QUERY.
+        :return: The same rows, recording the periodicity of every habit.
+        """
+        for row in rows:
+            self.weekly[int(row[0])] = row[2] == 'weekly'
+            yield row
+
+    def check_offs(self, rows):
+        """
+        :param rows: Rows of INSERT_CHECK_OFF_QUERY.
+        :return: The same rows, setting the bits of every check-off of an imported habit.
+        """
+        day_keys = self.day_keys
+        # the rows of a habit follow each other, so its words are looked up once per run of rows
+        last_habit_id = days = weeks = None
+        for row in rows:
+            habit_id, date = row
+            if habit_id != last_habit_id:
+                last_habit_id = habit_id
+                is_weekly = self.weekly.get(int(habit_id))
+                days = None if is_weekly is None else self.days.setdefault(int(habit_id), defaultdict(int))
+                weeks = self.weeks.setdefault(int(habit_id), defaultdict(int)) if is_weekly else None
+            if days is not None:
+                key = day_keys[date]
+                days[key >> 6] |= 1 << (key & 63)
+                if weeks is not None:
+                    # week key of the day, see src/tracker.py
+                    key = (key + 3) // 7
+                    weeks[key >> 6] |= 1 << (key & 63)
+            yield row
+
+    def bitmap_rows(self):
+        """
+        :return: The (habit_id, word, bits) rows of habit_bitmap.
+        """
+        for habit_id, days in self.days.items():
+            for word, bits in self.weeks.get(habit_id, days).items():
+                yield habit_id, word, bitmap.stored_bits(bits)
+
+    def stats_rows(self):
+        """
+        :return: The (habit_id, total_check_offs, first_day_key, last_day_key, recent_day_mask) rows of habit_stats.
+        """
+        for habit_id, days in self.days.items():
+            first_word, last_word = min(days), max(days)
+            first_day = first_word * bitmap.WORD_BITS + (days[first_word] & -days[first_word]).bit_length() - 1
+            last_day = last_word * bitmap.WORD_BITS + days[last_word].bit_length() - 1
+            recent_day_mask = 0
+            for age in range(min(RECENT_DAYS, last_day - first_day + 1)):
+                key = last_day - age
+                if days.get(key >> 6, 0) >> (key & 63) & 1:
+                    recent_day_mask |= 1 << age
+            yield habit_id, sum(bits.bit_count() for bits in days.values()), first_day, last_day, recent_day_mask
+
+
+def _column(typecode, values):
+    """
+    :param typecode: The array typecode of the column.
+    :param values: The values of the column.
+    :return: The column as little-endian bytes.
+    """
+    column = array(typecode, values)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column.tobytes()
+
+
+def _read_column(stream, typecode, rows):
+    """
+    :param stream: The binary stream positioned at the column.
+    :param typecode: The array typecode of the column.
+    :param rows: The amount of values.
+    :return: The column as an array.
+    """
+    column = array(typecode)
+    size = column.itemsize * rows
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError('Truncated habit tracker export')
+    column.frombytes(data)
+    if sys.byteorder != 'little':
+        column.byteswap()
+    return column
+
+
+def _strings(values):
+    """
+    :param values: Strings or None, which is stored like an empty string.
+    :return: The string table of the values as bytes.
+    """
+    encoded = [(value or '').encode('utf-8') for value in values]
+    return _column('I', map(len, encoded)) + b''.join(encoded)
+
+
+def _read_strings(stream, rows):
+    """
+    :param stream: The binary stream positioned at the string table.
+    :param rows: The amount of strings.
+    :return: A list of strings, None for empty ones.
+    """
+    lengths = _read_column(stream, 'I', rows)
+    data = stream.read(sum(lengths))
+    strings = []
+    offset = 0
+    # the lengths are in bytes, so the bytes are sliced before decoding
+    for length in lengths:
+        strings.append(data[offset:offset + length].decode('utf-8') or None)
+        offset += length
+    return strings
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def export_binary(conn, path, block_size=BLOCK_SIZE):
+    """
+    Writes the habits and the check-offs of the database to a binary export file.
+    :param conn: sqlite3.Connection to the tracker database.
+    :param path: The path of the file to write.
+    :param block_size: The maximum amount of rows per block.
+    :return: A dictionary with the amount of exported 'habits' and 'check_offs'.
+    """
+    counts = {'habits': 0, 'check_offs': 0}
+    with open(path, 'wb') as stream:
+        stream.write(MAGIC)
+        for rows in _chunks(conn.execute(HABITS_QUERY), block_size):
+            habit_ids, names, periodicities, creation_dates, current_streaks, longest_streaks, user_ids = zip(*rows)
+            stream.write(BLOCK_HEADER.pack(HABITS_BLOCK, len(rows)))
+            stream.write(_column('q', habit_ids))
+            stream.write(_column('b', map(PERIODICITIES.index, periodicities)))
+            stream.write(_column('i', current_streaks))
+            stream.write(_column('i', longest_streaks))
+            stream.write(_strings(names))
+            stream.write(_strings(creation_dates))
+            stream.write(_strings(user_ids))
+            counts['habits'] += len(rows)
+        for rows in _chunks(iter_check_offs(conn, CHECK_OFFS_CONDITION), block_size):
+            habit_ids, day_keys = zip(*rows)
+            stream.write(BLOCK_HEADER.pack(CHECK_OFFS_BLOCK, len(rows)))
+            stream.write(_column('q', habit_ids))
+            stream.write(_column('i', day_keys))
+            counts['check_offs'] += len(rows)
+        stream.write(BLOCK_HEADER.pack(END_BLOCK, 0))
+    return counts
+
+
+def read_binary(path):
+    """
+    Streams the blocks of a binary export file.
+    :param path: The path of the file.
+    :return: A generator of (kind, rows) pairs, where kind is 'habits' or 'check_offs' and rows is an iterable
+             of rows ready for INSERT_HABIT_QUERY or INSERT_CHECK_OFF_QUERY.
+    """
+    dates = IsoDates()
+    with open(path, 'rb') as stream:
+        magic = stream.read(len(MAGIC))
+        if magic not in (MAGIC, VERSION_1_MAGIC):
+            raise ValueError('{} is not a habit tracker export'.format(path))
+        while True:
+            header = stream.read(BLOCK_HEADER.size)
+            if len(header) != BLOCK_HEADER.size:
+                raise ValueError('Truncated habit tracker export')
+            kind, rows = BLOCK_HEADER.unpack(header)
+            if kind == END_BLOCK:
+                return
+            habit_ids = _read_column(stream, 'q', rows)
+            if kind == HABITS_BLOCK:
+                periodicities = [PERIODICITIES[value] for value in _read_column(stream, 'b', rows)]
+                current_streaks = _read_column(stream, 'i', rows)
+                longest_streaks = _read_column(stream, 'i', rows)
+                names = _read_strings(stream, rows)
+                creation_dates = _read_strings(stream, rows)
+                # the default user is stored as an empty string, which _read_strings reads as None
+                user_ids = [user_id or '' for user_id in _read_strings(stream, rows)] if magic == MAGIC \
+                    else itertools.repeat('')
+                yield 'habits', zip(habit_ids, names, periodicities, creation_dates, current_streaks, longest_streaks,
+                                    user_ids)
+            elif kind == CHECK_OFFS_BLOCK:
+                day_keys = _read_column(stream, 'i', rows)
+                yield 'check_offs', zip(habit_ids, map(dates.__getitem__, day_keys))
+            else:
+                raise ValueError('Unknown block {!r} in habit tracker export'.format(kind))
+
+
+def export_csv(conn, directory):
+    """
+    Writes the habits and the check-offs of the database to habits.csv and check_offs.csv.
+    :param conn: sqlite3.Connection to the tracker database.
+    :param directory: The directory to write the files to, created if it does not exist.
+    :return: A dictionary with the amount of exported 'habits' and 'check_offs'.
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    dates = IsoDates()
+    check_offs = ((habit_id, dates[day]) for habit_id, day in iter_check_offs(conn, CHECK_OFFS_CONDITION))
+    for key, columns, table in (('habits', HABIT_COLUMNS, conn.execute(HABITS_QUERY)),
+                                ('check_offs', CHECK_OFF_COLUMNS, check_offs)):
+        with open(os.path.join(directory, key + '.csv'), 'w', newline='', encoding='utf-8') as stream:
+            writer = csv.writer(stream)
+            writer.writerow(columns)
+            counts[key] = 0
+            for rows in _chunks(table, BLOCK_SIZE):
+                writer.writerows(rows)
+                counts[key] += len(rows)
+    return counts
+
+
+def read_csv(directory):
+    """
+    Streams the rows of a CSV export.
+    :param directory: The directory with habits.csv and check_offs.csv.
+    :return: A generator of (kind, rows) pairs like read_binary.
+    """
+    for key, columns in (('habits', HABIT_COLUMNS), ('check_offs', CHECK_OFF_COLUMNS)):
+        with open(os.path.join(directory, key + '.csv'), newline='', encoding='utf-8') as stream:
+            reader = csv.reader(stream)
+            header = next(reader, None)
+            if key == 'habits' and header == list(columns[:-1]):
+                # written before habits had users
+                reader = (row + [''] for row in reader)
+            elif header != list(columns):
+                raise ValueError('{} has no {} header'.format(stream.name, ','.join(columns)))
+            if key == 'habits':
+                reader = ((habit_id, name, periodicity, creation_date or None, current_streak, longest_streak, user_id)
+                          for habit_id, name, periodicity, creation_date, current_streak, longest_streak, user_id
+                          in reader)
+            while True:
+                rows = list(itertools.islice(reader, BLOCK_SIZE))
+                if not rows:
+                    break
+                yield key, rows
+
+
+def import_blocks(tracker, blocks, replace=False, rebuild_indexes=True):
+    """
+    Writes exported habits and check-offs into the database of the tracker in a single transaction,
+    keeping the habit ids and streaks of the export and building the habit statistics and bitsets from the
+    imported check-offs.
+    :param tracker: HabitTracker to import into.
+    :param blocks: An iterable of (kind, rows) pairs, see read_binary.
+    :param replace: Delete the habits and check-offs of the database first. Otherwise the database must not
+                    have any.
+    :param rebuild_indexes: Drop the indexes of the tables during the import and create them again afterwards.
+    :return: A dictionary with the amount of imported 'habits' and 'check_offs'.
+    """
+    conn = tracker.conn
+    counts = {'habits': 0, 'check_offs': 0}
+    queries = {'habits': INSERT_HABIT_QUERY, 'check_offs': INSERT_CHECK_OFF_QUERY}
+    history = HistoryBuilder()
+    recorders = {'habits': history.habits, 'check_offs': history.check_offs}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if replace:
+            for table in ('check_off_table', 'check_off_archive', 'habit_bitmap', 'habit_stats', 'habits_table'):
+                conn.execute('DELETE FROM ' + table)
+        elif conn.execute('SELECT EXISTS (SELECT 1 FROM habits_table) OR '
+                          'EXISTS (SELECT 1 FROM check_off_table)').fetchone()[0]:
+            raise ValueError('The database already has habits, import with replace to overwrite them')
+
+        indexes = []
+        if rebuild_indexes:
+            # automatic indexes of UNIQUE constraints have no sql and can not be dropped
+            indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL "
+                                   "AND tbl_name IN ('habits_table', 'check_off_table')").fetchall()
+            for name, _ in indexes:
+                conn.execute('DROP INDEX "{}"'.format(name))
+
+        for kind, rows in blocks:
+            cursor = conn.executemany(queries[kind], recorders[kind](rows))
+            counts[kind] += cursor.rowcount
+
+        for _, sql in indexes:
+            conn.execute(sql)
+        # the database was empty, so the imported check-offs are the whole history
+        conn.executemany('INSERT INTO habit_stats (habit_id, total_check_offs, first_day_key, last_day_key, '
+                         'recent_day_mask) VALUES (?, ?, ?, ?, ?)', history.stats_rows())
+        conn.executemany('INSERT INTO habit_bitmap (habit_id, word, bits) VALUES (?, ?, ?)', history.bitmap_rows())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        tracker.habit_cache.invalidate()
+    return counts
+
+
+def export_history(tracker, path, file_format='binary'):
+    """
+    Exports the habits and check-offs of the tracker.
+    :param tracker: HabitTracker to export.
+    :param path: The file of the binary format or the directory of the CSV format.
+    :param file_format: 'binary' or 'csv'.
+    :return: A dictionary with the amount of exported 'habits' and 'check_offs'.
+    """
+    if file_format == 'binary':
+        return export_binary(tracker.conn, path)
+    return export_csv(tracker.conn, path)
+
+
+def import_history(tracker, path, file_format='binary', replace=False):
+    """
+    Imports habits and check-offs exported by export_history.
+    :param tracker: HabitTracker to import into.
+    :param path: The file of the binary format or the directory of the CSV format.
+    :param file_format: 'binary' or 'csv'.
+    :param replace: Delete the habits and check-offs of the tracker first.
+    :return: A dictionary with the amount of imported 'habits' and 'check_offs'.
+    """
+    blocks = read_binary(path) if file_format == 'binary' else read_csv(path)
+    return import_blocks(tracker, blocks, replace)
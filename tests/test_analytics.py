@@ -0,0 +1,116 @@
+import datetime
+import unittest
+
+from src.simulation import SimulatedClock, simulate
+from src.tracker import HabitTracker
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from src import analytics
+
+
+@unittest.skipIf(numpy is None, 'analytics needs numpy')
+class TestAnalytics(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = SimulatedClock(datetime.date(2023, 1, 2))
+        self.tracker = HabitTracker(':memory:', clock=self.clock)
+
+    def tearDown(self) -> None:
+        self.tracker.conn.close()
+
+    def check_off(self, name, dates):
+        for date in dates:
+            self.tracker.conn.execute('INSERT INTO check_off_table (habit_id, date) '
+                                      'SELECT habit_id, ? FROM habits_table WHERE name = ?',
+                                      (date.isoformat(), name))
+        self.tracker.conn.commit()
+
+    def test_streaks_match_recomputed_streaks(self):
+        simulate(self.tracker, self.clock, habits=20, days=120, completion=0.7)
+        self.tracker.recompute_streaks()
+        expected = self.tracker.conn.execute('SELECT habit_id, current_streak, longest_streak FROM habits_table '
+                                             'WHERE habit_id IN (SELECT habit_id FROM check_off_table) '
+                                             'ORDER BY habit_id').fetchall()
+
+        habit_ids, current, longest = analytics.streaks(analytics.CheckOffHistory.load(self.tracker.conn))
+
+        self.assertEqual(expected, list(zip(habit_ids.tolist(), current.tolist(), longest.tolist())))
+
+    def test_streak_length_distribution(self):
+        self.tracker.add_habit('read', 'daily')
+        self.tracker.add_habit('swim', 'weekly')
+        start = datetime.date(2023, 1, 2)
+        # daily streaks of 3, 1 and 2 days
+        self.check_off('read', [start + datetime.timedelta(days=day) for day in (0, 1, 2, 5, 8, 9)])
+        # a weekly streak of 2 weeks, checked-off twice in the first one
+        self.check_off('swim', [start, start + datetime.timedelta(days=3), start + datetime.timedelta(days=8)])
+
+        distribution = analytics.streak_length_distribution(analytics.CheckOffHistory.load(self.tracker.conn))
+
+        self.assertEqual([0, 1, 2, 1], distribution.tolist())
+
+    def test_completion_heatmap(self):
+        self.tracker.add_habit('read', 'daily')
+        self.tracker.add_habit('swim', 'weekly')
+        wednesday = datetime.date(2023, 1, 4)
+        self.check_off('read', [wednesday, wednesday + datetime.timedelta(days=7)])
+        self.check_off('swim', [wednesday])
+
+        heatmap = analytics.completion_heatmap(analytics.CheckOffHistory.load(self.tracker.conn),
+                                               wednesday, wednesday + datetime.timedelta(days=10))
+
+        self.assertEqual((2, 7), heatmap.shape)
+        self.assertEqual([0, 0, 2, 0, 0, 0, 0], heatmap[0].tolist())
+        self.assertEqual([0, 0, 1, 0, 0, 0, 0], heatmap[1].tolist())
+
+    def test_weekday_completion(self):
+        self.tracker.add_habit('read', 'daily')
+        monday = datetime.date(2023, 1, 2)
+        # every weekday of two weeks, no weekends
+        self.check_off('read', [monday + datetime.timedelta(days=day) for day in range(14) if day % 7 < 5])
+
+        habit_ids, ratios, overall = analytics.weekday_completion(
+            analytics.CheckOffHistory.load(self.tracker.conn), today=monday + datetime.timedelta(days=13))
+
+        self.assertEqual([1], habit_ids.tolist())
+        self.assertEqual([1, 1, 1, 1, 1, 0, 0], ratios[0].tolist())
+        self.assertEqual([1, 1, 1, 1, 1, 0, 0], overall.tolist())
+
+    def test_history_skips_deleted_habits(self):
+        self.tracker.add_habit('read', 'daily')
+        self.tracker.add_habit('swim', 'weekly')
+        self.check_off('read', [datetime.date(2023, 1, 2)])
+        self.check_off('swim', [datetime.date(2023, 1, 2)])
+        self.tracker.delete_habit('read')
+
+        history = analytics.CheckOffHistory.load(self.tracker.conn)
+
+        self.assertEqual([2], history.habit_ids.tolist())
+        self.assertEqual([True], history.weekly.tolist())
+
+    def test_archived_check_offs_are_loaded(self):
+        simulate(self.tracker, self.clock, habits=10, days=120, completion=0.7)
+        history = analytics.CheckOffHistory.load(self.tracker.conn)
+
+        self.tracker.archive(30)
+        archived_history = analytics.CheckOffHistory.load(self.tracker.conn)
+
+        self.assertEqual(history.habit_ids.tolist(), archived_history.habit_ids.tolist())
+        self.assertEqual(history.periods.tolist(), archived_history.periods.tolist())
+
+    def test_empty_history(self):
+        self.tracker.add_habit('read', 'daily')
+        history = analytics.CheckOffHistory.load(self.tracker.conn)
+
+        self.assertEqual(0, len(history))
+        self.assertEqual(0, len(analytics.streaks(history)[0]))
+        self.assertEqual([], analytics.streak_length_distribution(history).tolist())
+        self.assertEqual(0, analytics.weekday_completion(history)[1].size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import asyncio
+import datetime
+import unittest
+from unittest import mock
+
+from src.async_tracker import AsyncHabitTracker
+from src.results import CheckOffResult, Status
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+# HabitTracker methods about the connection and the schema, or reading single habits by id, with no awaitable version
+NOT_AWAITABLE = {'connect', 'migrate', 'for_user', 'last_check_off', 'daily_on_streak', 'weekly_on_streak'}
+
+
+def public_methods(cls):
+    return {name for name in dir(cls) if not name.startswith('_') and callable(getattr(cls, name))}
+
+
+class TestAsyncHabitTracker(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.clock = SimulatedClock(datetime.date(2023, 1, 2))
+        self.tracker = AsyncHabitTracker(':memory:', clock=self.clock, cache_size=64)
+
+    async def asyncTearDown(self) -> None:
+        await self.tracker.close()
+
+    async def query(self, query):
+        def fetch():
+            return self.tracker.tracker.conn.execute(query).fetchall()
+        return await asyncio.get_running_loop().run_in_executor(self.tracker.executor, fetch)
+
+    async def count_check_offs(self):
+        return (await self.query('SELECT COUNT(*) FROM check_off_table'))[0][0]
+
+    async def test_methods_are_awaitable(self):
+        added = await self.tracker.add_habit('running', 'daily')
+        checked = await self.tracker.check_off('running')
+        habits = await self.tracker.get_all_by_periodicity('daily')
+
+        self.assertEqual(1, added.habit_id)
+        self.assertEqual(CheckOffResult(Status.ON_STREAK, 'running', 1, 1, 1), checked)
+        self.assertEqual([('running', 'daily')], [habit[:2] for habit in habits])
+        self.assertEqual([(1, 1)], await self.query('SELECT current_streak, longest_streak FROM habits_table'))
+
+    async def test_every_tracker_method_is_awaitable(self):
+        self.assertEqual(public_methods(HabitTracker) - NOT_AWAITABLE, public_methods(AsyncHabitTracker) - {'close'})
+
+    async def test_concurrent_check_offs_are_group_committed(self):
+        names = ['habit-{}'.format(number) for number in range(50)]
+        for name in names:
+            await self.tracker.add_habit(name, 'daily')
+
+        await asyncio.gather(*(self.tracker.check_off(name) for name in names))
+
+        self.assertEqual(1, self.tracker.group_commits)
+        self.assertEqual(50, self.tracker.grouped_check_offs)
+        self.assertEqual(50, await self.count_check_offs())
+
+    async def test_group_size_is_limited(self):
+        self.tracker.max_group_size = 8
+        names = ['habit-{}'.format(number) for number in range(20)]
+        for name in names:
+            await self.tracker.add_habit(name, 'weekly')
+
+        await asyncio.gather(*(self.tracker.check_off(name) for name in names))
+
+        self.assertEqual(3, self.tracker.group_commits)
+        self.assertEqual(20, await self.count_check_offs())
+
+    async def test_duplicate_check_offs_in_one_group(self):
+        await self.tracker.add_habit('running', 'daily')
+
+        await asyncio.gather(*(self.tracker.check_off(name) for name in ['running', 'unknown', 'running']))
+
+        self.assertEqual(1, await self.count_check_offs())
+        self.assertEqual([(1, 1)], await self.query('SELECT current_streak, longest_streak FROM habits_table'))
+
+    async def test_failing_check_off_does_not_fail_group(self):
+        await self.tracker.add_habit('running', 'daily')
+        await self.tracker.add_habit('reading', 'daily')
+        check_off = type(self.tracker.tracker).check_off
+
+        def failing_check_off(tracker, name):
+            if name == 'reading':
+                raise RuntimeError('disk is full')
+            return check_off(tracker, name)
+
+        with mock.patch.object(type(self.tracker.tracker), 'check_off', failing_check_off):
+            results = await asyncio.gather(self.tracker.check_off('running'), self.tracker.check_off('reading'),
+                                           return_exceptions=True)
+
+        self.assertEqual(Status.ON_STREAK, results[0].status)
+        self.assertIsInstance(results[1], RuntimeError)
+        self.assertEqual(0, self.tracker.group_commits)
+        self.assertEqual(1, await self.count_check_offs())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src import bitmap
+from src.simulation import SimulatedClock, simulate
+from src.tracker import HabitTracker
+
+
+class TestBitmap(unittest.TestCase):
+
+    def test_bits_are_counted_across_words(self):
+        # the periods 60 to 67, the highest bit of the first word is negative in SQLite
+        words = [(0, -(1 << 63) | 0b1111 << 59), (1, 0b1011)]
+
+        self.assertEqual(7, bitmap.count_bits(words, 60, 67))
+        self.assertEqual(3, bitmap.count_bits(words, 62, 64))
+        self.assertEqual(0, bitmap.count_bits(words, 128, 200))
+
+    def test_run_ends_in_previous_words(self):
+        words = [(2, 0b111), (1, -1), (0, 1 << 63)]
+
+        self.assertEqual(3 + 64 + 1, bitmap.run_ending(words, 130))
+        self.assertEqual(0, bitmap.run_ending(words, 131))
+        self.assertEqual(1, bitmap.run_ending([(2, 0b111), (0, -1)], 128))
+
+    def test_engines_answer_alike(self):
+        answers = {}
+        for engine in ('table', 'bitmap'):
+            clock = SimulatedClock(datetime.date(2023, 1, 2))
+            tracker = HabitTracker(':memory:', clock=clock, history_engine=engine)
+            simulate(tracker, clock, habits=20, days=200, completion=0.9)
+            tracker.add_habit('every day', 'daily')
+            tracker.check_off_many(('every day', datetime.date(2023, 6, 1) + datetime.timedelta(days=day))
+                                   for day in range(51))
+            # history before the retention period is read from the archive
+            tracker.archive(40)
+            names = [habit[0] for habit in tracker.get_all_habits()]
+            answers[engine] = ([(tracker.count_check_offs(name, '2023-03-01', '2023-06-30'),
+                                 tracker.count_check_offs(name, '2023-01-01'), tracker.get_streak_at(name),
+                                 tracker.get_streak_at(name, '2023-06-10')) for name in names],
+                               tracker.get_completed_habits('2023-06-01', '2023-06-30'))
+            tracker.conn.close()
+
+        self.assertEqual(answers['table'], answers['bitmap'])
+        self.assertEqual((30, 51, 51, 10), answers['bitmap'][0][-1])
+        self.assertIn(('every day', 'daily'), answers['bitmap'][1])
+
+    def test_streak_of_open_period(self):
+        clock = SimulatedClock(datetime.date(2023, 6, 5))
+        tracker = HabitTracker(':memory:', clock=clock, history_engine='bitmap')
+        tracker.add_habit('running', 'daily')
+        tracker.add_habit('reading', 'weekly')
+        tracker.check_off_many([('running', '2023-06-02'), ('running', '2023-06-03'), ('running', '2023-06-04'),
+                                ('reading', '2023-05-22'), ('reading', '2023-06-01')])
+
+        # today is not checked-off yet, the streaks still run
+        self.assertEqual(3, tracker.get_streak_at('running'))
+        self.assertEqual(2, tracker.get_streak_at('reading'))
+        self.assertEqual(0, tracker.get_streak_at('running', '2023-06-07'))
+        self.assertEqual(1, tracker.count_check_offs('reading', '2023-05-29'))
+        self.assertEqual([('reading', 'weekly')], tracker.get_completed_habits('2023-05-22', '2023-06-04'))
+        self.assertIsNone(tracker.get_streak_at('missing'))
+        self.assertIsNone(tracker.count_check_offs('missing', '2023-01-01'))
+        tracker.conn.close()
+
+    def test_bitmaps_follow_writes_of_table_engine(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'habits.db')
+            writer = HabitTracker(db_path, clock=SimulatedClock(datetime.date(2023, 6, 5)))
+            reader = HabitTracker(db_path, clock=SimulatedClock(datetime.date(2023, 6, 5)), history_engine='bitmap')
+            writer.add_habit('running', 'daily')
+            writer.add_habit('reading', 'daily')
+            writer.check_off_many([('running', '2023-06-01'), ('running', '2023-06-02'), ('reading', '2023-06-04')])
+            writer.check_off('running')
+            daily = reader.count_check_offs('running', '2023-06-01'), reader.get_streak_at('running', '2023-06-02')
+            writer.change_periodicity('running', 'weekly')
+            weekly = reader.count_check_offs('running', '2023-06-01'), reader.get_streak_at('running')
+            completed = reader.get_completed_habits('2023-06-04', '2023-06-05')
+            writer.delete_habit('running')
+            words = reader.conn.execute('SELECT COUNT(*) FROM habit_bitmap').fetchone()[0]
+            writer.conn.close()
+            reader.conn.close()
+
+        self.assertEqual((3, 2), daily)
+        # 2023-06-01 and 2023-06-02 are in one week, 2023-06-05 starts the next one
+        self.assertEqual((2, 2), weekly)
+        self.assertEqual([('running', 'weekly')], completed)
+        self.assertEqual(1, words)
+
+    def test_stale_bitmaps_are_rebuilt_by_migration(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'habits.db')
+            tracker = HabitTracker(db_path, clock=SimulatedClock(datetime.date(2023, 6, 5)))
+            tracker.add_habit('running', 'daily')
+            tracker.check_off_many([('running', '2023-06-01'), ('running', '2023-06-02'), ('running', '2023-06-05')])
+            # bitsets of the schema version whose trackers with the table engine did not keep them
+            tracker.conn.executescript('DELETE FROM habit_bitmap; PRAGMA user_version = 11;')
+            tracker.conn.close()
+
+            tracker = HabitTracker(db_path, clock=SimulatedClock(datetime.date(2023, 6, 5)), history_engine='bitmap')
+            count = tracker.count_check_offs('running', '2023-06-01')
+            tracker.conn.close()
+
+        self.assertEqual(3, count)
+
+    def test_check_off_sets_bit_with_one_statement(self):
+        tracker = HabitTracker(':memory:', count_statements=True, history_engine='bitmap')
+        tracker.add_habit('running', 'daily')
+        tracker.check_off('running')
+
+        self.assertEqual({'statements': 7, 'commits': 1}, tracker.last_check_off_stats)
+        self.assertRaises(ValueError, HabitTracker, ':memory:', history_engine='column')
+        tracker.conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
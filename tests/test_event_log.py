@@ -0,0 +1,160 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from src.event_log import EventLog, LoggedHabitTracker, read_log
+from src.results import Status
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker, day_key
+
+
+class TestLoggedHabitTracker(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, 'habits.db')
+        self.log_path = self.db_path + '.events'
+        self.clock = SimulatedClock(datetime.date(2023, 1, 2))
+        self.tracker = self.start(apply_interval=60)
+        self.habit_id = self.tracker.add_habit('running', 'daily').habit_id
+
+    def tearDown(self) -> None:
+        self.tracker.close()
+        self.directory.cleanup()
+
+    def start(self, **kwargs):
+        return LoggedHabitTracker(self.db_path, clock=self.clock, **kwargs)
+
+    def check_offs(self):
+        tracker = HabitTracker(self.db_path)
+        check_offs = tracker.conn.execute('SELECT habit_id, date FROM check_off_table').fetchall()
+        tracker.conn.close()
+        return check_offs
+
+    def test_check_off_is_logged_then_applied(self):
+        result = self.tracker.check_off('running')
+
+        self.assertEqual(Status.LOGGED, result.status)
+        self.assertEqual(self.habit_id, result.habit_id)
+        self.assertEqual(Status.NOT_FOUND, self.tracker.check_off('missing').status)
+        self.assertEqual([], self.check_offs())
+        self.assertEqual(1, len(read_log(self.log_path)[0]))
+
+        self.assertEqual(1, self.tracker.apply_logged())
+        self.assertEqual([(self.habit_id, '2023-01-02')], self.check_offs())
+        self.assertEqual(1, self.tracker.get_longest_streak_by_name('running'))
+        self.assertEqual(1, self.tracker.get_stats('running').total_check_offs)
+        # applied records are dropped from the log
+        self.assertEqual(0, os.path.getsize(self.log_path))
+
+    def test_repeated_check_offs_of_a_day_are_applied_once(self):
+        self.tracker.check_off('running')
+        self.tracker.check_off('running')
+        self.clock.advance()
+        self.tracker.check_off('running')
+        self.tracker.apply_logged()
+
+        self.assertEqual(2, len(self.check_offs()))
+        self.assertEqual(2, self.tracker.get_longest_streak_by_name('running'))
+
+    def test_concurrent_check_offs_share_fsyncs(self):
+        names = ['habit-{}'.format(number) for number in range(40)]
+        for name in names:
+            self.tracker.add_habit(name, 'daily')
+        threads = [threading.Thread(target=self.tracker.check_off, args=(name,)) for name in names]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.tracker.apply_logged()
+
+        self.assertLess(self.tracker.log.groups, len(names))
+        self.assertEqual(len(names), len(self.check_offs()))
+
+    def test_applier_thread_applies_logged_check_offs(self):
+        tracker = self.start(log_path=self.log_path + '-2', apply_interval=0.01)
+        tracker.check_off('running')
+        for _ in range(500):
+            if self.check_offs():
+                break
+            threading.Event().wait(0.01)
+        tracker.close()
+
+        self.assertEqual([(self.habit_id, '2023-01-02')], self.check_offs())
+
+    def test_failed_apply_is_retried(self):
+        self.tracker.close()
+        self.tracker = self.start(apply_interval=0.01)
+        failure = mock.patch.object(LoggedHabitTracker, 'apply_events',
+                                    side_effect=sqlite3.OperationalError('database is locked'))
+
+        with failure as apply_events:
+            self.tracker.check_off('running')
+            while apply_events.call_count < 2:
+                time.sleep(0.01)
+            self.assertIsInstance(self.tracker.apply_error, sqlite3.OperationalError)
+            self.assertEqual([], self.check_offs())
+        # the applier thread survived the failures and applies the check-off once the database is writable
+        deadline = time.monotonic() + 5
+        while not self.check_offs() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertTrue(self.tracker.applier.is_alive())
+        self.assertEqual([(self.habit_id, '2023-01-02')], self.check_offs())
+        self.assertEqual(0, os.path.getsize(self.log_path))
+
+    def test_failed_apply_is_replayed_after_restart(self):
+        with mock.patch.object(LoggedHabitTracker, 'apply_events',
+                               side_effect=sqlite3.OperationalError('database is locked')):
+            self.tracker.check_off('running')
+            self.assertRaises(sqlite3.OperationalError, self.tracker.apply_logged)
+            self.assertRaises(sqlite3.OperationalError, self.tracker.close)
+
+        self.tracker = self.start()
+
+        self.assertEqual(1, self.tracker.replayed)
+        self.assertEqual([(self.habit_id, '2023-01-02')], self.check_offs())
+
+    def test_crashed_log_is_replayed_once(self):
+        self.tracker.close()
+        # check-offs acknowledged by a tracker that crashed before applying them, and a torn record
+        log = EventLog(self.log_path)
+        log.append(self.habit_id, day_key(datetime.date(2023, 1, 2)))
+        log.append(self.habit_id, day_key(datetime.date(2023, 1, 3)))
+        log.close()
+        with open(self.log_path, 'ab') as stream:
+            stream.write(b'\x01\x02\x03')
+
+        self.tracker = self.start()
+        self.assertEqual(2, self.tracker.replayed)
+        self.assertEqual(2, len(self.check_offs()))
+        self.assertEqual(2, self.tracker.get_longest_streak_by_name('running'))
+
+        self.tracker.close()
+        self.tracker = self.start()
+        self.assertEqual(0, self.tracker.replayed)
+        self.assertEqual(2, len(self.check_offs()))
+
+    def test_applied_records_left_in_log_are_not_replayed(self):
+        self.tracker.check_off('running')
+        self.tracker.close()
+        # a crash after the apply transaction and before the log was emptied
+        log = EventLog(self.log_path, last_sequence=0)
+        log.append(self.habit_id, day_key(self.clock()))
+        log.close()
+
+        self.tracker = self.start()
+
+        self.assertEqual(0, self.tracker.replayed)
+        self.assertEqual(1, len(self.check_offs()))
+        # sequence numbers continue after the applied ones
+        self.assertEqual(2, self.tracker.log.append(self.habit_id, day_key(self.clock())))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.instrumentation import Instrumentation, normalize
+from src.pool import PooledHabitTracker
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = SimulatedClock(datetime.date(2023, 1, 2))
+        self.instrumentation = Instrumentation()
+        self.tracker = HabitTracker(':memory:', clock=self.clock, instrumentation=self.instrumentation)
+
+    def statements_of(self, method):
+        return {stats['statement']: stats for stats in self.tracker.instrumentation_info()['statements']
+                if stats['method'] == method}
+
+    def test_calls_of_methods_are_counted(self):
+        self.tracker.add_habit('running', 'daily')
+        for day in range(3):
+            self.clock.today = datetime.date(2023, 1, 2) + datetime.timedelta(days=day)
+            self.tracker.check_off('running')
+        self.tracker.get_all_habits()
+
+        methods = self.tracker.instrumentation_info()['methods']
+
+        self.assertEqual(['add_habit', 'check_off', 'get_all_habits'], list(methods))
+        self.assertEqual(3, methods['check_off']['calls'])
+        self.assertLessEqual(methods['check_off']['p50_ms'], methods['check_off']['p99_ms'])
+        self.assertLessEqual(methods['check_off']['p99_ms'], methods['check_off']['max_ms'])
+
+    def test_statements_are_traced_per_method(self):
+        self.tracker.add_habit('running', 'daily')
+        self.tracker.check_off('running')
+        self.tracker.check_off('running')
+
+        statements = self.statements_of('check_off')
+
+        # the first check-off commits, the second one finds the habit checked-off and rolls back
+        self.assertEqual(2, statements['BEGIN IMMEDIATE']['calls'])
+        self.assertEqual(1, statements['COMMIT']['calls'])
+        self.assertEqual(1, statements['ROLLBACK']['calls'])
+        self.assertEqual(1, statements['INSERT INTO check_off_table (habit_id, date) VALUES (?, ...)']['calls'])
+        self.assertEqual([], self.tracker.instrumentation_info()['slow_queries'])
+
+    def test_slow_queries_are_explained(self):
+        self.instrumentation.slow_query_ms = 0
+        self.tracker.add_habit('running', 'daily')
+        self.tracker.get_longest_streak_by_name('running')
+
+        slow_queries = [query for query in self.tracker.instrumentation_info()['slow_queries']
+                        if query['method'] == 'get_longest_streak_by_name']
+
+        self.assertEqual(1, len(slow_queries))
+        self.assertIn("name = 'running'", slow_queries[0]['statement'])
+        self.assertTrue(any('USING INDEX' in detail for detail in slow_queries[0]['plan']))
+        # the EXPLAIN QUERY PLAN is not traced itself
+        self.assertNotIn('EXPLAIN', str(self.tracker.instrumentation_info()['statements']))
+
+    def test_prometheus_text(self):
+        self.tracker.add_habit('running', 'daily')
+
+        text = self.tracker.instrumentation_info(prometheus=True)
+
+        self.assertIn('# TYPE habit_tracker_method_duration_seconds histogram\n', text)
+        self.assertIn('habit_tracker_method_duration_seconds_bucket{method="add_habit",le="+Inf"} 1\n', text)
+        self.assertIn('habit_tracker_method_duration_seconds_count{method="add_habit"} 1\n', text)
+        self.assertIn('habit_tracker_statement_duration_seconds_count{method="add_habit",statement="COMMIT"} 1\n',
+                      text)
+
+    def test_statements_are_normalized(self):
+        self.assertEqual('SELECT a FROM t WHERE name = ? AND id IN (?, ...) LIMIT ?',
+                         normalize("SELECT a FROM t\n    WHERE name = 'it''s' AND id IN (1, 2, 3) LIMIT 10"))
+
+    def test_not_instrumented_by_default(self):
+        tracker = HabitTracker(':memory:', count_statements=True)
+        tracker.add_habit('running', 'daily')
+        tracker.check_off('running')
+
+        self.assertIsNone(tracker.instrumentation_info())
+        self.assertEqual({'statements': 7, 'commits': 1}, tracker.last_check_off_stats)
+
+    def test_statement_counter_works_with_instrumentation(self):
+        tracker = HabitTracker(':memory:', count_statements=True, instrumentation=self.instrumentation)
+        tracker.add_habit('running', 'daily')
+        tracker.check_off('running')
+
+        self.assertEqual({'statements': 7, 'commits': 1}, tracker.last_check_off_stats)
+
+    def test_writes_of_pooled_tracker_are_attributed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = PooledHabitTracker(os.path.join(directory, 'pool.db'), instrumentation=self.instrumentation)
+            tracker.add_habit('running', 'daily')
+            tracker.for_user('someone').add_habit('running', 'daily')
+            tracker.close()
+
+        statements = self.statements_of('add_habit')
+
+        # the writes run on the writer thread of the tracker, with its own connection
+        self.assertEqual(2, self.tracker.instrumentation_info()['methods']['add_habit']['calls'])
+        self.assertEqual(2, statements['COMMIT']['calls'])
+
+
+if __name__ == '__main__':
+    unittest.main()
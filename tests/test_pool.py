@@ -0,0 +1,74 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from src.pool import PooledHabitTracker
+from src.results import Status
+
+
+class TestPooledHabitTracker(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.tracker = PooledHabitTracker(os.path.join(self.directory.name, 'pool.db'), cache_size=64)
+
+    def tearDown(self) -> None:
+        self.tracker.close()
+        self.directory.cleanup()
+
+    def run_threads(self, target, arguments):
+        threads = [threading.Thread(target=target, args=argument) for argument in arguments]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_wal_mode_is_enabled(self):
+        journal_mode = self.tracker.conn.execute('PRAGMA journal_mode').fetchone()[0]
+        synchronous = self.tracker.conn.execute('PRAGMA synchronous').fetchone()[0]
+
+        self.assertEqual('wal', journal_mode)
+        # NORMAL
+        self.assertEqual(1, synchronous)
+
+    def test_every_thread_has_own_connection(self):
+        connections = []
+        self.run_threads(lambda: connections.append(self.tracker.conn), [()] * 3)
+
+        self.assertEqual(3, len({id(conn) for conn in connections}))
+        self.assertNotIn(self.tracker.conn, connections)
+
+    def test_concurrent_check_offs(self):
+        names = ['habit-{}'.format(number) for number in range(40)]
+        for name in names:
+            self.tracker.add_habit(name, 'daily')
+
+        # every habit is checked-off twice, the second check-off of the day is rejected
+        self.run_threads(self.tracker.check_off, [(name,) for name in names * 2])
+
+        check_offs = self.tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        streaks = self.tracker.conn.execute('SELECT DISTINCT current_streak FROM habits_table').fetchall()
+        self.assertEqual(40, check_offs)
+        self.assertEqual([(1,)], streaks)
+
+    def test_concurrent_adds_of_same_habit(self):
+        results = []
+        self.run_threads(lambda: results.append(self.tracker.add_habit('running', 'daily')), [()] * 8)
+
+        self.assertEqual(1, len([result for result in results if result.status is Status.ADDED]))
+
+    def test_readers_see_committed_writes(self):
+        self.tracker.add_habit('running', 'daily')
+        habits = []
+        self.run_threads(lambda: habits.append(self.tracker.get_all_habits()), [()] * 4)
+
+        self.assertEqual([1, 1, 1, 1], [len(found) for found in habits])
+
+    def test_in_memory_database_is_rejected(self):
+        with self.assertRaises(ValueError):
+            PooledHabitTracker(':memory:')
+
+
+if __name__ == '__main__':
+    unittest.main()
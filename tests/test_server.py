@@ -0,0 +1,130 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import unittest
+
+from src.client import connect
+from src.results import CheckOffResult, HabitResult, Status
+from src.server import TrackerServer
+from src.tracker import HabitTracker
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, 'tracker.sock')
+        self.server = TrackerServer(self.socket_path, lambda: HabitTracker(':memory:', cache_size=16))
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05})
+        self.thread.start()
+        self.client = connect(self.socket_path)
+
+    def tearDown(self) -> None:
+        self.client.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        socket_removed = not os.path.exists(self.socket_path)
+        self.directory.cleanup()
+        self.assertTrue(socket_removed)
+
+    def test_methods_run_in_daemon(self):
+        added = self.client.call('add_habit', 'running', 'daily')
+        checked = self.client.call('check_off', 'running')
+        habits = self.client.call('get_all_by_periodicity', 'daily')
+
+        self.assertEqual(HabitResult(Status.ADDED, 'running', 1, 'daily'), added)
+        self.assertEqual(CheckOffResult(Status.ON_STREAK, 'running', 1, 1, 1), checked)
+        self.assertEqual(['running', 'daily'], habits[0][:2])
+
+    def test_streamed_check_off_many(self):
+        self.client.call('add_habit', 'running', 'daily')
+
+        totals = self.client.call('check_off_many', stream=[('running', '2023-06-01'), ('running', '2023-06-02')])
+        streak = self.client.call('get_longest_streak_by_name', 'running')
+
+        self.assertEqual({'checked': 2, 'skipped': 0, 'unknown': 0}, totals)
+        self.assertEqual(2, streak)
+
+    def test_habits_are_streamed_page_by_page(self):
+        for number in range(5):
+            self.client.call('add_habit', 'habit-{}'.format(number), 'daily')
+
+        habits = list(self.client.iter_habits('daily', batch_size=2, after_id=1))
+
+        self.assertEqual([2, 3, 4, 5], [habit[0] for habit in habits])
+        self.assertEqual('habit-1', habits[0][1])
+
+    def test_errors_are_sent_to_client(self):
+        with self.assertRaises(RuntimeError):
+            self.client.call('add_habit', 'running', 'yearly')
+        with self.assertRaises(RuntimeError):
+            self.client.call('migrate')
+
+    def test_failing_stream_is_read_to_its_end(self):
+        self.client.call('add_habit', 'running', 'daily')
+
+        with self.assertRaises(RuntimeError):
+            self.client.call('check_off_many', 1, stream=[('running', '2023-06-01'), ('running', 'bad'),
+                                                          ('running', '2023-06-03')])
+        with self.assertRaises(RuntimeError):
+            self.client.call('compute', stream=[('running', '2023-06-01'), ('running', '2023-06-02')])
+
+        # the chunk before the bad date was committed
+        self.assertEqual(1, self.client.call('get_longest_streak_by_name', 'running'))
+
+    def test_malformed_requests_are_answered_with_errors(self):
+        with socket.socket(socket.AF_UNIX) as sock, sock.makefile('rw') as stream:
+            sock.connect(self.socket_path)
+            stream.write('{"method": \n[1, 2]\n{"method": "get_all_habits", "args": 1}\n'
+                         '{"method": "get_all_habits"}\n')
+            stream.flush()
+            responses = [json.loads(stream.readline()) for _ in range(4)]
+
+        self.assertEqual(['error', 'error', 'error', 'result'], [next(iter(response)) for response in responses])
+
+    def test_slow_stream_does_not_block_other_clients(self):
+        self.client.call('add_habit', 'running', 'daily')
+        with socket.socket(socket.AF_UNIX) as sock, sock.makefile('rw') as stream:
+            sock.connect(self.socket_path)
+            # a stream without its end
+            stream.write('{"method": "check_off_many", "stream": true}\n["running", "2023-06-01"]\n')
+            stream.flush()
+            self.client.sock.settimeout(5)
+
+            streak = self.client.call('get_longest_streak_by_name', 'running')
+            stream.write('\n')
+            stream.flush()
+            totals = json.loads(stream.readline())
+
+        self.assertEqual(0, streak)
+        self.assertEqual({'result': {'checked': 1, 'skipped': 0, 'unknown': 0}}, totals)
+
+    def test_clients_are_served_concurrently(self):
+        self.client.call('add_habit', 'running', 'daily')
+        other_client = connect(self.socket_path)
+
+        streak = other_client.call('get_longest_streak_by_name', 'running')
+        other_client.close()
+
+        self.assertEqual(0, streak)
+
+    def test_requests_run_for_their_user(self):
+        alice = connect(self.socket_path, 'alice')
+        alice.call('add_habit', 'running', 'weekly')
+        self.client.call('add_habit', 'running', 'daily')
+
+        habits = alice.call('get_all_habits')
+        alice.close()
+
+        self.assertEqual([['running', 'weekly']], [habit[:2] for habit in habits])
+        self.assertEqual('daily', self.client.call('get_all_habits')[0][1])
+
+    def test_connect_without_daemon(self):
+        self.assertIsNone(connect(os.path.join(self.directory.name, 'missing.sock')))
+
+
+if __name__ == '__main__':
+    unittest.main()
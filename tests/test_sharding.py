@@ -0,0 +1,132 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from src.sharding import HashRing, ShardedHabitTracker, _delete_users, rebalance
+from src.simulation import SimulatedClock
+from src.tracker import HabitTracker
+
+
+class TestShardedHabitTracker(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.clock = SimulatedClock(datetime.date(2023, 1, 2))
+        self.users = ['user-{}'.format(number) for number in range(40)]
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def paths(self, count):
+        return [os.path.join(self.directory.name, 'shard-{}.db'.format(number)) for number in range(count)]
+
+    def fill(self, tracker):
+        for number, user_id in enumerate(self.users):
+            habits = tracker.for_user(user_id)
+            habits.add_habit('run-' + user_id, 'daily')
+            habits.add_habit('swim-' + user_id, 'weekly')
+            for day in range(number % 5):
+                self.clock.today = datetime.date(2023, 1, 2) + datetime.timedelta(days=day)
+                habits.check_off('run-' + user_id)
+
+    def habits_by_user(self, paths):
+        habits = {}
+        for path in paths:
+            tracker = HabitTracker(path)
+            for user_id, name, streak, check_offs in tracker.conn.execute(
+                    """SELECT user_id, name, longest_streak,
+                              (SELECT COUNT(*) FROM check_off_table WHERE habit_id = habits_table.habit_id)
+                       FROM habits_table"""):
+                habits.setdefault(user_id, set()).add((name, streak, check_offs, os.path.basename(path)))
+            tracker.conn.close()
+        return habits
+
+    def test_ring_moves_few_keys_when_a_shard_is_added(self):
+        before = HashRing(['a', 'b', 'c', 'd'])
+        after = HashRing(['a', 'b', 'c', 'd', 'e'])
+        moved = [key for key in map(str, range(10000)) if before.shard_for(key) != after.shard_for(key)]
+
+        self.assertTrue(all(after.shard_for(key) == 'e' for key in moved))
+        self.assertLess(len(moved), 3000)
+        self.assertEqual({'a', 'b', 'c', 'd'}, {before.shard_for(key) for key in map(str, range(100))})
+
+    def test_users_are_routed_to_one_shard(self):
+        tracker = ShardedHabitTracker(self.paths(3), clock=self.clock)
+        self.fill(tracker)
+        self.assertEqual(4, tracker.for_user('user-4').get_longest_streak_by_name('run-user-4'))
+        self.assertIsNone(tracker.for_user('user-3').get_longest_streak_by_name('run-user-4'))
+        tracker.close()
+
+        habits = self.habits_by_user(self.paths(3))
+        self.assertEqual(set(self.users), set(habits))
+        # the habits of a user are in one shard, the shards share the users
+        self.assertTrue(all(len({habit[3] for habit in user_habits}) == 1 for user_habits in habits.values()))
+        self.assertEqual(3, len({habit[3] for user_habits in habits.values() for habit in user_habits}))
+
+    def test_cross_shard_reads_are_merged(self):
+        tracker = ShardedHabitTracker(self.paths(3), clock=self.clock)
+        self.fill(tracker)
+
+        habits = tracker.get_all_habits()
+        top = tracker.top_streaks(5, 'longest', 'daily')
+        tracker.close()
+
+        self.assertEqual(80, len(habits))
+        self.assertEqual(sorted(self.users), [habit[0] for habit in habits[::2]])
+        self.assertEqual(['run-', 'swim-'], [habit[1][:habit[1].index('-') + 1] for habit in habits[:2]])
+        self.assertEqual(5, len(top))
+        self.assertEqual([4] * 5, [habit[3] for habit in top])
+        self.assertTrue(all(habit[1] == 'run-' + habit[0] for habit in top))
+
+    def test_rebalance_moves_users_to_their_new_shard(self):
+        tracker = ShardedHabitTracker(self.paths(2), clock=self.clock)
+        self.fill(tracker)
+        tracker.close()
+        before = self.habits_by_user(self.paths(2))
+
+        moved = rebalance(self.paths(2), self.paths(3))
+        tracker = ShardedHabitTracker(self.paths(3), clock=self.clock)
+        routed = {user_id: os.path.basename(tracker.shard_for(user_id).db_path) for user_id in self.users}
+        tracker.close()
+        after = self.habits_by_user(self.paths(3))
+
+        self.assertEqual(sum(shard == 'shard-2.db' for shard in routed.values()), moved['users'])
+        self.assertEqual(2 * moved['users'], moved['habits'])
+        for user_id in self.users:
+            self.assertEqual({habit[:3] for habit in before[user_id]}, {habit[:3] for habit in after[user_id]})
+            self.assertEqual({routed[user_id]}, {habit[3] for habit in after[user_id]})
+        # nothing is left to move
+        self.assertEqual({'users': 0, 'habits': 0}, rebalance(self.paths(3), self.paths(3)))
+
+    def test_failing_delete_leaves_transaction_of_caller(self):
+        tracker = HabitTracker(':memory:', user_id='alice')
+        tracker.add_habit('running', 'daily')
+        tracker.conn.execute("CREATE TEMP TRIGGER full_disk BEFORE DELETE ON check_off_table "
+                             "BEGIN SELECT RAISE(ABORT, 'disk is full'); END")
+
+        tracker.conn.execute('BEGIN IMMEDIATE')
+        tracker.check_off('running')
+        self.assertRaises(sqlite3.IntegrityError, _delete_users, tracker.conn, [('alice',)])
+        in_transaction = tracker.conn.in_transaction
+        tracker.conn.commit()
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        tracker.conn.close()
+
+        self.assertTrue(in_transaction)
+        self.assertEqual(1, check_offs)
+
+    def test_rebalance_empties_removed_shard(self):
+        tracker = ShardedHabitTracker(self.paths(3), clock=self.clock)
+        self.fill(tracker)
+        tracker.close()
+
+        rebalance(self.paths(3), self.paths(2))
+
+        self.assertEqual(set(self.users), set(self.habits_by_user(self.paths(2))))
+        self.assertEqual({}, self.habits_by_user(self.paths(3)[2:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import datetime
+import unittest
+
+from src.simulation import SimulatedClock, simulate
+from src.tracker import HabitTracker
+
+
+class TestSimulation(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.clock = SimulatedClock(datetime.date(2022, 12, 1))
+        self.tracker = HabitTracker(':memory:', clock=self.clock)
+
+    def tearDown(self) -> None:
+        self.tracker.conn.close()
+
+    def test_clock_advances(self):
+        self.assertEqual(datetime.date(2022, 12, 3), self.clock.advance(2))
+        self.assertEqual(datetime.date(2022, 12, 3), self.clock())
+
+    def test_simulated_check_offs_are_dated_by_clock(self):
+        result = simulate(self.tracker, self.clock, habits=10, days=20, completion=1)
+
+        dates = self.tracker.conn.execute('SELECT MIN(date), MAX(date) FROM check_off_table').fetchone()
+        self.assertEqual(20, result['days'])
+        self.assertEqual(200, result['attempts'])
+        self.assertEqual(('2022-12-01', '2022-12-20'), dates)
+
+    def test_incremental_streaks_match_recomputed_streaks(self):
+        for bulk in (False, True):
+            with self.subTest(bulk=bulk):
+                clock = SimulatedClock(datetime.date(2022, 12, 1))
+                tracker = HabitTracker(':memory:', clock=clock)
+                simulate(tracker, clock, habits=20, days=120, completion=0.7, bulk=bulk)
+                incremental = tracker.conn.execute('SELECT habit_id, current_streak, longest_streak '
+                                                   'FROM habits_table ORDER BY habit_id').fetchall()
+                tracker.recompute_streaks()
+                recomputed = tracker.conn.execute('SELECT habit_id, current_streak, longest_streak '
+                                                  'FROM habits_table ORDER BY habit_id').fetchall()
+                tracker.conn.close()
+
+                self.assertEqual(incremental, recomputed)
+
+    def test_incremental_stats_match_rebuilt_stats(self):
+        for bulk in (False, True):
+            with self.subTest(bulk=bulk):
+                clock = SimulatedClock(datetime.date(2022, 12, 1))
+                tracker = HabitTracker(':memory:', clock=clock)
+                simulate(tracker, clock, habits=20, days=200, completion=0.1, bulk=bulk)
+                query = 'SELECT * FROM habit_stats ORDER BY habit_id'
+                incremental = tracker.conn.execute(query).fetchall()
+                tracker.rebuild_stats()
+                rebuilt = tracker.conn.execute(query).fetchall()
+                tracker.conn.close()
+
+                self.assertEqual(20, len(incremental))
+                self.assertEqual(incremental, rebuilt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.simulation import SimulatedClock, simulate
+from src.snapshot import SnapshotReader, write_snapshot
+from src.tracker import HabitTracker, day_key, week_key
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'habits.snapshot')
+        self.clock = SimulatedClock(datetime.date(2022, 12, 1))
+        self.tracker = HabitTracker(os.path.join(self.directory.name, 'habits.db'), clock=self.clock)
+
+    def tearDown(self) -> None:
+        self.tracker.conn.close()
+        self.directory.cleanup()
+
+    def test_snapshot_answers_like_tracker(self):
+        simulate(self.tracker, self.clock, habits=30, days=40, completion=0.8)
+        self.tracker.add_habit('ünïcode', 'weekly')
+        self.assertEqual(31, write_snapshot(self.tracker, self.path))
+
+        with SnapshotReader(self.path) as reader:
+            for method, args in (('get_all_habits', ()), ('get_all_by_periodicity', ('weekly',)),
+                                 ('get_current_longest_streak', ()), ('get_longest_streak', ()),
+                                 ('top_streaks', (5,)), ('top_streaks', (5, 'longest', 'daily')),
+                                 ('get_habits_page', (None, 7, 10)), ('get_habits_page', ('daily', 100, 3)),
+                                 ('get_habit_ids', (['habit-4', 'missing', 'ünïcode'],))):
+                with self.subTest(method=method, args=args):
+                    self.assertEqual(getattr(self.tracker, method)(*args), getattr(reader, method)(*args))
+            self.assertEqual(list(self.tracker.iter_habits('weekly', 4)), list(reader.iter_habits('weekly', 4)))
+            for name in ('habit-0', 'habit-29', 'ünïcode', 'missing', ''):
+                self.assertEqual(self.tracker.get_longest_streak_by_name(name),
+                                 reader.get_longest_streak_by_name(name))
+
+    def test_last_period(self):
+        self.tracker.add_habit('read', 'daily')
+        self.tracker.add_habit('swim', 'weekly')
+        self.tracker.add_habit('idle', 'daily')
+        self.tracker.check_off('read')
+        self.tracker.check_off('swim')
+        write_snapshot(self.tracker, self.path)
+
+        with SnapshotReader(self.path) as reader:
+            self.assertEqual(day_key(self.clock()), reader.get_habit('read')[6])
+            self.assertEqual(week_key(self.clock()), reader.get_habit('swim')[6])
+            self.assertIsNone(reader.get_habit('idle')[6])
+            self.assertIsNone(reader.get_habit('missing'))
+
+    def test_staleness(self):
+        self.tracker.add_habit('read', 'daily')
+        write_snapshot(self.tracker, self.path)
+
+        with SnapshotReader(self.path) as reader:
+            self.assertFalse(reader.is_stale())
+            self.tracker.check_off('read')
+            self.assertTrue(reader.is_stale())
+            self.assertEqual(0, reader.get_longest_streak_by_name('read'))
+
+    def test_empty_database(self):
+        write_snapshot(self.tracker, self.path)
+
+        with SnapshotReader(self.path) as reader:
+            self.assertEqual([], reader.get_all_habits())
+            self.assertEqual([], reader.get_longest_streak())
+            self.assertIsNone(reader.get_habit('read'))
+
+    def test_other_file(self):
+        with open(self.path, 'wb') as stream:
+            stream.write(b'HABITS\x00\x01')
+
+        with self.assertRaises(ValueError):
+            SnapshotReader(self.path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,24 @@ import datetime
 import unittest
 from sqlite3 import IntegrityError
 
+import os
 import random
+import sqlite3
 import string
+import tempfile
 
-from src.tracker import HabitTracker
+from src.results import CheckOffResult, HabitResult, HabitStats, Status
+from src.simulation import SimulatedClock, simulate
+from src.tracker import HabitTracker, MIGRATIONS, day_key, iter_check_offs, week_key
 
 tracker_instance = HabitTracker('test.db')
 
+# the habits table of the first schema version
+OLD_HABITS_TABLE = """CREATE TABLE habits_table (habit_id INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                        periodicity TEXT CHECK (periodicity IN ("daily","weekly")),
+                        creation_date DATETIME DEFAULT CURRENT_TIMESTAMP, current_streak INT DEFAULT 0,
+                        longest_streak INT DEFAULT 0, UNIQUE (name))"""
+
 
 def generate_random_string(length):
     letters = string.ascii_letters + string.digits
@@ -67,7 +78,7 @@ class TestHabitTracker(unittest.TestCase):
 
     def test_nothing_happened_when_delete_nonexisted_habit(self):
         actual_result = tracker_instance.delete_habit('something that doest exist')
-        self.assertIsNone(actual_result)
+        self.assertEqual(Status.NOT_FOUND, actual_result.status)
 
     def test_habit_deletion_successful(self):
         tracker_instance.add_habit(self.habit_name, self.valid_habit_periodicity)
@@ -78,6 +89,165 @@ class TestHabitTracker(unittest.TestCase):
                                                      (self.habit_name,)).fetchone()
         self.assertEqual(0, found_habits[0])
 
+    def test_deleted_habit_takes_its_history_along(self):
+        tracker = HabitTracker(':memory:')
+        tracker.add_habit('running', 'daily')
+        tracker.add_habit('reading', 'daily')
+        tracker.check_off_many([('running', '2023-06-01'), ('running', '2023-06-02'), ('reading', '2023-06-01')])
+
+        tracker.delete_habit('running')
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        stats = tracker.conn.execute('SELECT COUNT(*) FROM habit_stats').fetchone()[0]
+        plan = tracker.conn.execute('EXPLAIN QUERY PLAN DELETE FROM check_off_table WHERE habit_id = 1').fetchall()
+        tracker.conn.close()
+
+        self.assertEqual(1, check_offs)
+        self.assertEqual(1, stats)
+        # the cascade finds the check-offs of a habit with a seek on their index
+        self.assertIn('check_off_habit_period_idx', plan[0][3])
+
+    def test_delete_habits(self):
+        tracker = HabitTracker(':memory:')
+        for name in ('running', 'reading', 'swimming'):
+            tracker.add_habit(name, 'daily')
+            tracker.check_off(name)
+        tracker.for_user('alice').add_habit('running', 'daily')
+
+        results = tracker.delete_habits(['swimming', 'missing', 'running', 'swimming'], chunk_size=2)
+        names = [habit[0] for habit in tracker.get_all_habits()]
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        alice_habits = tracker.for_user('alice').get_all_habits()
+        tracker.conn.close()
+
+        self.assertEqual([HabitResult(Status.DELETED, 'swimming', 3), HabitResult(Status.NOT_FOUND, 'missing'),
+                          HabitResult(Status.DELETED, 'running', 1)], results)
+        self.assertEqual(['reading'], names)
+        self.assertEqual(1, check_offs)
+        self.assertEqual(1, len(alice_habits))
+
+    def test_migration_deletes_history_of_deleted_habits(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'old.db')
+            tracker = HabitTracker(db_path)
+            tracker.add_habit('running', 'daily')
+            tracker.add_habit('reading', 'daily')
+            tracker.check_off_many([('running', '2023-06-01'), ('reading', '2023-06-01')])
+            # habits were deleted without their check-offs and statistics before foreign keys were enforced
+            tracker.conn.executescript("""
+                PRAGMA foreign_keys = OFF;
+                DROP VIEW check_off_history;
+                DROP TABLE check_off_archive;
+                DROP TABLE habit_bitmap;
+                DELETE FROM habits_table WHERE name = 'running';
+                INSERT INTO check_off_table (habit_id, date) VALUES (7, '2023-06-01');
+                PRAGMA user_version = 8;""")
+            tracker.conn.close()
+
+            tracker = HabitTracker(db_path)
+            check_offs = tracker.conn.execute('SELECT habit_id FROM check_off_table').fetchall()
+            stats = tracker.conn.execute('SELECT habit_id FROM habit_stats').fetchall()
+            foreign_keys = tracker.conn.execute('PRAGMA foreign_keys').fetchone()[0]
+            tracker.conn.close()
+
+        self.assertEqual([(2,)], check_offs)
+        self.assertEqual([(2,)], stats)
+        self.assertEqual(1, foreign_keys)
+
+    def test_compact_frees_pages_incrementally(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'compact.db')
+            tracker = HabitTracker(db_path)
+            names = ['habit-{}'.format(number) for number in range(200)]
+            for name in names:
+                tracker.add_habit(name, 'daily')
+            tracker.check_off_many((name, datetime.date(2023, 1, 1) + datetime.timedelta(days=day))
+                                   for name in names for day in range(50))
+            tracker.delete_habits(names)
+            size = os.path.getsize(db_path)
+
+            partial = tracker.compact(pages=10, step=4)
+            compacted = tracker.compact()
+            free_pages = tracker.conn.execute('PRAGMA freelist_count').fetchone()[0]
+            tracker.conn.close()
+            compacted_size = os.path.getsize(db_path)
+
+        self.assertFalse(partial['vacuumed'])
+        self.assertEqual(10, partial['freed_pages'])
+        self.assertEqual(partial['free_pages'], compacted['freed_pages'])
+        self.assertEqual(0, free_pages)
+        self.assertEqual(size - compacted_size,
+                         (partial['freed_pages'] + compacted['freed_pages']) * compacted['page_size'])
+
+    def test_compact_switches_old_database_to_incremental_vacuum(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'old.db')
+            conn = sqlite3.connect(db_path)
+            conn.execute(OLD_HABITS_TABLE)
+            conn.commit()
+            conn.close()
+            tracker = HabitTracker(db_path)
+            mode = tracker.conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+
+            compacted = tracker.compact()
+            compacted_mode = tracker.conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+            tracker.conn.close()
+
+        self.assertEqual(0, mode)
+        self.assertTrue(compacted['vacuumed'])
+        self.assertEqual(2, compacted_mode)
+
+    def test_archived_history_is_read_with_the_check_offs(self):
+        clock = SimulatedClock(datetime.date(2023, 1, 2))
+        tracker = HabitTracker(':memory:', clock=clock)
+        simulate(tracker, clock, habits=20, days=200, completion=0.7)
+        streaks_query = 'SELECT habit_id, current_streak, longest_streak FROM habits_table ORDER BY habit_id'
+        history = list(iter_check_offs(tracker.conn))
+        streaks = tracker.conn.execute(streaks_query).fetchall()
+        stats = tracker.get_stats_all()
+
+        archived = tracker.archive(30, batch_size=7)
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        archived_history = list(iter_check_offs(tracker.conn))
+        view = tracker.conn.execute('SELECT habit_id, day_key FROM check_off_history ORDER BY habit_id, day_key')
+        view_history = view.fetchall()
+        tracker.recompute_streaks()
+        tracker.rebuild_stats()
+        archived_again = tracker.archive(30)
+
+        self.assertEqual(len(history) - check_offs, archived['check_offs'])
+        self.assertEqual('2023-06-21', archived['cutoff'])
+        # at most the 31 days of the retention period, or the last check-off of a habit, are left
+        self.assertLessEqual(check_offs, 20 * 31)
+        self.assertEqual(history, archived_history)
+        self.assertEqual(history, view_history)
+        self.assertEqual(streaks, tracker.conn.execute(streaks_query).fetchall())
+        self.assertEqual(stats, tracker.get_stats_all())
+        self.assertEqual(0, archived_again['check_offs'])
+        tracker.conn.close()
+
+    def test_archive_keeps_last_check_off_of_every_habit(self):
+        clock = SimulatedClock(datetime.date(2023, 1, 30))
+        tracker = HabitTracker(':memory:', clock=clock)
+        tracker.add_habit('running', 'daily')
+        tracker.check_off_many([('running', '2023-01-{:02}'.format(day)) for day in range(1, 31)])
+
+        # January up to the 20th, and later the rest of it except its last check-off
+        first = tracker.archive(10)
+        clock.advance(days=60)
+        second = tracker.archive(10)
+        masks = tracker.conn.execute('SELECT month_day_key, days FROM check_off_archive').fetchall()
+        check_offs = tracker.conn.execute('SELECT date FROM check_off_table').fetchall()
+        broken = tracker.check_off('running')
+        tracker.delete_habit('running')
+        archived = tracker.conn.execute('SELECT COUNT(*) FROM check_off_archive').fetchone()[0]
+        tracker.conn.close()
+
+        self.assertEqual((19, 10), (first['check_offs'], second['check_offs']))
+        self.assertEqual([(day_key(datetime.date(2023, 1, 1)), (1 << 29) - 1)], masks)
+        self.assertEqual([('2023-01-30',)], check_offs)
+        self.assertEqual(CheckOffResult(Status.STREAK_BROKEN, 'running', 1, 1, 30), broken)
+        self.assertEqual(0, archived)
+
     def test_change_name_for_existed_habit(self):
         tracker_instance.add_habit(self.habit_name, self.valid_habit_periodicity)
 
@@ -101,7 +271,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(1, found_habits[0])
 
     def test_check_off_daily_successful(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -116,7 +286,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(current_streak[0], 1)
 
     def test_check_off_weekly_successful(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -131,7 +301,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(current_streak[0], 1)
 
     def test_two_daily_check_offs(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -152,7 +322,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(actual_dates, expected_dates)
 
     def test_two_weekly_check_offs(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -177,11 +347,11 @@ class TestHabitTracker(unittest.TestCase):
 
         check_offs = tracker_instance.conn.execute('SELECT count(*) FROM check_off_table').fetchone()
 
-        self.assertEqual(actual_result, None)
+        self.assertEqual(actual_result, CheckOffResult(Status.NOT_FOUND, self.habit_name))
         self.assertEqual(0, check_offs[0])
 
     def test_check_off_already_checked_daily(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         tracker_instance.check_off(self.habit_name)
         tracker_instance.check_off(self.habit_name)
@@ -195,7 +365,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(actual_dates, expected_dates)
 
     def test_check_off_already_checked_weekly(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
 
         tracker_instance.check_off(self.habit_name)
         tracker_instance.check_off(self.habit_name)
@@ -209,7 +379,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(actual_dates, expected_dates)
 
     def test_check_off_breaking_habit_daily(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -233,7 +403,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(1, current_streak[0])
 
     def test_check_off_breaking_habit_weekly(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -257,7 +427,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(1, current_streak[0])
 
     def test_check_off_on_streak_daily(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -275,7 +445,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(2, current_streak[0])
 
     def test_check_off_on_streak_weekly(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -324,7 +494,7 @@ class TestHabitTracker(unittest.TestCase):
         habit_name_1 = generate_random_string(8)
         habit_name_2 = generate_random_string(8)
         tracker_instance.add_habit(habit_name_1, 'daily')
-        habit_id_2 = tracker_instance.add_habit(habit_name_2, 'daily')
+        habit_id_2 = tracker_instance.add_habit(habit_name_2, 'daily').habit_id
 
         tracker_instance.check_off(habit_name_1)
 
@@ -355,7 +525,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(2, len(current_longest_streak))
 
     def test_get_current_longest_streak_zero(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         current_streak = tracker_instance.conn.execute('SELECT current_streak FROM habits_table WHERE habit_id = ?',
                                                        (habit_id,)).fetchone()
@@ -363,7 +533,7 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(current_streak[0], 0)
 
     def test_longest_streak_of_all_time_successful(self):
-        habit_id = tracker_instance.add_habit(self.habit_name, 'daily')
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
 
         tracker_instance.check_off(self.habit_name)
 
@@ -417,6 +587,532 @@ class TestHabitTracker(unittest.TestCase):
         self.assertEqual(1, longest_streak_of_all_time[0][0])
         self.assertEqual(1, longest_streak_of_all_time[1][0])
 
+    def test_top_streaks(self):
+        tracker = HabitTracker(':memory:')
+        for number, (periodicity, current_streak, longest_streak) in enumerate(
+                [('daily', 3, 5), ('weekly', 7, 7), ('daily', 3, 9), ('weekly', 1, 4)]):
+            tracker.add_habit('habit-{}'.format(number), periodicity)
+            tracker.conn.execute('UPDATE habits_table SET current_streak = ?, longest_streak = ? WHERE habit_id = ?',
+                                 (current_streak, longest_streak, number + 1))
+
+        current = tracker.top_streaks(3)
+        longest = tracker.top_streaks(2, kind='longest')
+        daily = tracker.top_streaks(5, periodicity='daily')
+        plan = ' '.join(row[-1] for row in tracker.conn.execute(
+            'EXPLAIN QUERY PLAN SELECT habit_id FROM habits_table INDEXED BY habits_longest_streak_idx '
+            'ORDER BY longest_streak DESC, habit_id LIMIT 10'))
+        tracker.conn.close()
+
+        self.assertEqual([(2, 'habit-1', 'weekly', 7), (1, 'habit-0', 'daily', 3), (3, 'habit-2', 'daily', 3)],
+                         current)
+        self.assertEqual([(3, 'habit-2', 'daily', 9), (2, 'habit-1', 'weekly', 7)], longest)
+        self.assertEqual([1, 3], [habit[0] for habit in daily])
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertRaises(ValueError, tracker.top_streaks, 3, 'weekly')
+
+    def test_stats_are_maintained_by_check_offs(self):
+        clock = SimulatedClock(datetime.date(2023, 6, 1))
+        tracker = HabitTracker(':memory:', clock=clock)
+        habit_id = tracker.add_habit(self.habit_name, 'daily').habit_id
+        idle_id = tracker.add_habit(generate_random_string(8), 'weekly').habit_id
+        # 2023-06-01, 2023-06-02 and then 2023-06-26 to 2023-06-30
+        for day in [0, 1, 25, 26, 27, 28, 29]:
+            clock.today = datetime.date(2023, 6, 1) + datetime.timedelta(days=day)
+            tracker.check_off(self.habit_name)
+        clock.today = datetime.date(2023, 7, 2)
+
+        stats = tracker.get_stats(self.habit_name)
+        all_stats = tracker.get_stats_all()
+        missing = tracker.get_stats('missing')
+        tracker.delete_habit(self.habit_name)
+        rows = tracker.conn.execute('SELECT COUNT(*) FROM habit_stats').fetchone()[0]
+        tracker.conn.close()
+
+        self.assertEqual(HabitStats(habit_id=habit_id, name=self.habit_name, periodicity='daily', current_streak=5,
+                                    longest_streak=5, total_check_offs=7, first_check_off='2023-06-01',
+                                    last_check_off='2023-06-30', last_7_days=5, last_30_days=5,
+                                    completion_rate=7 / 32), stats)
+        self.assertEqual([habit_id, idle_id], [habit.habit_id for habit in all_stats])
+        self.assertEqual((0, None, 0.0), (all_stats[1].total_check_offs, all_stats[1].last_check_off,
+                                          all_stats[1].completion_rate))
+        self.assertIsNone(missing)
+        self.assertEqual(0, rows)
+
+    def test_schema_is_migrated_to_latest_version(self):
+        version = tracker_instance.conn.execute('PRAGMA user_version').fetchone()[0]
+
+        self.assertEqual(len(MIGRATIONS), version)
+
+    def test_last_check_off_is_index_seek(self):
+        plan = tracker_instance.conn.execute('EXPLAIN QUERY PLAN SELECT date, day_key, week_key FROM check_off_table '
+                                             'WHERE habit_id = ? ORDER BY day_key DESC LIMIT 1', (1,)).fetchall()
+        details = ' '.join(row[-1] for row in plan)
+
+        self.assertIn('COVERING INDEX check_off_habit_period_idx', details)
+        self.assertNotIn('TEMP B-TREE', details)
+
+    def test_iter_habits_pages_by_habit_id(self):
+        tracker = HabitTracker(':memory:')
+        for number in range(7):
+            tracker.add_habit('habit-{}'.format(number), ('daily', 'weekly')[number % 2])
+
+        all_names = [habit[1] for habit in tracker.iter_habits(batch_size=3)]
+        weekly_ids = [habit[0] for habit in tracker.iter_habits('weekly', batch_size=2)]
+        resumed_ids = [habit[0] for habit in tracker.iter_habits(batch_size=2, after_id=5)]
+        page = tracker.get_habits_page('daily', limit=2, after_id=1)
+        tracker.conn.close()
+
+        self.assertEqual(['habit-{}'.format(number) for number in range(7)], all_names)
+        self.assertEqual([2, 4, 6], weekly_ids)
+        self.assertEqual([6, 7], resumed_ids)
+        self.assertEqual([3, 5], [habit[0] for habit in page])
+
+    def test_habits_page_of_periodicity_is_index_seek(self):
+        plan = tracker_instance.conn.execute('EXPLAIN QUERY PLAN SELECT habit_id, name FROM habits_table '
+                                             'WHERE periodicity = ? AND habit_id > ? ORDER BY habit_id LIMIT ?',
+                                             ('daily', 0, 10)).fetchall()
+        details = ' '.join(row[-1] for row in plan)
+
+        self.assertIn('INDEX habits_periodicity_idx (periodicity=? AND rowid>?)', details)
+        self.assertNotIn('TEMP B-TREE', details)
+
+    def test_users_have_their_own_habit_names(self):
+        tracker = HabitTracker(':memory:')
+        alice, bob = tracker.for_user('alice'), tracker.for_user('bob')
+
+        added = [alice.add_habit('run', 'daily'), bob.add_habit('run', 'weekly'), tracker.add_habit('run', 'daily')]
+        duplicate = bob.add_habit('run', 'daily')
+        alice.check_off('run')
+        renamed = bob.change_name('run', 'jog')
+        deleted = tracker.delete_habit('run')
+
+        self.assertEqual([Status.ADDED] * 3, [result.status for result in added])
+        self.assertEqual(Status.DUPLICATE, duplicate.status)
+        self.assertEqual(added[1].habit_id, renamed.habit_id)
+        self.assertEqual(added[2].habit_id, deleted.habit_id)
+        self.assertEqual([('run', 1)], [(habit[1], habit[3]) for habit in alice.top_streaks(5)])
+        self.assertEqual(['jog'], [habit[0] for habit in bob.get_all_habits()])
+        self.assertEqual([], tracker.get_all_habits())
+        tracker.conn.close()
+
+    def test_queries_of_a_user_are_index_seeks(self):
+        tracker = HabitTracker(':memory:', user_id='alice')
+        statements = []
+        tracker.conn.set_trace_callback(statements.append)
+        tracker.get_longest_streak_by_name('run')
+        tracker.get_habits_page('daily', 10)
+        tracker.get_all_habits()
+        tracker.get_current_longest_streak()
+        tracker.top_streaks(10, 'longest', 'weekly')
+        tracker.conn.set_trace_callback(None)
+
+        for statement in statements:
+            with self.subTest(statement=statement):
+                plan = ' '.join(row[-1] for row in tracker.conn.execute('EXPLAIN QUERY PLAN ' + statement))
+                self.assertIn('(user_id=?', plan)
+                self.assertNotIn('SCAN', plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+        tracker.conn.close()
+
+    def test_single_user_database_is_migrated_to_users(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'old.db')
+            tracker = HabitTracker(db_path)
+            tracker.add_habit('run', 'daily')
+            tracker.check_off('run')
+            # the schema before habits had users, dropping its habits must not delete their check-offs
+            tracker.conn.executescript("""
+                PRAGMA foreign_keys = OFF;
+                DROP VIEW check_off_history;
+                DROP TABLE check_off_archive;
+                DROP TABLE habit_bitmap;
+                CREATE TABLE old_habits (habit_id INTEGER PRIMARY KEY, name TEXT NOT NULL,
+                    periodicity TEXT CHECK (periodicity IN ("daily","weekly")),
+                    creation_date DATETIME DEFAULT CURRENT_TIMESTAMP, current_streak INT DEFAULT 0,
+                    longest_streak INT DEFAULT 0, UNIQUE (name));
+                INSERT INTO old_habits SELECT habit_id, name, periodicity, creation_date, current_streak,
+                    longest_streak FROM habits_table;
+                DROP TABLE habits_table;
+                ALTER TABLE old_habits RENAME TO habits_table;
+                PRAGMA user_version = 6;""")
+            tracker.conn.close()
+
+            tracker = HabitTracker(db_path)
+            alice = tracker.for_user('alice')
+            added = alice.add_habit('run', 'weekly')
+            streak = tracker.get_longest_streak_by_name('run')
+            indexes = [row[0] for row in tracker.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'habits_table'")]
+            tracker.conn.close()
+
+        self.assertEqual(Status.ADDED, added.status)
+        self.assertEqual(1, streak)
+        self.assertIn('habits_user_current_streak_idx', indexes)
+        self.assertIn('habits_periodicity_idx', indexes)
+
+    def test_migration_removes_duplicated_check_offs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'old.db')
+            conn = sqlite3.connect(db_path)
+            conn.execute(OLD_HABITS_TABLE)
+            conn.execute("INSERT INTO habits_table (habit_id, name, periodicity) VALUES (1, 'run', 'daily')")
+            conn.execute('CREATE TABLE check_off_table (id INTEGER PRIMARY KEY, habit_id INT, date DATE)')
+            conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                             [(1, '2023-06-01'), (1, '2023-06-01'), (1, '2023-06-02')])
+            conn.commit()
+            conn.close()
+
+            tracker = HabitTracker(db_path)
+            dates = tracker.conn.execute('SELECT date FROM check_off_table ORDER BY date').fetchall()
+            tracker.conn.close()
+
+        self.assertEqual([('2023-06-01',), ('2023-06-02',)], dates)
+
+    def test_check_off_is_one_transaction(self):
+        with tempfile.TemporaryDirectory() as directory:
+            tracker = HabitTracker(os.path.join(directory, 'counted.db'), count_statements=True)
+            habit_id = tracker.add_habit(self.habit_name, 'daily').habit_id
+            tracker.conn.execute('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                 (habit_id, (datetime.date.today() - datetime.timedelta(days=1)).isoformat()))
+            tracker.conn.commit()
+
+            tracker.check_off(self.habit_name)
+            streaks = tracker.conn.execute('SELECT current_streak, longest_streak FROM habits_table').fetchone()
+            tracker.conn.close()
+
+        # BEGIN IMMEDIATE, SELECT, UPDATE ... RETURNING, INSERT, the statistics and bitset upserts and COMMIT
+        self.assertEqual({'statements': 7, 'commits': 1}, tracker.last_check_off_stats)
+        self.assertEqual((1, 1), streaks)
+
+    def test_failing_check_off_leaves_transaction_of_caller(self):
+        tracker = HabitTracker(':memory:', cache_size=16)
+        tracker.add_habit('running', 'daily')
+        tracker.add_habit('reading', 'daily')
+        tracker.conn.execute("CREATE TEMP TRIGGER full_disk BEFORE INSERT ON check_off_table "
+                             "WHEN NEW.habit_id = 2 BEGIN SELECT RAISE(ABORT, 'disk is full'); END")
+
+        tracker.conn.execute('BEGIN IMMEDIATE')
+        tracker.check_off('running')
+        self.assertRaises(IntegrityError, tracker.check_off, 'reading')
+        in_transaction = tracker.conn.in_transaction
+        tracker.conn.commit()
+        check_offs = tracker.conn.execute('SELECT habit_id FROM check_off_table').fetchall()
+        tracker.conn.close()
+
+        self.assertTrue(in_transaction)
+        self.assertEqual([(1,)], check_offs)
+
+    def assert_failure_leaves_transaction_of_caller(self, event, write):
+        """
+        Makes a write fail with a trigger inside a transaction of the caller that already checked-off a habit.
+        :param event: The event of the trigger, e.g. 'INSERT ON habit_stats'.
+        :param write: Callable running the write on the tracker.
+        """
+        tracker = HabitTracker(':memory:', clock=SimulatedClock(datetime.date(2023, 6, 5)))
+        tracker.add_habit('running', 'daily')
+        tracker.add_habit('reading', 'daily')
+        tracker.check_off_many([('reading', '2022-01-03'), ('reading', '2022-01-04')])
+
+        tracker.conn.execute('BEGIN IMMEDIATE')
+        tracker.check_off('running')
+        tracker.conn.execute("CREATE TEMP TRIGGER full_disk BEFORE {} BEGIN SELECT RAISE(ABORT, 'disk is full'); END"
+                             .format(event))
+        self.assertRaises(IntegrityError, write, tracker)
+        in_transaction = tracker.conn.in_transaction
+        tracker.conn.commit()
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table WHERE habit_id = 1').fetchone()[0]
+        tracker.conn.close()
+
+        self.assertTrue(in_transaction)
+        self.assertEqual(1, check_offs)
+
+    def test_failing_check_off_many_leaves_transaction_of_caller(self):
+        self.assert_failure_leaves_transaction_of_caller(
+            'INSERT ON check_off_table', lambda tracker: tracker.check_off_many([('reading', '2023-06-04')]))
+
+    def test_failing_recompute_streaks_leaves_transaction_of_caller(self):
+        self.assert_failure_leaves_transaction_of_caller(
+            'UPDATE ON habits_table', lambda tracker: tracker.recompute_streaks())
+
+    def test_failing_rebuild_stats_leaves_transaction_of_caller(self):
+        self.assert_failure_leaves_transaction_of_caller('INSERT ON habit_stats', lambda tracker: tracker.rebuild_stats())
+
+    def test_failing_delete_habits_leaves_transaction_of_caller(self):
+        self.assert_failure_leaves_transaction_of_caller(
+            'DELETE ON habits_table', lambda tracker: tracker.delete_habits(['reading']))
+
+    def test_failing_archive_leaves_transaction_of_caller(self):
+        self.assert_failure_leaves_transaction_of_caller(
+            'INSERT ON check_off_archive', lambda tracker: tracker.archive(30))
+
+    def test_failing_rebuild_bitmaps_leaves_transaction_of_caller(self):
+        self.assert_failure_leaves_transaction_of_caller(
+            'INSERT ON habit_bitmap', lambda tracker: tracker.rebuild_bitmaps())
+
+    def test_check_off_many_builds_streaks(self):
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
+        events = [(self.habit_name, '2023-06-03'), (self.habit_name, '2023-06-01'), (self.habit_name, '2023-06-05'),
+                  (self.habit_name, '2023-06-02'), (self.habit_name, '2023-06-05'), ('unknown habit', '2023-06-05')]
+
+        totals = tracker_instance.check_off_many(events, chunk_size=3)
+
+        dates = tracker_instance.conn.execute('SELECT date FROM check_off_table WHERE habit_id = ? ORDER BY date',
+                                              (habit_id,)).fetchall()
+        streaks = tracker_instance.conn.execute('SELECT current_streak, longest_streak FROM habits_table '
+                                                'WHERE habit_id = ?', (habit_id,)).fetchone()
+        # the second chunk starts with 2023-06-02, which is older than the last check-off
+        self.assertEqual({'checked': 3, 'skipped': 2, 'unknown': 1}, totals)
+        self.assertEqual([('2023-06-01',), ('2023-06-03',), ('2023-06-05',)], dates)
+        self.assertEqual((1, 1), streaks)
+
+    def test_check_off_many_continues_check_off_streak(self):
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
+        today = datetime.date.today()
+        tracker_instance.check_off(self.habit_name)
+        tracker_instance.conn.execute('UPDATE check_off_table SET date = ? WHERE habit_id = ?',
+                                      ((today - datetime.timedelta(weeks=1)).isoformat(), habit_id))
+
+        tracker_instance.check_off_many([(self.habit_name, today), (self.habit_name, today)])
+
+        streaks = tracker_instance.conn.execute('SELECT current_streak, longest_streak FROM habits_table '
+                                                'WHERE habit_id = ?', (habit_id,)).fetchone()
+        self.assertEqual((2, 2), streaks)
+
+    def test_recompute_streaks_from_history(self):
+        daily_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
+        weekly_id = tracker_instance.add_habit(generate_random_string(8), 'weekly').habit_id
+        idle_id = tracker_instance.add_habit(generate_random_string(8), 'daily').habit_id
+        tracker_instance.conn.execute('UPDATE habits_table SET current_streak = 7, longest_streak = 7')
+        tracker_instance.conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)', [
+            (daily_id, '2023-06-01'), (daily_id, '2023-06-02'), (daily_id, '2023-06-03'), (daily_id, '2023-06-05'),
+            (weekly_id, '2023-06-05'), (weekly_id, '2023-06-07'), (weekly_id, '2023-06-12'),
+        ])
+
+        recomputed = tracker_instance.recompute_streaks()
+
+        streaks = tracker_instance.conn.execute('SELECT habit_id, current_streak, longest_streak FROM habits_table '
+                                                'ORDER BY habit_id').fetchall()
+        self.assertEqual(3, recomputed)
+        self.assertEqual([(daily_id, 1, 3), (weekly_id, 2, 2), (idle_id, 0, 0)], streaks)
+
+    def test_recompute_streaks_of_selected_habits(self):
+        habit_id = tracker_instance.add_habit(self.habit_name, 'daily').habit_id
+        other_id = tracker_instance.add_habit(generate_random_string(8), 'daily').habit_id
+        tracker_instance.conn.execute('UPDATE habits_table SET current_streak = 7, longest_streak = 7')
+
+        tracker_instance.recompute_streaks(tracker_instance.get_habit_ids([self.habit_name]))
+
+        streaks = tracker_instance.conn.execute('SELECT habit_id, current_streak FROM habits_table '
+                                                'ORDER BY habit_id').fetchall()
+        self.assertEqual([(habit_id, 0), (other_id, 7)], streaks)
+
+    def test_check_off_uses_injected_clock(self):
+        dates = iter([datetime.date(2023, 6, 1), datetime.date(2023, 6, 2), datetime.date(2023, 6, 4)])
+        tracker = HabitTracker(':memory:', clock=lambda: next(dates))
+        habit_id = tracker.add_habit(self.habit_name, 'daily').habit_id
+
+        tracker.check_off(self.habit_name)
+        tracker.check_off(self.habit_name)
+        streak_after_two_days = tracker.conn.execute('SELECT current_streak FROM habits_table').fetchone()[0]
+        tracker.check_off(self.habit_name)
+
+        check_offs = tracker.conn.execute('SELECT date FROM check_off_table WHERE habit_id = ? ORDER BY date',
+                                          (habit_id,)).fetchall()
+        streaks = tracker.conn.execute('SELECT current_streak, longest_streak FROM habits_table').fetchone()
+        tracker.conn.close()
+        self.assertEqual(2, streak_after_two_days)
+        self.assertEqual([('2023-06-01',), ('2023-06-02',), ('2023-06-04',)], check_offs)
+        self.assertEqual((1, 2), streaks)
+
+    def test_period_keys(self):
+        self.assertEqual(0, day_key(datetime.date(1970, 1, 1)))
+        self.assertEqual(1, day_key(datetime.date(2024, 1, 1)) - day_key(datetime.date(2023, 12, 31)))
+        # ISO weeks run from Monday to Sunday, also across the end of the year
+        self.assertEqual(week_key(datetime.date(2023, 12, 25)), week_key(datetime.date(2023, 12, 31)))
+        self.assertEqual(1, week_key(datetime.date(2024, 1, 1)) - week_key(datetime.date(2023, 12, 31)))
+        self.assertEqual(1, week_key(datetime.date(2021, 1, 4)) - week_key(datetime.date(2020, 12, 31)))
+        self.assertEqual(week_key(datetime.date(2020, 12, 31)), week_key(datetime.date(2021, 1, 3)))
+
+    def test_period_keys_are_stored_and_follow_date(self):
+        habit_id = tracker_instance.add_habit(self.habit_name, 'weekly').habit_id
+        tracker_instance.conn.execute('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                      (habit_id, '2023-12-31'))
+        keys = tracker_instance.conn.execute('SELECT day_key, week_key FROM check_off_table').fetchone()
+        tracker_instance.conn.execute('UPDATE check_off_table SET date = ?', ('2024-01-01',))
+        updated_keys = tracker_instance.conn.execute('SELECT day_key, week_key FROM check_off_table').fetchone()
+
+        self.assertEqual((day_key(datetime.date(2023, 12, 31)), week_key(datetime.date(2023, 12, 31))), keys)
+        self.assertEqual((day_key(datetime.date(2024, 1, 1)), week_key(datetime.date(2024, 1, 1))), updated_keys)
+
+    def test_weekly_streak_continues_across_year_boundary(self):
+        for last_date, today in ((datetime.date(2023, 12, 27), datetime.date(2024, 1, 3)),
+                                 (datetime.date(2020, 12, 31), datetime.date(2021, 1, 7))):
+            with self.subTest(last_date=last_date):
+                tracker = HabitTracker(':memory:', clock=lambda: today)
+                habit_id = tracker.add_habit(self.habit_name, 'weekly').habit_id
+                tracker.conn.execute('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                                     (habit_id, last_date.isoformat()))
+                tracker.conn.execute('UPDATE habits_table SET current_streak = 1, longest_streak = 1')
+
+                on_streak = tracker.weekly_on_streak(habit_id)
+                tracker.check_off(self.habit_name)
+
+                streaks = tracker.conn.execute('SELECT current_streak, longest_streak FROM habits_table').fetchone()
+                tracker.conn.close()
+                self.assertTrue(on_streak)
+                self.assertEqual((2, 2), streaks)
+
+    def test_same_week_number_of_another_year_is_not_checked(self):
+        tracker = HabitTracker(':memory:', clock=lambda: datetime.date(2024, 1, 3))
+        habit_id = tracker.add_habit(self.habit_name, 'weekly').habit_id
+        # ISO week 1 of 2023
+        tracker.conn.execute('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)', (habit_id, '2023-01-04'))
+        tracker.conn.execute('UPDATE habits_table SET current_streak = 1, longest_streak = 1')
+
+        tracker.check_off(self.habit_name)
+
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        streaks = tracker.conn.execute('SELECT current_streak, longest_streak FROM habits_table').fetchone()
+        tracker.conn.close()
+        self.assertEqual(2, check_offs)
+        self.assertEqual((1, 1), streaks)
+
+    def test_migration_adds_period_keys_to_existing_check_offs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'old.db')
+            conn = sqlite3.connect(db_path)
+            conn.execute(OLD_HABITS_TABLE)
+            conn.execute("INSERT INTO habits_table (habit_id, name, periodicity) VALUES (1, 'run', 'daily')")
+            conn.execute('CREATE TABLE check_off_table (id INTEGER PRIMARY KEY, habit_id INT, date DATE)')
+            conn.executemany('INSERT INTO check_off_table (habit_id, date) VALUES (?, ?)',
+                             [(1, '2023-12-31'), (1, '2024-01-01')])
+            conn.commit()
+            conn.close()
+
+            tracker = HabitTracker(db_path)
+            keys = tracker.conn.execute('SELECT day_key, week_key FROM check_off_table ORDER BY date').fetchall()
+            tracker.conn.close()
+
+        self.assertEqual([(19722, 2817), (19723, 2818)], keys)
+
+    def test_cached_check_off_skips_habit_lookup(self):
+        dates = iter([datetime.date(2023, 6, 1), datetime.date(2023, 6, 2), datetime.date(2023, 6, 2)])
+        tracker = HabitTracker(':memory:', count_statements=True, clock=lambda: next(dates), cache_size=10)
+        tracker.add_habit(self.habit_name, 'daily')
+
+        tracker.check_off(self.habit_name)
+        tracker.check_off(self.habit_name)
+        cached_stats = tracker.last_check_off_stats
+        tracker.check_off(self.habit_name)
+
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        streaks = tracker.conn.execute('SELECT current_streak, longest_streak FROM habits_table').fetchone()
+        tracker.conn.close()
+        # BEGIN IMMEDIATE, UPDATE ... RETURNING, INSERT, the statistics and bitset upserts and COMMIT
+        self.assertEqual({'statements': 6, 'commits': 1}, cached_stats)
+        self.assertEqual(2, check_offs)
+        self.assertEqual((2, 2), streaks)
+        self.assertEqual({'hits': 2, 'misses': 1, 'size': 1, 'max_size': 10}, tracker.cache_info())
+
+    def test_habit_cache_is_invalidated_by_changes(self):
+        tracker = HabitTracker(':memory:', cache_size=10)
+        tracker.add_habit(self.habit_name, 'daily')
+        tracker.check_off(self.habit_name)
+        new_name = generate_random_string(8)
+
+        tracker.change_name(self.habit_name, new_name)
+        tracker.check_off(self.habit_name)
+        tracker.change_periodicity(new_name, 'weekly')
+        tracker.check_off(new_name)
+        periodicity_cached = tracker.habit_cache.entries[new_name][1]
+        tracker.delete_habit(new_name)
+        tracker.check_off(new_name)
+
+        check_offs = tracker.conn.execute('SELECT COUNT(*) FROM check_off_table').fetchone()[0]
+        tracker.conn.close()
+        self.assertEqual('weekly', periodicity_cached)
+        # the check-off of the deleted habit is deleted with it, and the cached habit is not checked-off again
+        self.assertEqual(0, check_offs)
+        self.assertNotIn(new_name, tracker.habit_cache.entries)
+
+    def test_habit_cache_evicts_least_recently_used(self):
+        tracker = HabitTracker(':memory:', cache_size=2)
+        names = [generate_random_string(8) for _ in range(3)]
+        for name in names:
+            tracker.add_habit(name, 'daily')
+
+        tracker.check_off(names[0])
+        tracker.check_off(names[1])
+        tracker.get_longest_streak_by_name(names[0])
+        tracker.check_off(names[2])
+        tracker.conn.close()
+
+        self.assertEqual([names[0], names[2]], list(tracker.habit_cache.entries))
+
+    def test_habit_changes_return_results(self):
+        tracker = HabitTracker(':memory:')
+        new_name = generate_random_string(8)
+
+        added = tracker.add_habit(self.habit_name, 'daily')
+        duplicate = tracker.add_habit(self.habit_name, 'weekly')
+        renamed = tracker.change_name(self.habit_name, new_name)
+        changed = tracker.change_periodicity(new_name, 'weekly')
+        missing = tracker.change_periodicity(self.habit_name, 'weekly')
+        deleted = tracker.delete_habit(new_name)
+        tracker.conn.close()
+
+        self.assertEqual(HabitResult(Status.ADDED, self.habit_name, 1, 'daily'), added)
+        self.assertEqual(HabitResult(Status.DUPLICATE, self.habit_name), duplicate)
+        self.assertEqual(HabitResult(Status.RENAMED, new_name, 1, previous=self.habit_name), renamed)
+        self.assertEqual(HabitResult(Status.PERIODICITY_CHANGED, new_name, 1, 'weekly', 'daily'), changed)
+        self.assertEqual(HabitResult(Status.NOT_FOUND, self.habit_name), missing)
+        self.assertEqual(HabitResult(Status.DELETED, new_name, 1), deleted)
+
+    def test_check_offs_return_results(self):
+        clock = SimulatedClock(datetime.date(2023, 6, 1))
+        tracker = HabitTracker(':memory:', clock=clock)
+        habit_id = tracker.add_habit(self.habit_name, 'daily').habit_id
+
+        first = tracker.check_off(self.habit_name)
+        clock.advance()
+        on_streak = tracker.check_off(self.habit_name)
+        already_checked = tracker.check_off(self.habit_name)
+        clock.advance(days=2)
+        broken = tracker.check_off(self.habit_name)
+        tracker.conn.close()
+
+        self.assertEqual(CheckOffResult(Status.ON_STREAK, self.habit_name, habit_id, 1, 1), first)
+        self.assertEqual(CheckOffResult(Status.ON_STREAK, self.habit_name, habit_id, 2, 2), on_streak)
+        self.assertEqual(CheckOffResult(Status.ALREADY_CHECKED, self.habit_name, habit_id, 2, 2), already_checked)
+        self.assertEqual(CheckOffResult(Status.STREAK_BROKEN, self.habit_name, habit_id, 1, 2), broken)
+        self.assertFalse(already_checked.checked_off)
+        self.assertTrue(broken.checked_off)
+
+    def test_tracker_bound_to_user_sees_only_its_habits(self):
+        tracker = HabitTracker(':memory:', user_id=None)
+        tracker.add_habit('legacy', 'daily')
+        alice, bob = tracker.for_user('alice'), tracker.for_user('bob')
+        alice.add_habit('run', 'daily')
+        alice.add_habit('swim', 'weekly')
+        bob.add_habit('read', 'daily')
+        alice.check_off('run')
+
+        self.assertEqual(['run', 'swim'], [habit[0] for habit in alice.get_all_habits()])
+        self.assertEqual(['read'], [habit[0] for habit in bob.get_all_by_periodicity('daily')])
+        self.assertEqual(4, len(tracker.get_all_habits()))
+        self.assertEqual(Status.NOT_FOUND, bob.check_off('run').status)
+        self.assertEqual(Status.NOT_FOUND, bob.delete_habit('swim').status)
+        self.assertIsNone(bob.get_longest_streak_by_name('run'))
+        self.assertIsNone(bob.get_stats('run'))
+        self.assertEqual([], bob.get_habit_ids(['run', 'swim']))
+        self.assertEqual([(1, 'run')], alice.get_longest_streak())
+        self.assertEqual([(0, 'read')], bob.get_current_longest_streak())
+        self.assertEqual(['run', 'swim'], [habit[1] for habit in alice.top_streaks(5, 'longest')])
+        self.assertEqual(['swim'], [habit[1] for habit in alice.iter_habits('weekly')])
+        self.assertEqual(2, alice.recompute_streaks())
+        self.assertEqual(['legacy'], [habit[0] for habit in tracker.for_user('').get_all_habits()])
+        tracker.conn.close()
+
 
 if __name__ == '__main__':
     unittest.main()
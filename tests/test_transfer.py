@@ -0,0 +1,171 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src import transfer
+from src.simulation import SimulatedClock, simulate
+from src.tracker import HabitTracker
+
+TABLE_QUERIES = (
+    'SELECT * FROM habits_table ORDER BY habit_id',
+    'SELECT habit_id, date, day_key, week_key FROM check_off_table '
+    'WHERE habit_id IN (SELECT habit_id FROM habits_table) ORDER BY habit_id, date',
+    'SELECT * FROM habit_stats ORDER BY habit_id',
+)
+INDEXES_QUERY = "SELECT name, sql FROM sqlite_master WHERE type = 'index' ORDER BY name"
+
+
+class TestTransfer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        clock = SimulatedClock(datetime.date(2022, 12, 1))
+        self.tracker = HabitTracker(':memory:', clock=clock)
+        simulate(self.tracker, clock, habits=20, days=60, completion=0.7)
+        self.tracker.add_habit('unicode ✓, "quoted"', 'daily')
+        self.tracker.delete_habit('habit-3')
+        self.target = HabitTracker(':memory:')
+
+    def tearDown(self) -> None:
+        self.tracker.conn.close()
+        self.target.conn.close()
+        self.directory.cleanup()
+
+    def tables(self, tracker):
+        return [tracker.conn.execute(query).fetchall() for query in TABLE_QUERIES]
+
+    def test_round_trip(self):
+        expected_check_offs = self.tracker.conn.execute('SELECT COUNT(*) FROM check_off_table '
+                                                        'WHERE habit_id IN (SELECT habit_id FROM habits_table)')
+        expected_counts = {'habits': 20, 'check_offs': expected_check_offs.fetchone()[0]}
+        for file_format, name in (('binary', 'habits.bin'), ('csv', 'habits')):
+            with self.subTest(file_format=file_format):
+                path = os.path.join(self.directory.name, name)
+                target = HabitTracker(':memory:')
+
+                exported = transfer.export_history(self.tracker, path, file_format)
+                imported = transfer.import_history(target, path, file_format)
+
+                self.assertEqual(expected_counts, exported)
+                self.assertEqual(expected_counts, imported)
+                self.assertEqual(self.tables(self.tracker), self.tables(target))
+                self.assertEqual(self.tracker.conn.execute(INDEXES_QUERY).fetchall(),
+                                 target.conn.execute(INDEXES_QUERY).fetchall())
+                target.conn.close()
+
+    def test_non_ascii_strings_round_trip(self):
+        # the strings after a non-ASCII one sit at other offsets in bytes than in characters
+        names = ['läufer', 'running', 'чтение', '読書 ✓', 'reading']
+        tracker = HabitTracker(':memory:', user_id='jürgen')
+        for name in names:
+            tracker.add_habit(name, 'daily')
+        path = os.path.join(self.directory.name, 'habits.bin')
+
+        transfer.export_history(tracker, path)
+        transfer.import_history(self.target, path)
+        tracker.conn.close()
+
+        self.assertEqual([(name, 'jürgen') for name in names],
+                         self.target.conn.execute('SELECT name, user_id FROM habits_table ORDER BY habit_id').fetchall())
+
+    def test_archived_check_offs_are_exported(self):
+        expected = self.tables(self.tracker)
+        self.tracker.archive(20)
+        for file_format, name in (('binary', 'habits.bin'), ('csv', 'habits')):
+            with self.subTest(file_format=file_format):
+                path = os.path.join(self.directory.name, name)
+                target = HabitTracker(':memory:')
+
+                transfer.export_history(self.tracker, path, file_format)
+                transfer.import_history(target, path, file_format)
+
+                self.assertEqual(expected, self.tables(target))
+                target.conn.close()
+
+    def test_imported_stats_and_bitsets_match_rebuilt_ones(self):
+        # the day key of 2022-12-01 is the highest bit of its word, stored as a negative number
+        self.tracker.add_habit('night', 'daily')
+        self.tracker.check_off_many([('night', '2022-12-01')])
+        queries = ('SELECT * FROM habit_stats ORDER BY habit_id',
+                   'SELECT habit_id, word, bits FROM habit_bitmap ORDER BY habit_id, word')
+        for file_format, name in (('binary', 'habits.bin'), ('csv', 'habits')):
+            with self.subTest(file_format=file_format):
+                path = os.path.join(self.directory.name, name)
+                target = HabitTracker(':memory:')
+
+                transfer.export_history(self.tracker, path, file_format)
+                transfer.import_history(target, path, file_format)
+                imported = [target.conn.execute(query).fetchall() for query in queries]
+                target.rebuild_stats()
+                target.rebuild_bitmaps()
+
+                self.assertIn(-(1 << 63), [bits for _, _, bits in imported[1]])
+                self.assertEqual([target.conn.execute(query).fetchall() for query in queries], imported)
+                target.conn.close()
+
+    def test_users_are_kept(self):
+        self.tracker.for_user('alice').add_habit('habit-1', 'weekly')
+        for file_format, name in (('binary', 'habits.bin'), ('csv', 'habits')):
+            with self.subTest(file_format=file_format):
+                path = os.path.join(self.directory.name, name)
+                target = HabitTracker(':memory:')
+
+                transfer.export_history(self.tracker, path, file_format)
+                transfer.import_history(target, path, file_format)
+
+                self.assertEqual(self.tables(self.tracker), self.tables(target))
+                self.assertEqual([('habit-1', 'weekly')],
+                                 [habit[:2] for habit in target.for_user('alice').get_all_habits()])
+                target.conn.close()
+
+    def test_import_of_export_without_users(self):
+        path = os.path.join(self.directory.name, 'habits.bin')
+        with open(path, 'wb') as stream:
+            stream.write(transfer.VERSION_1_MAGIC)
+            stream.write(transfer.BLOCK_HEADER.pack(transfer.HABITS_BLOCK, 1))
+            for typecode, values in (('q', [7]), ('b', [1]), ('i', [2]), ('i', [3])):
+                stream.write(transfer._column(typecode, values))
+            stream.write(transfer._strings(['swim']) + transfer._strings(['2023-01-01']))
+            stream.write(transfer.BLOCK_HEADER.pack(transfer.END_BLOCK, 0))
+
+        transfer.import_history(self.target, path)
+
+        self.assertEqual([(7, 'swim', 'weekly', '2023-01-01', 2, 3, '')],
+                         self.target.conn.execute('SELECT * FROM habits_table').fetchall())
+
+    def test_import_into_database_with_habits(self):
+        path = os.path.join(self.directory.name, 'habits.bin')
+        transfer.export_history(self.tracker, path)
+        self.target.add_habit('running', 'daily')
+
+        with self.assertRaises(ValueError):
+            transfer.import_history(self.target, path)
+        self.assertEqual([(1, 'running')], self.target.conn.execute('SELECT habit_id, name FROM habits_table')
+                         .fetchall())
+        self.assertEqual(self.tracker.conn.execute(INDEXES_QUERY).fetchall(),
+                         self.target.conn.execute(INDEXES_QUERY).fetchall())
+
+        transfer.import_history(self.target, path, replace=True)
+        self.assertEqual(self.tables(self.tracker), self.tables(self.target))
+
+    def test_import_of_other_file(self):
+        path = os.path.join(self.directory.name, 'habits.bin')
+        with open(path, 'wb') as stream:
+            stream.write(b'name,date\n')
+
+        with self.assertRaises(ValueError):
+            transfer.import_history(self.target, path)
+
+    def test_blocks(self):
+        path = os.path.join(self.directory.name, 'habits.bin')
+        transfer.export_binary(self.tracker.conn, path, block_size=7)
+
+        kinds = [kind for kind, _ in transfer.read_binary(path)]
+
+        self.assertEqual(['habits'] * 3, kinds[:3])
+        self.assertEqual({'check_offs'}, set(kinds[3:]))
+
+
+if __name__ == '__main__':
+    unittest.main()